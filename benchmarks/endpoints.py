@@ -0,0 +1,379 @@
+"""
+Load-test every route of cdt.urls and tenants.urls against a seeded local database.
+
+    python benchmarks/endpoints.py seed [--users 1000000] [--tenants 100000]
+    python benchmarks/endpoints.py run [--requests 200] [--concurrency 8]
+                                       [--routes user-list ...] [--output results.json]
+                                       [--baseline baseline.json] [--tolerance 0.25]
+
+Uses benchmarks/settings.py: a SQLite file by default, the local Postgres of
+config.settings with BENCHMARK_DATABASE=postgres. SQLite has a single writer
+and fails transactions that read before writing while another one writes
+("database is locked"), so concurrent write routes show errors there.
+
+``seed`` migrates the database and tops it up to the requested number of
+users (each with Preferencias) and tenants with the seed_data command,
+preferences spread over languages and flags so segment queries have
+something to select. It can be run again to grow the data.
+
+``run`` sends ``--requests`` requests per route and method from
+``--concurrency`` threads, each with its own test Client and connection, and
+prints JSON: per route the throughput, p50/p95/p99 latency, SQL queries per
+request (from the X-Query-Count header) and status codes, plus the peak RSS
+of the process. With ``--baseline`` (the JSON of an earlier run) it exits
+with status 1 when a route got slower or lower throughput by more than
+``--tolerance``, or runs more queries than before.
+"""
+import argparse
+import datetime
+import itertools
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import sys
+import threading
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.core.files.uploadedfile import SimpleUploadedFile  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import connection, connections  # noqa: E402
+from django.db.models import Max, Min  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.test.client import MULTIPART_CONTENT  # noqa: E402
+from django.urls import URLPattern  # noqa: E402
+from rest_framework.permissions import AllowAny  # noqa: E402
+
+from cdt import bitmaps  # noqa: E402
+from cdt import urls as cdt_urls  # noqa: E402
+from cdt.models import Preferencias  # noqa: E402
+from tenants import urls as tenants_urls  # noqa: E402
+from tenants.models import Tenant  # noqa: E402
+
+IDIOMAS = ('es', 'en', 'pt', 'fr')
+# Rows per file sent to the import routes
+IMPORT_ROWS = 100
+HTTP_METHODS = ('get', 'post', 'put', 'patch', 'delete')
+ADMIN_USERNAME = 'benchmark_admin'
+
+
+# Seeding
+
+def seed(args):
+    call_command('migrate', verbosity=0)
+    started = time.perf_counter()
+    User.objects.update_or_create(
+        username=ADMIN_USERNAME, defaults={'is_staff': True, 'email': 'admin@benchmark.local'}
+    )
+    call_command(
+        'seed_data', '--spread',
+        users=max(args.users - User.objects.filter(username__startswith='user_').count(), 0),
+        tenants=max(args.tenants - Tenant.objects.count(), 0),
+        verbosity=2 if args.verbose else 0,
+        stdout=sys.stderr if args.verbose else open(os.devnull, 'w'),
+    )
+    print(json.dumps({
+        'users': User.objects.filter(username__startswith='user_').count(),
+        'preferencias': Preferencias.objects.count(),
+        'tenants': Tenant.objects.count(),
+        'seconds': round(time.perf_counter() - started, 1),
+    }, indent=2))
+
+
+# Scenarios: (route name, method) -> function(ctx) returning (path, data),
+# or (path, data, content_type) for uploads
+
+class Context:
+    """
+    What scenarios pick their targets from: the id ranges of the seeded rows
+    and a counter for unique names.
+    """
+
+    def __init__(self):
+        users = Preferencias.objects.aggregate(low=Min('user_id'), high=Max('user_id'))
+        tenants = Tenant.objects.aggregate(low=Min('id'), high=Max('id'))
+        if users['high'] is None or tenants['high'] is None:
+            raise SystemExit('The database is empty, run "benchmarks/endpoints.py seed" first.')
+        self.users = (users['low'], users['high'])
+        self.tenants = (tenants['low'], tenants['high'])
+        self.run = uuid.uuid4().hex[:8]
+        self._counter = itertools.count()
+
+    def user_id(self):
+        return random.randint(*self.users)
+
+    def user_ids(self, count):
+        low, high = self.users
+        return random.sample(range(low, high + 1), min(count, high - low + 1))
+
+    def tenant_id(self):
+        return random.randint(*self.tenants)
+
+    def unique(self, prefix):
+        return f'{prefix}_{self.run}_{next(self._counter)}'
+
+
+def new_user_without_preferencias(ctx):
+    username = ctx.unique('bench')
+    return User.objects.create(username=username, email=f'{username}@example.com', password='!').pk
+
+
+def csv_upload(name, header, rows):
+    text = header + '\n' + ''.join(','.join(map(str, row)) + '\n' for row in rows)
+    return {'file': SimpleUploadedFile(name, text.encode())}
+
+
+def segment_query(ctx):
+    return f'?idioma={random.choice(IDIOMAS)}&tema_oscuro={random.choice(["true", "false"])}'
+
+
+SCENARIOS = {
+    ('user-list', 'get'): lambda ctx: ('/api/users/?page_size=50', None),
+    ('user-list', 'post'): lambda ctx: ('/api/users/', {
+        'username': (name := ctx.unique('bench')), 'email': f'{name}@example.com',
+        'first_name': 'Bench', 'last_name': 'Mark',
+    }),
+    ('user-detail', 'get'): lambda ctx: (f'/api/users/{ctx.user_id()}/', None),
+    ('user-detail', 'put'): lambda ctx: (
+        f'/api/users/{ctx.user_id()}/', {'first_name': random.choice(['Ana', 'Beto', 'Carla'])}
+    ),
+    ('user-import', 'post'): lambda ctx: ('/api/users/import/', csv_upload(
+        'users.csv', 'username,email,first_name',
+        [(name := ctx.unique('import'), f'{name}@example.com', 'Bench') for _ in range(IMPORT_ROWS)],
+    ), MULTIPART_CONTENT),
+    ('preferencias', 'get'): lambda ctx: (f'/api/preferencias/?user_id={ctx.user_id()}', None),
+    ('preferencias', 'post'): lambda ctx: (
+        '/api/preferencias/', {'user_id': new_user_without_preferencias(ctx), 'idioma': 'en'}
+    ),
+    ('preferencias-bulk', 'post'): lambda ctx: ('/api/preferencias/bulk/', [
+        {'user_id': ctx.user_id(), 'idioma': random.choice(IDIOMAS)} for _ in range(100)
+    ]),
+    ('preferencias-import', 'post'): lambda ctx: ('/api/preferencias/import/', csv_upload(
+        'preferencias.csv', 'user_id,idioma',
+        [(user_id, random.choice(IDIOMAS)) for user_id in ctx.user_ids(IMPORT_ROWS)],
+    ), MULTIPART_CONTENT),
+    ('preferencias-segment-count', 'get'): lambda ctx: (
+        f'/api/preferencias/segments/count/{segment_query(ctx)}', None
+    ),
+    ('preferencias-aggregates', 'get'): lambda ctx: (
+        f'/api/preferencias/aggregates/{segment_query(ctx)}', None
+    ),
+    ('preferencias-detail', 'get'): lambda ctx: (f'/api/preferencias/{ctx.user_id()}/', None),
+    ('preferencias-detail', 'put'): lambda ctx: (
+        f'/api/preferencias/{ctx.user_id()}/', {'tema_oscuro': random.choice([True, False])}
+    ),
+    ('nisman', 'post'): lambda ctx: ('/api/nisman/', {'username': ctx.unique('nisman')}),
+    ('nisman-batch', 'post'): lambda ctx: (
+        '/api/nisman/batch/', {'usernames': [ctx.unique('batch') for _ in range(10)]}
+    ),
+    ('tenants:user-list', 'get'): lambda ctx: ('/api/tenants/?page_size=50', None),
+    ('tenants:user-list', 'post'): lambda ctx: ('/api/tenants/', {
+        'name': (name := ctx.unique('bench')), 'schema_name': name,
+        'domain': f'{name.replace("_", "-")}.example.com',
+    }),
+    ('tenants:tenant-search', 'get'): lambda ctx: (
+        f'/api/tenants/search/?q=tenant{ctx.tenant_id()}', None
+    ),
+    ('tenants:tenant-import', 'post'): lambda ctx: ('/api/tenants/import/', csv_upload(
+        'tenants.csv', 'name,schema_name,domain',
+        [(name := ctx.unique('import'), name, f'{name.replace("_", "-")}.example.com')
+         for _ in range(IMPORT_ROWS)],
+    ), MULTIPART_CONTENT),
+    ('tenants:tenant-detail', 'get'): lambda ctx: (f'/api/tenants/{ctx.tenant_id()}/', None),
+    ('tenants:tenant-detail', 'put'): lambda ctx: (
+        f'/api/tenants/{ctx.tenant_id()}/', {'is_active': random.choice([True, False])}
+    ),
+    ('tenants:tenant-provisioning', 'get'): lambda ctx: (
+        f'/api/tenants/{ctx.tenant_id()}/provisioning/', None
+    ),
+    ('tenants:nisman', 'post'): lambda ctx: ('/api/tenants/nisman/', {'username': ctx.unique('nisman')}),
+}
+
+
+def routes():
+    """
+    Every (route name, method) served by cdt.urls and tenants.urls, mapped to
+    whether the view needs a logged in user.
+    """
+    found = {}
+    for module, namespace in ((cdt_urls, ''), (tenants_urls, 'tenants:')):
+        for pattern in module.urlpatterns:
+            if not isinstance(pattern, URLPattern):
+                continue
+            view = pattern.callback.view_class
+            login = any(permission is not AllowAny for permission in view.permission_classes)
+            for method in HTTP_METHODS:
+                if hasattr(view, method):
+                    found[namespace + pattern.name, method] = login
+    return found
+
+
+# Running
+
+def percentile(latencies, p):
+    if len(latencies) == 1:
+        return latencies[0]
+    return statistics.quantiles(latencies, n=100, method='inclusive')[p - 1]
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def client(login):
+    browser = Client(raise_request_exception=False)
+    if login:
+        # Staff, so admin-only routes and tenant updates are served
+        browser.force_login(User.objects.get(username=ADMIN_USERNAME))
+    return browser
+
+
+def bench(route, method, login, ctx, requests, concurrency):
+    scenario = SCENARIOS[route, method]
+    remaining = itertools.count()
+    samples, lock = [], threading.Lock()
+
+    def worker():
+        browser = client(login)
+        try:
+            while next(remaining) < requests:
+                path, data, *content_type = scenario(ctx)
+                content_type = content_type[0] if content_type else 'application/json'
+                send = getattr(browser, method)
+                start = time.perf_counter()
+                response = send(path, data, content_type=content_type) if data is not None else send(path)
+                elapsed = time.perf_counter() - start
+                with lock:
+                    samples.append((elapsed, response.status_code, int(response.get('X-Query-Count', 0))))
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    latencies = sorted(elapsed for elapsed, _, _ in samples)
+    queries = [count for _, _, count in samples]
+    statuses = {}
+    for _, code, _ in samples:
+        statuses[str(code)] = statuses.get(str(code), 0) + 1
+    return {
+        'requests': len(samples),
+        'throughput_rps': round(len(samples) / wall, 1),
+        'latency_ms': {
+            f'p{p}': round(percentile(latencies, p) * 1000, 2) for p in (50, 95, 99)
+        },
+        'queries': {'mean': round(statistics.fmean(queries), 2), 'max': max(queries)},
+        'status': statuses,
+        # Every scenario is meant to succeed
+        'errors': sum(count for code, count in statuses.items() if int(code) >= 400),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def regressions(results, baseline, tolerance):
+    found = []
+    for key, result in results['routes'].items():
+        before = baseline['routes'].get(key)
+        if before is None:
+            continue
+        if result['latency_ms']['p95'] > before['latency_ms']['p95'] * (1 + tolerance):
+            found.append(f"{key}: p95 {before['latency_ms']['p95']}ms -> {result['latency_ms']['p95']}ms")
+        if result['throughput_rps'] < before['throughput_rps'] * (1 - tolerance):
+            found.append(f"{key}: throughput {before['throughput_rps']} -> {result['throughput_rps']} req/s")
+        if result['queries']['max'] > before['queries']['max']:
+            found.append(f"{key}: queries {before['queries']['max']} -> {result['queries']['max']}")
+        if result['errors'] > before['errors']:
+            found.append(f"{key}: errors {before['errors']} -> {result['errors']}")
+    return found
+
+
+def run(args):
+    missing = [route for route in routes() if route not in SCENARIOS]
+    if missing:
+        raise SystemExit(f'No scenario for {", ".join(f"{name} {method.upper()}" for name, method in missing)}')
+    selected = {
+        route: login for route, login in routes().items() if not args.routes or route[0] in args.routes
+    }
+
+    ctx = Context()
+    # Like config.wsgi, before serving requests
+    bitmaps.warm_up()
+    results = {
+        'meta': {
+            'date': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'users': ctx.users[1] - ctx.users[0] + 1,
+            'tenants': ctx.tenants[1] - ctx.tenants[0] + 1,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+        },
+        'routes': {},
+    }
+    for (route, method), login in selected.items():
+        key = f'{route} {method.upper()}'
+        if args.verbose:
+            print(f'{key}...', file=sys.stderr)
+        results['routes'][key] = bench(route, method, login, ctx, args.requests, args.concurrency)
+    results['peak_rss_mb'] = peak_rss_mb()
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(output + '\n')
+    print(output)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            found = regressions(results, json.load(file), args.tolerance)
+        for regression in found:
+            print(f'REGRESSION {regression}', file=sys.stderr)
+        if found:
+            raise SystemExit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('-v', '--verbose', action='store_true', help='Report progress on stderr.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    seeding = commands.add_parser('seed', help='Migrate and seed the benchmark database.')
+    seeding.add_argument('--users', type=int, default=1_000_000)
+    seeding.add_argument('--tenants', type=int, default=100_000)
+    seeding.set_defaults(handler=seed)
+
+    running = commands.add_parser('run', help='Benchmark the routes and print JSON results.')
+    running.add_argument('--requests', type=int, default=200, help='Requests per route and method.')
+    running.add_argument('--concurrency', type=int, default=8, help='Concurrent clients.')
+    running.add_argument('--routes', nargs='+', help='URL names to run, e.g. user-detail tenants:user-list.')
+    running.add_argument('--output', help='Also write the JSON results to this file.')
+    running.add_argument('--baseline', help='JSON results of an earlier run to compare with.')
+    running.add_argument('--tolerance', type=float, default=0.25,
+                         help='Allowed slowdown of p95 latency and throughput, as a fraction.')
+    running.set_defaults(handler=run)
+
+    args = parser.parse_args()
+    args.handler(args)
+
+
+if __name__ == '__main__':
+    main()
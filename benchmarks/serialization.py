@@ -0,0 +1,100 @@
+"""
+Compare the list endpoints' serializers with the ValuesSerializer fast path.
+
+    python benchmarks/serialization.py [--rows 10000 100000] [--repeat 5]
+
+For each size, users and tenants are rendered both ways from in-memory rows
+(model instances for the serializers, ``.values()``-shaped dicts for the fast
+path), so the timings cover serialization and JSON encoding only; skipping
+model instantiation on fetch saves more on top. The outputs are checked to be
+byte for byte equal before timing.
+"""
+import argparse
+import datetime
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth.models import User  # noqa: E402
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+
+from cdt.serializers import UserSerializer  # noqa: E402
+from config.renderers import FastJSONRenderer, orjson  # noqa: E402
+from config.serialization import ValuesSerializer  # noqa: E402
+from tenants.models import Tenant  # noqa: E402
+from tenants.serializers import TenantSerializer  # noqa: E402
+
+
+def users(count):
+    return [
+        User(
+            id=i, username=f'user{i}', email=f'user{i}@example.com',
+            first_name='Usuário', last_name=f'Número {i}',
+        )
+        for i in range(1, count + 1)
+    ]
+
+
+def tenants(count):
+    start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    return [
+        Tenant(
+            id=i, name=f'Tenant {i}', schema_name=f'tenant_{i}', domain=f'tenant{i}.example.com',
+            is_active=bool(i % 2), created_at=start + datetime.timedelta(seconds=i),
+            updated_at=start + datetime.timedelta(seconds=i, microseconds=i % 1000000),
+        )
+        for i in range(1, count + 1)
+    ]
+
+
+def as_values(instances, fields):
+    return [{name: getattr(instance, name) for name in fields} for instance in instances]
+
+
+def best_of(repeat, func):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def compare(name, serializer_class, instances, repeat):
+    fast = ValuesSerializer(serializer_class())
+    rows = as_values(instances, fast.fields)
+
+    def serializer_path():
+        return JSONRenderer().render(serializer_class(instances, many=True).data)
+
+    def fast_path():
+        return FastJSONRenderer().render(fast.to_representation(rows))
+
+    if serializer_path() != fast_path():
+        raise SystemExit(f'{name}: the fast path output differs from {serializer_class.__name__}')
+    slow, quick = best_of(repeat, serializer_path), best_of(repeat, fast_path)
+    print(f'{name:<8} {len(instances):>8} {slow * 1000:>12.1f} {quick * 1000:>12.1f} {slow / quick:>8.1f}x')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f'encoder: {"orjson " + orjson.__version__ if orjson else "json (orjson not installed)"}')
+    print(f'{"endpoint":<8} {"rows":>8} {"serializer":>12} {"fast path":>12} {"speedup":>9}')
+    for count in args.rows:
+        compare('users', UserSerializer, users(count), args.repeat)
+        compare('tenants', TenantSerializer, tenants(count), args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Settings for the endpoint benchmarks (benchmarks/endpoints.py).
+
+config.settings on a local database, without DEBUG (which keeps every query
+in memory) and with the query count headers on, so each response reports
+the queries it ran.
+
+BENCHMARK_DATABASE=sqlite (the default) uses the SQLite file
+BENCHMARK_SQLITE_PATH; BENCHMARK_DATABASE=postgres keeps the local Postgres
+of config.settings. The cache is in-process unless BENCHMARK_CACHE=redis.
+
+BENCHMARK_REPLICA=1 adds a 'replica' database for config.replicas: a second,
+read-only connection to the same SQLite file, or to the same Postgres
+database. It has no lag, but shows which requests read from the replica and
+which stick to the primary.
+"""
+import os
+from pathlib import Path
+
+from config.settings import *  # noqa: F401,F403
+
+DEBUG = False
+ALLOWED_HOSTS = ['*']
+
+QUERY_BUDGET_HEADERS = True
+QUERY_BUDGET_ENFORCE = False
+
+if os.environ.get('BENCHMARK_DATABASE', 'sqlite') == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get(
+                'BENCHMARK_SQLITE_PATH', str(Path(__file__).resolve().parent / 'benchmark.sqlite3')
+            ),
+            # Concurrent clients queue up behind SQLite's single writer
+            'OPTIONS': {'timeout': 60},
+        }
+    }
+
+if os.environ.get('BENCHMARK_REPLICA'):
+    DATABASES['replica'] = dict(DATABASES['default'])
+    if DATABASES['replica']['ENGINE'] == 'django.db.backends.sqlite3':
+        DATABASES['replica']['NAME'] = Path(DATABASES['replica']['NAME']).resolve().as_uri() + '?mode=ro'
+    else:
+        DATABASES['replica']['OPTIONS'] = {'options': '-c default_transaction_read_only=on'}
+    DATABASE_REPLICAS = ['replica']
+
+if os.environ.get('BENCHMARK_CACHE', 'locmem') != 'redis':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': 2_000_000},
+        }
+    }
+
+# Over-budget requests show in the results as query counts; keep the output readable
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'loggers': {'config.middlewares': {'level': 'ERROR'}},
+}
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Preferencias
+from .models import FanoutCheckpoint, Preferencias, PreferenciasAggregate
 
 @admin.register(Preferencias)
 class PreferenciasAdmin(admin.ModelAdmin):
@@ -19,3 +19,21 @@ class PreferenciasAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
     )
+
+
+@admin.register(PreferenciasAggregate)
+class PreferenciasAggregateAdmin(admin.ModelAdmin):
+    list_display = ('idioma', 'tema_oscuro', 'notificaciones_email', 'notificaciones_push', 'total')
+    list_filter = ('idioma', 'tema_oscuro', 'notificaciones_email', 'notificaciones_push')
+    readonly_fields = ('idioma', 'tema_oscuro', 'notificaciones_email', 'notificaciones_push', 'total')
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(FanoutCheckpoint)
+class FanoutCheckpointAdmin(admin.ModelAdmin):
+    list_display = ('campaign', 'topic', 'status', 'published', 'last_user_id', 'updated_at')
+    list_filter = ('status',)
+    search_fields = ('campaign',)
+    readonly_fields = ('last_user_id', 'published', 'error', 'created_at', 'updated_at')
@@ -0,0 +1,143 @@
+"""
+Incremental maintenance of PreferenciasAggregate.
+
+The aggregate table holds one row per (idioma, tema_oscuro,
+notificaciones_email, notificaciones_push) combination with the number of
+Preferencias in it, so dashboard counts read a handful of rows instead of
+grouping the whole table. Every write path adjusts the totals by the
+difference between the groups of the affected rows before and after it:
+save/delete signals for single objects, and PreferenciasQuerySet.update /
+bulk_create for bulk writes. ``rebuild`` recomputes it from scratch.
+"""
+from collections import Counter
+
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, transaction
+from django.db.models import Count, F, Sum
+
+GROUP_FIELDS = ('idioma', 'tema_oscuro', 'notificaciones_email', 'notificaciones_push')
+
+# Keeps IN (...) lists under SQLite's bound parameter limit
+CHUNK_SIZE = 1000
+
+
+def group_of(instance):
+    return tuple(getattr(instance, field) for field in GROUP_FIELDS)
+
+
+def group_counts(queryset):
+    """
+    Counter of group -> number of rows of ``queryset``.
+    """
+    rows = queryset.order_by().values(*GROUP_FIELDS).annotate(n=Count('pk'))
+    return Counter({tuple(row[field] for field in GROUP_FIELDS): row['n'] for row in rows})
+
+
+def group_counts_for(queryset, field, values):
+    """
+    ``group_counts`` of the rows of ``queryset`` whose ``field`` is in ``values``.
+    """
+    values = list(values)
+    counts = Counter()
+    for start in range(0, len(values), CHUNK_SIZE):
+        chunk = values[start:start + CHUNK_SIZE]
+        counts.update(group_counts(queryset.filter(**{f'{field}__in': chunk})))
+    return counts
+
+
+def updated_group_counts(before, model, values):
+    """
+    ``before`` with the group fields set to ``values``, as an update() to
+    them leaves the rows, without querying them again. None when a value is
+    an expression (F(), Case(), ...), only known once the rows are updated.
+    """
+    changes = {}
+    for field in GROUP_FIELDS:
+        if field in values:
+            value = values[field]
+            if hasattr(value, 'resolve_expression'):
+                return None
+            changes[field] = model._meta.get_field(field).to_python(value)
+    after = Counter()
+    for group, n in before.items():
+        after[tuple(changes.get(field, old) for field, old in zip(GROUP_FIELDS, group))] += n
+    return after
+
+
+def diff(before, after):
+    delta = Counter(after)
+    delta.subtract(before)
+    return delta
+
+
+def apply_deltas(deltas, using=DEFAULT_DB_ALIAS):
+    """
+    Add ``deltas`` (group -> +/- rows) to the aggregate totals in the
+    database ``using``, the one the counted rows were written to.
+    Groups are visited in a fixed order so concurrent writers do not deadlock.
+    """
+    from .models import PreferenciasAggregate
+    aggregates = PreferenciasAggregate.objects.using(using)
+    for group in sorted(deltas, key=repr):
+        delta = deltas[group]
+        if not delta:
+            continue
+        lookup = dict(zip(GROUP_FIELDS, group))
+        queryset = aggregates.filter(**lookup)
+        if queryset.update(total=F('total') + delta):
+            continue
+        try:
+            with transaction.atomic(using=using):
+                aggregates.create(total=delta, **lookup)
+        except IntegrityError:
+            # Another writer created the row first
+            queryset.update(total=F('total') + delta)
+
+
+def aggregate_totals(filters):
+    """
+    Totals of the aggregate rows matching ``filters`` (any GROUP_FIELDS),
+    overall and per idioma. Reads at most one row per group.
+    """
+    from .models import PreferenciasAggregate
+    rows = (PreferenciasAggregate.objects.filter(**filters)
+            .order_by().values('idioma').annotate(n=Sum('total')))
+    por_idioma = {row['idioma']: row['n'] for row in rows if row['n']}
+    return {'total': sum(por_idioma.values()), 'por_idioma': dict(sorted(por_idioma.items()))}
+
+
+def check():
+    """
+    Return the drift as group -> (stored, actual) for groups that differ.
+    """
+    from .models import Preferencias, PreferenciasAggregate
+    actual = group_counts(Preferencias.objects.all())
+    stored = Counter({
+        group_of(row): row.total for row in PreferenciasAggregate.objects.all()
+    })
+    return {
+        group: (stored[group], actual[group])
+        for group in set(actual) | set(stored)
+        if stored[group] != actual[group]
+    }
+
+
+def rebuild():
+    """
+    Recompute every total from Preferencias. Returns the drift that was fixed.
+    """
+    from .models import PreferenciasAggregate
+    with transaction.atomic():
+        connection = transaction.get_connection()
+        if connection.vendor == 'postgresql':
+            # Writers adjust the totals in the transaction of their write:
+            # hold them off until the recount commits, so a write is counted
+            # either by the recount or by its own delta on top of it.
+            # EXCLUSIVE still lets the aggregates endpoint read.
+            with connection.cursor() as cursor:
+                cursor.execute('LOCK TABLE %s IN EXCLUSIVE MODE'
+                               % connection.ops.quote_name(PreferenciasAggregate._meta.db_table))
+        drift = check()
+        for group, (stored, actual) in drift.items():
+            apply_deltas({group: actual - stored})
+        PreferenciasAggregate.objects.filter(total=0).delete()
+    return drift
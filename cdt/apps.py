@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class CdtConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'cdt'
+
+    def ready(self):
+        from . import receivers  # noqa: F401
+        from .cache import _stats
+        from config.metrics import register_cache
+
+        register_cache('preferencias', lambda: (_stats['hits'], _stats['misses']))
@@ -0,0 +1,231 @@
+"""
+Async versions of the cdt API views, routed by config.urls_async under ASGI.
+"""
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import IntegrityError
+from rest_framework import status
+from .models import Preferencias
+from .exceptions import (
+    InvalidUsernameException, UserAlreadyExistsException,
+    UserIdRequiredException, ValidationException
+)
+from .serializers import (
+    UserSerializer, PreferenciasSerializer, UserWithPreferenciasSerializer, unique_user_errors
+)
+from .pagination import UserPagination
+from .fieldsets import narrow, project, sparse_fieldsets, variant
+from .cache import aget_preferencias_data, apreferencias_version, auser_version
+from .hashing import discard_hashing_executor, get_hashing_executor
+from config.async_views import (
+    AsyncAPIView, json_response, request_data, run_in_executor, wants_ndjson
+)
+from config.conditional import not_modified, set_validators, version_validators
+from config.renderers import FastJSONRenderer, andjson_response
+from config.serialization import ValuesSerializer
+
+
+async def _hash_password(password):
+    try:
+        return await run_in_executor(get_hashing_executor(), make_password, password)
+    except BrokenProcessPool:
+        discard_hashing_executor()
+        return await run_in_executor(get_hashing_executor(), make_password, password)
+
+
+class UserAPIView(AsyncAPIView):
+    """
+    API endpoint for user operations
+    """
+
+    async def get(self, request):
+        """
+        GET /api/users/
+        List users, one page at a time (?cursor=&page_size=)
+        With Accept: application/x-ndjson, stream every user instead
+        ?fields= narrows the output and the columns read
+        """
+        sparse = sparse_fieldsets(request.GET, UserSerializer)
+        if wants_ndjson(request):
+            queryset = project(User.objects.order_by('id'), UserSerializer, **sparse)
+            return andjson_response(queryset, partial(UserSerializer, **sparse))
+
+        paginator = UserPagination()
+        fast = ValuesSerializer(UserSerializer(**sparse))
+        queryset = fast.values(User.objects.all(), *paginator.ordering)
+        users = await paginator.apaginate_queryset(queryset, request)
+        return json_response(
+            fast.to_representation(users),
+            headers=paginator.get_headers(),
+            renderer_class=FastJSONRenderer,
+        )
+
+    async def post(self, request):
+        """
+        POST /api/users/
+        Create a new user
+        """
+        data = request_data(request)
+        serializer = UserSerializer(data=data)
+        if not await sync_to_async(serializer.is_valid)():
+            raise ValidationException(serializer.errors)
+
+        validated = serializer.validated_data
+        user = User(
+            username=User.normalize_username(validated['username']),
+            email=User.objects.normalize_email(validated.get('email', '')),
+            first_name=validated.get('first_name', ''),
+            last_name=validated.get('last_name', ''),
+            password=await _hash_password(data.get('password')),
+        )
+        with unique_user_errors():
+            await user.asave()
+        return json_response(UserSerializer(user).data, status=status.HTTP_201_CREATED)
+
+
+class UserDetailAPIView(AsyncAPIView):
+    """
+    API endpoint for specific user operations
+    """
+
+    async def get(self, request, user_id):
+        """
+        GET /api/users/{user_id}/
+        Get specific user details
+        Conditional on If-None-Match / If-Modified-Since, answered from the cache
+        ?fields= and ?fields[preferencias]= narrow the output and the columns read
+        """
+        sparse = sparse_fieldsets(request.GET, UserWithPreferenciasSerializer)
+        validators = version_validators(
+            await auser_version(user_id), await apreferencias_version(user_id),
+            variant=variant(sparse)
+        )
+        response = not_modified(request, *validators)
+        if response is None:
+            queryset = project(User.objects.all(), UserWithPreferenciasSerializer, **sparse)
+            user = await queryset.aget(id=user_id)
+            response = json_response(UserWithPreferenciasSerializer(user, **sparse).data)
+        return set_validators(response, *validators)
+
+    async def put(self, request, user_id):
+        """
+        PUT /api/users/{user_id}/
+        Update specific user
+        """
+        data = request_data(request)
+        user = await User.objects.aget(id=user_id)
+        serializer = UserSerializer(user, data=data, partial=True)
+        if not await sync_to_async(serializer.is_valid)():
+            raise ValidationException(serializer.errors)
+        if 'password' in data:
+            user.password = await _hash_password(data['password'])
+        with unique_user_errors():
+            await sync_to_async(serializer.save)()
+        return json_response(UserSerializer(user).data)
+
+
+class PreferenciasAPIView(AsyncAPIView):
+    """
+    API endpoint for user preferences
+    """
+
+    async def get(self, request):
+        """
+        GET /api/preferencias/
+        Get preferences by user_id
+        ?fields= (or ?fields[preferencias]=) narrows the output
+        """
+        user_id = request.GET.get('user_id')
+        if not user_id:
+            raise UserIdRequiredException()
+
+        sparse = sparse_fieldsets(request.GET, PreferenciasSerializer, 'preferencias')
+        return json_response(narrow(await aget_preferencias_data(user_id), **sparse))
+
+    async def post(self, request):
+        """
+        POST /api/preferencias/
+        Create preferences for a user
+        """
+        data = request_data(request)
+        user_id = data.get('user_id')
+        if not user_id:
+            raise UserIdRequiredException()
+
+        user = await User.objects.aget(id=user_id)
+        serializer = PreferenciasSerializer(data=data)
+        if not serializer.is_valid():
+            raise ValidationException(serializer.errors)
+        preferencias = await Preferencias.objects.acreate(user=user, **serializer.validated_data)
+        return json_response(
+            PreferenciasSerializer(preferencias).data, status=status.HTTP_201_CREATED
+        )
+
+
+class PreferenciasDetailAPIView(AsyncAPIView):
+    """
+    API endpoint for specific user preferences
+    """
+
+    async def get(self, request, user_id):
+        """
+        GET /api/preferencias/{user_id}/
+        Get specific user's preferences
+        Conditional on If-None-Match / If-Modified-Since, answered from the cache
+        ?fields= (or ?fields[preferencias]=) narrows the output
+        """
+        sparse = sparse_fieldsets(request.GET, PreferenciasSerializer, 'preferencias')
+        validators = version_validators(
+            await apreferencias_version(user_id), variant=variant(sparse)
+        )
+        response = not_modified(request, *validators)
+        if response is None:
+            response = json_response(narrow(await aget_preferencias_data(user_id), **sparse))
+        return set_validators(response, *validators)
+
+    async def put(self, request, user_id):
+        """
+        PUT /api/preferencias/{user_id}/
+        Update specific user's preferences
+        The cached copy is invalidated by the Preferencias post_save signal
+        """
+        preferencias = await Preferencias.objects.aget(user_id=user_id)
+        serializer = PreferenciasSerializer(preferencias, data=request_data(request), partial=True)
+        if not serializer.is_valid():
+            raise ValidationException(serializer.errors)
+        for attr, value in serializer.validated_data.items():
+            setattr(preferencias, attr, value)
+        await preferencias.asave()
+        return json_response(PreferenciasSerializer(preferencias).data)
+
+
+class NismanAPIView(AsyncAPIView):
+    """
+    API endpoint for /nisman POST
+    """
+
+    async def post(self, request):
+        username = request_data(request).get('username', '')
+
+        if not username.strip():
+            raise InvalidUsernameException()
+
+        if await User.objects.filter(username=username).aexists():
+            raise UserAlreadyExistsException()
+
+        try:
+            await User.objects.acreate(
+                username=username,
+                email=f'{username}@example.com',
+                password=await _hash_password('securepassword'),
+            )
+        except IntegrityError:
+            raise UserAlreadyExistsException()
+        return json_response(
+            {'message': f'User "{username}" created successfully'},
+            status=status.HTTP_201_CREATED
+        )
@@ -0,0 +1,342 @@
+"""
+In-process bitmap index over the Preferencias segment fields.
+
+Each boolean field and each idioma value maps to a Python int used as a
+bitset, bit ``n`` standing for user_id ``n``. Intersections, unions and
+complements are then single big-int operations and a segment count is
+``int.bit_count()``: milliseconds for millions of users.
+
+There is one index per (database, tenant schema), up to
+settings.PREFERENCIAS_BITMAP_MAX_INDEXES per process (least recently used
+dropped first). Each worker loads its indexes in the background, starting
+with the first request (config.wsgi/config.asgi connect
+``warm_up_on_first_request``), and keeps them current through the receivers
+in cdt.receivers once each write commits. Writes made by other processes
+are not seen, so an index older than settings.PREFERENCIAS_BITMAP_MAX_AGE
+is treated as cold: it is reloaded in the background and callers fall back
+to SQL meanwhile.
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import partial
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Max
+
+from tenants.schema import current_schema, schema_context
+
+logger = logging.getLogger(__name__)
+
+BOOLEAN_FIELDS = ('tema_oscuro', 'notificaciones_email', 'notificaciones_push')
+FIELDS = (*BOOLEAN_FIELDS, 'idioma')
+
+
+class Bitmap:
+    """
+    A set of user ids. ``~`` is the complement within the users that have
+    Preferencias, ``len`` the cardinality.
+    """
+    __slots__ = ('bits', 'universe')
+
+    def __init__(self, bits, universe):
+        self.bits = bits
+        self.universe = universe
+
+    def __and__(self, other):
+        return Bitmap(self.bits & other.bits, self.universe)
+
+    def __or__(self, other):
+        return Bitmap(self.bits | other.bits, self.universe)
+
+    def __sub__(self, other):
+        return Bitmap(self.bits & ~other.bits, self.universe)
+
+    def __invert__(self):
+        return Bitmap(self.universe & ~self.bits, self.universe)
+
+    def __len__(self):
+        return self.bits.bit_count()
+
+    def __bool__(self):
+        return self.bits != 0
+
+    def __contains__(self, user_id):
+        return user_id >= 0 and bool(self.bits >> user_id & 1)
+
+    def __iter__(self):
+        data = self.bits.to_bytes((self.bits.bit_length() + 7) // 8, 'little')
+        for offset, byte in enumerate(data):
+            while byte:
+                low = byte & -byte
+                yield offset * 8 + low.bit_length() - 1
+                byte ^= low
+
+    def __repr__(self):
+        return f'<Bitmap: {len(self)} users>'
+
+
+class BitmapIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._bitmaps = {}
+        self._universe = 0
+        self._loading = False
+        self._pending = []
+        self.loaded_at = None
+
+    def is_warm(self):
+        return (
+            self.loaded_at is not None
+            and time.monotonic() - self.loaded_at < settings.PREFERENCIAS_BITMAP_MAX_AGE
+        )
+
+    def load(self, queryset):
+        """
+        Rebuild every bitmap from ``queryset``, swapping them in at the end.
+        Changes recorded while loading are replayed on top of the snapshot.
+        """
+        with self._lock:
+            if self._loading:
+                return False
+            self._loading = True
+            self._pending = []
+        try:
+            size = (queryset.aggregate(last=Max('user_id'))['last'] or 0) // 8 + 1
+            arrays = {'*': bytearray(size)}
+            rows = queryset.order_by().values_list('user_id', *FIELDS)
+            for user_id, *values in rows.iterator(chunk_size=settings.PREFERENCIAS_BITMAP_CHUNK_SIZE):
+                offset, mask = user_id >> 3, 1 << (user_id & 7)
+                if offset >= size:
+                    for array in arrays.values():
+                        array.extend(bytes(offset + 1 - size))
+                    size = offset + 1
+                arrays['*'][offset] |= mask
+                for field, value in zip(BOOLEAN_FIELDS, values):
+                    if value:
+                        arrays.setdefault((field, True), bytearray(size))[offset] |= mask
+                arrays.setdefault(('idioma', values[-1]), bytearray(size))[offset] |= mask
+            bitmaps = {key: int.from_bytes(array, 'little') for key, array in arrays.items()}
+        except Exception:
+            with self._lock:
+                self._loading = False
+            raise
+
+        with self._lock:
+            self._universe = bitmaps.pop('*')
+            self._bitmaps = bitmaps
+            self._loading = False
+            pending, self._pending = self._pending, []
+            for user_id, values in pending:
+                self._set(user_id, values)
+            self.loaded_at = time.monotonic()
+        return True
+
+    def set_row(self, user_id, values):
+        """
+        Record the current ``values`` (field -> value) of ``user_id``, or
+        its removal when ``values`` is None.
+        """
+        with self._lock:
+            if self._loading:
+                self._pending.append((user_id, values))
+            self._set(user_id, values)
+
+    def _set(self, user_id, values):
+        bit = 1 << user_id
+        for key in list(self._bitmaps):
+            if key[0] == 'idioma' or values is None or not values[key[0]]:
+                self._bitmaps[key] &= ~bit
+                if not self._bitmaps[key]:
+                    del self._bitmaps[key]
+        if values is None:
+            self._universe &= ~bit
+            return
+        self._universe |= bit
+        for field in BOOLEAN_FIELDS:
+            if values[field]:
+                self._bitmaps[(field, True)] = self._bitmaps.get((field, True), 0) | bit
+        key = ('idioma', values['idioma'])
+        self._bitmaps[key] = self._bitmaps.get(key, 0) | bit
+
+    def get(self, field, value):
+        """
+        Bitmap of the users whose ``field`` equals ``value``.
+        """
+        with self._lock:
+            universe = self._universe
+            if field in BOOLEAN_FIELDS:
+                bitmap = Bitmap(self._bitmaps.get((field, True), 0), universe)
+                return bitmap if value else ~bitmap
+            if field == 'idioma':
+                return Bitmap(self._bitmaps.get((field, value), 0), universe)
+        raise KeyError(field)
+
+    def all(self):
+        with self._lock:
+            return Bitmap(self._universe, self._universe)
+
+    def segment(self, **filters):
+        """
+        AND of every ``field=value`` filter, as PreferenciasQuerySet.segment.
+        """
+        bitmap = self.all()
+        for field, value in filters.items():
+            bitmap &= self.get(field, value)
+        return bitmap
+
+    def count(self, **filters):
+        return len(self.segment(**filters))
+
+
+# (alias, schema) -> BitmapIndex, least recently used first
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+# Process that started the first warm-up, see warm_up_on_first_request
+_warmed_up_pid = None
+
+
+def _key(using):
+    return using, current_schema(using)
+
+
+def get_index(using=DEFAULT_DB_ALIAS, schema=None):
+    key = (using, schema) if schema is not None else _key(using)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = BitmapIndex()
+            while len(_indexes) > settings.PREFERENCIAS_BITMAP_MAX_INDEXES:
+                _indexes.popitem(last=False)
+        else:
+            _indexes.move_to_end(key)
+        return index
+
+
+def warm_up(using=DEFAULT_DB_ALIAS):
+    """
+    Load the index of the connection's current schema. Blocks until done.
+    """
+    from .models import Preferencias
+    return get_index(using).load(Preferencias.objects.using(using).all())
+
+
+def _load_in_thread(using, schema):
+    from .models import Preferencias
+    try:
+        with schema_context(schema, using):
+            get_index(using, schema).load(Preferencias.objects.using(using).all())
+    except Exception:
+        logger.exception('Loading the Preferencias bitmap index of %s failed', schema)
+    finally:
+        connections[using].close()
+
+
+def warm_up_in_background(using=DEFAULT_DB_ALIAS, schema=None):
+    if not settings.PREFERENCIAS_BITMAP_INDEX:
+        return None
+    schema = schema or current_schema(using)
+    thread = threading.Thread(
+        target=_load_in_thread, args=(using, schema),
+        name='preferencias-bitmaps', daemon=True,
+    )
+    thread.start()
+    return thread
+
+
+def warm_up_on_first_request(**kwargs):
+    """
+    request_started receiver loading the index of the public schema once per
+    process: a worker forked from a preloaded application starts its own.
+    """
+    global _warmed_up_pid
+    if _warmed_up_pid == os.getpid():
+        return
+    _warmed_up_pid = os.getpid()
+    warm_up_in_background()
+
+
+def _forget_indexes_after_fork():
+    # The loading threads of the parent are not in the child: its indexes
+    # would stay loading forever, and their locks may be held
+    global _indexes_lock
+    _indexes_lock = threading.Lock()
+    _indexes.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget_indexes_after_fork)
+
+
+def _has_pending_updates(using):
+    # Writes of the current transaction are applied on commit: until then the
+    # index does not show them to the connection that made them
+    return any(
+        getattr(callback, 'updates_bitmap_index', False)
+        for _, callback, *_ in connections[using].run_on_commit
+    )
+
+
+def segment(filters, using=DEFAULT_DB_ALIAS):
+    """
+    Bitmap for ``filters`` if the index is warm, else None (after scheduling
+    a reload of a stale index) so the caller runs the query instead.
+    """
+    if not settings.PREFERENCIAS_BITMAP_INDEX:
+        return None
+    index = get_index(using)
+    if not index.is_warm():
+        if not index._loading:
+            # Not while the caller's transaction may hold locks the loader needs
+            schema = current_schema(using)
+            transaction.on_commit(lambda: warm_up_in_background(using, schema), using=using)
+        return None
+    if _has_pending_updates(using):
+        return None
+    return index.segment(**filters)
+
+
+def _on_commit(func, using):
+    func.updates_bitmap_index = True
+    transaction.on_commit(func, using=using)
+
+
+def _apply_rows(index, user_ids, rows):
+    for user_id in user_ids:
+        index.set_row(user_id, rows.get(user_id))
+
+
+def record_change(user_id, values, using=DEFAULT_DB_ALIAS):
+    """
+    Apply a saved (``values``) or deleted (None) row once the transaction commits.
+    """
+    key = _key(using)
+    index = _indexes.get(key)
+    if index is None or index.loaded_at is None and not index._loading:
+        return
+    values = None if values is None else {field: values[field] for field in FIELDS}
+    _on_commit(partial(_apply_rows, index, [user_id], {user_id: values}), using)
+
+
+def _refresh_users(index, user_ids, using):
+    from .models import Preferencias
+    rows = {}
+    queryset = Preferencias.objects.using(using).values_list('user_id', *FIELDS)
+    for start in range(0, len(user_ids), settings.PREFERENCIAS_BITMAP_CHUNK_SIZE):
+        chunk = user_ids[start:start + settings.PREFERENCIAS_BITMAP_CHUNK_SIZE]
+        for user_id, *values in queryset.filter(user_id__in=chunk):
+            rows[user_id] = dict(zip(FIELDS, values))
+    _apply_rows(index, user_ids, rows)
+
+
+def record_bulk_change(user_ids, using=DEFAULT_DB_ALIAS):
+    """
+    Re-read the rows of ``user_ids`` into the index once the transaction commits.
+    """
+    index = _indexes.get(_key(using))
+    if index is None or index.loaded_at is None and not index._loading:
+        return
+    _on_commit(partial(_refresh_users, index, list(user_ids), using), using)
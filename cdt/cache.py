@@ -0,0 +1,217 @@
+"""
+Read-through cache for serialized Preferencias, keyed by user_id.
+
+Every user has a version token in the cache and the serialized preferences
+are stored under ``<user_id>:<version>``. Writes never touch the data keys:
+they replace the version token once the transaction commits, so a reader
+that raced with the write can only ever populate a key nobody will read again.
+Misses read from the primary: a lagging replica could still return the
+preferences the new version token replaced.
+
+The cache is an optimisation only: while it cannot be reached reads go to
+the database, uncached, and the version tokens are None (no conditional GET).
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Preferencias
+from .serializers import PreferenciasSerializer
+from config.replicas import primary_reads
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'cdt:preferencias'
+USER_KEY_PREFIX = 'cdt:user'
+
+_stats = {'hits': 0, 'misses': 0}
+
+
+def _version_key(user_id):
+    return f'{KEY_PREFIX}:{user_id}:version'
+
+
+def _data_key(user_id, version):
+    return f'{KEY_PREFIX}:{user_id}:{version}'
+
+
+def _user_version_key(user_id):
+    return f'{USER_KEY_PREFIX}:{user_id}:version'
+
+
+# Backends raise their client's own errors (redis.exceptions.ConnectionError,
+# ...), with no common base class
+def _cache_failed(action):
+    logger.warning('Cache unavailable, %s', action, exc_info=True)
+
+
+def _get(key):
+    try:
+        return cache.get(key)
+    except Exception:
+        _cache_failed('reading from the database')
+        return None
+
+
+def _set(key, value):
+    try:
+        cache.set(key, value, settings.PREFERENCIAS_CACHE_TIMEOUT)
+    except Exception:
+        _cache_failed('not caching')
+
+
+def _bump(keys):
+    try:
+        cache.set_many(
+            dict.fromkeys(keys, time.time_ns()), timeout=settings.PREFERENCIAS_VERSION_TIMEOUT
+        )
+    except Exception:
+        # Runs on commit: the write succeeded, the cached copy expires with
+        # PREFERENCIAS_CACHE_TIMEOUT
+        logger.error('Could not invalidate %s', ', '.join(keys), exc_info=True)
+
+
+def _token(key):
+    try:
+        version = cache.get(key)
+        if version is None:
+            version = time.time_ns()
+            if not cache.add(key, version, timeout=settings.PREFERENCIAS_VERSION_TIMEOUT):
+                version = cache.get(key, version)
+    except Exception:
+        _cache_failed('no version token')
+        return None
+    return version
+
+
+async def _aget(key):
+    try:
+        return await cache.aget(key)
+    except Exception:
+        _cache_failed('reading from the database')
+        return None
+
+
+async def _aset(key, value):
+    try:
+        await cache.aset(key, value, settings.PREFERENCIAS_CACHE_TIMEOUT)
+    except Exception:
+        _cache_failed('not caching')
+
+
+async def _atoken(key):
+    try:
+        version = await cache.aget(key)
+        if version is None:
+            version = time.time_ns()
+            if not await cache.aadd(key, version, timeout=settings.PREFERENCIAS_VERSION_TIMEOUT):
+                version = await cache.aget(key, version)
+    except Exception:
+        _cache_failed('no version token')
+        return None
+    return version
+
+
+def _current_version(user_id):
+    return _token(_version_key(user_id))
+
+
+def preferencias_version(user_id):
+    """
+    Version token of the preferences of ``user_id``: the time_ns() of their
+    last change, or of the first read after the token was lost. Doubles as
+    the ETag/Last-Modified of the preferences. None while the cache is down.
+    """
+    return _current_version(int(user_id))
+
+
+async def apreferencias_version(user_id):
+    return await _atoken(_version_key(int(user_id)))
+
+
+def user_version(user_id):
+    """
+    Version token of the User row of ``user_id``, see ``preferencias_version``.
+    """
+    return _token(_user_version_key(int(user_id)))
+
+
+async def auser_version(user_id):
+    return await _atoken(_user_version_key(int(user_id)))
+
+
+def get_preferencias_data(user_id):
+    """
+    Return the serialized preferences of ``user_id``, reading through the cache.
+    Raises Preferencias.DoesNotExist like the ORM lookup it replaces.
+    """
+    user_id = int(user_id)
+    version = _current_version(user_id)
+    data = None if version is None else _get(_data_key(user_id, version))
+    if data is not None:
+        _stats['hits'] += 1
+        return data
+
+    _stats['misses'] += 1
+    with primary_reads():
+        preferencias = Preferencias.objects.get(user_id=user_id)
+    data = dict(PreferenciasSerializer(preferencias).data)
+    if version is not None:
+        _set(_data_key(user_id, version), data)
+    return data
+
+
+def invalidate_preferencias(*user_ids):
+    """
+    Drop the cached preferences of ``user_ids`` once the current transaction commits.
+    """
+    user_ids = [int(user_id) for user_id in user_ids]
+    if not user_ids:
+        return
+
+    transaction.on_commit(lambda: _bump([_version_key(user_id) for user_id in user_ids]))
+
+
+def invalidate_users(*user_ids):
+    """
+    Replace the version token of ``user_ids`` once the current transaction commits.
+    """
+    user_ids = [int(user_id) for user_id in user_ids]
+    if not user_ids:
+        return
+
+    transaction.on_commit(lambda: _bump([_user_version_key(user_id) for user_id in user_ids]))
+
+
+def cache_stats():
+    """
+    Hit/miss counters of this process.
+    """
+    lookups = _stats['hits'] + _stats['misses']
+    return {
+        **_stats,
+        'hit_ratio': _stats['hits'] / lookups if lookups else 0.0,
+    }
+
+
+async def aget_preferencias_data(user_id):
+    """
+    Async counterpart of ``get_preferencias_data``.
+    """
+    user_id = int(user_id)
+    version = await _atoken(_version_key(user_id))
+    data = None if version is None else await _aget(_data_key(user_id, version))
+    if data is not None:
+        _stats['hits'] += 1
+        return data
+
+    _stats['misses'] += 1
+    with primary_reads():
+        preferencias = await Preferencias.objects.aget(user_id=user_id)
+    data = dict(PreferenciasSerializer(preferencias).data)
+    if version is not None:
+        await _aset(_data_key(user_id, version), data)
+    return data
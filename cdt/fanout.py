@@ -0,0 +1,184 @@
+"""
+Campaign fan-out: one Pub/Sub message per Preferencias in a segment.
+
+Recipients are streamed in user_id order through a server-side cursor
+(``QuerySet.iterator``) and handed to a PublisherClient that batches
+messages (settings.FANOUT_BATCH_*) and blocks on its own flow control
+instead of buffering the whole segment in memory. Publish futures are kept
+in a bounded FIFO, at most settings.FANOUT_MAX_IN_FLIGHT of them: once it
+is full the oldest one is waited on before publishing more.
+
+The FanoutCheckpoint of the campaign records the highest user_id below
+which every message has been acknowledged. A crashed or failed run picks
+up from there, so delivery is at least once: messages acknowledged after
+the last checkpoint are published again and subscribers should dedupe on
+the ``campaign``/``user_id`` attributes.
+
+``google-cloud-pubsub`` is imported when a publisher is built, so the rest
+of the project does not pay for it. With settings.PUBSUB_EMULATOR_HOST set
+the client talks to the emulator from docker-compose.yml.
+"""
+import json
+import logging
+import os
+from collections import deque
+
+from django.conf import settings
+
+from .models import FanoutCheckpoint, Preferencias
+
+logger = logging.getLogger(__name__)
+
+
+def get_publisher():
+    """
+    Build a PublisherClient with the fan-out batch and flow control settings.
+    """
+    if settings.PUBSUB_EMULATOR_HOST:
+        os.environ.setdefault('PUBSUB_EMULATOR_HOST', settings.PUBSUB_EMULATOR_HOST)
+    from google.cloud import pubsub_v1
+
+    return pubsub_v1.PublisherClient(
+        batch_settings=pubsub_v1.types.BatchSettings(
+            max_messages=settings.FANOUT_BATCH_MAX_MESSAGES,
+            max_bytes=settings.FANOUT_BATCH_MAX_BYTES,
+            max_latency=settings.FANOUT_BATCH_MAX_LATENCY,
+        ),
+        publisher_options=pubsub_v1.types.PublisherOptions(
+            flow_control=pubsub_v1.types.PublishFlowControl(
+                message_limit=settings.FANOUT_FLOW_CONTROL_MAX_MESSAGES,
+                byte_limit=settings.FANOUT_FLOW_CONTROL_MAX_BYTES,
+                limit_exceeded_behavior=pubsub_v1.types.LimitExceededBehavior.BLOCK,
+            ),
+        ),
+    )
+
+
+def ensure_topic(publisher, topic):
+    """
+    Create ``topic`` if it does not exist yet (the emulator starts empty).
+    """
+    from google.api_core.exceptions import AlreadyExists
+
+    topic_path = publisher.topic_path(settings.PUBSUB_PROJECT_ID, topic)
+    try:
+        publisher.create_topic(name=topic_path)
+    except AlreadyExists:
+        pass
+    return topic_path
+
+
+def get_checkpoint(campaign, topic=None, filters=None, payload=None, restart=False):
+    """
+    Return the checkpoint of ``campaign``, creating it on the first run.
+    ``restart`` starts the campaign over from the first user with the given
+    topic, filters and payload.
+    """
+    checkpoint, created = FanoutCheckpoint.objects.get_or_create(
+        campaign=campaign,
+        defaults={
+            'topic': topic or settings.PUBSUB_FANOUT_TOPIC,
+            'filters': filters or {},
+            'payload': payload or {},
+        },
+    )
+    if restart and not created:
+        checkpoint.topic = topic or checkpoint.topic
+        checkpoint.filters = filters if filters is not None else checkpoint.filters
+        checkpoint.payload = payload if payload is not None else checkpoint.payload
+        checkpoint.last_user_id = 0
+        checkpoint.published = 0
+        checkpoint.status = FanoutCheckpoint.Status.RUNNING
+        checkpoint.error = ''
+        checkpoint.save()
+    return checkpoint
+
+
+def recipients(checkpoint, chunk_size=None):
+    """
+    Stream (user_id, email, idioma) of the campaign segment after the checkpoint.
+    """
+    queryset = (
+        Preferencias.objects.all()
+        .segment(**checkpoint.filters)
+        .filter(user_id__gt=checkpoint.last_user_id)
+        .order_by('user_id')
+        .values_list('user_id', 'user__email', 'idioma')
+    )
+    return queryset.iterator(chunk_size=chunk_size or settings.FANOUT_CHUNK_SIZE)
+
+
+def encode_message(checkpoint, user_id, email, idioma):
+    return json.dumps(
+        {
+            'campaign': checkpoint.campaign,
+            'user_id': user_id,
+            'email': email,
+            'idioma': idioma,
+            'data': checkpoint.payload,
+        },
+        separators=(',', ':'),
+    ).encode()
+
+
+def _save_progress(checkpoint, **extra):
+    fields = {'last_user_id': checkpoint.last_user_id, 'published': checkpoint.published, **extra}
+    FanoutCheckpoint.objects.filter(pk=checkpoint.pk).update(**fields)
+
+
+def fan_out(checkpoint, publisher=None, max_in_flight=None, checkpoint_every=None, chunk_size=None):
+    """
+    Publish one message per remaining recipient of ``checkpoint``'s campaign.
+    Returns the number of messages published by this run.
+    """
+    if checkpoint.status == FanoutCheckpoint.Status.DONE:
+        return 0
+    publisher = publisher or get_publisher()
+    max_in_flight = max_in_flight or settings.FANOUT_MAX_IN_FLIGHT
+    checkpoint_every = checkpoint_every or settings.FANOUT_CHECKPOINT_EVERY
+    topic_path = publisher.topic_path(settings.PUBSUB_PROJECT_ID, checkpoint.topic)
+
+    in_flight = deque()
+    published_before = checkpoint.published
+    unsaved = 0
+
+    def settle(block):
+        # Acknowledge futures in publish order so last_user_id never skips
+        # over a message that is still pending or failed
+        nonlocal unsaved
+        while in_flight and (block or in_flight[0][1].done()):
+            user_id, future = in_flight[0]
+            future.result()
+            in_flight.popleft()
+            checkpoint.last_user_id = user_id
+            checkpoint.published += 1
+            unsaved += 1
+            block = block and len(in_flight) >= max_in_flight
+        if unsaved >= checkpoint_every:
+            _save_progress(checkpoint)
+            unsaved = 0
+
+    FanoutCheckpoint.objects.filter(pk=checkpoint.pk).update(
+        status=FanoutCheckpoint.Status.RUNNING, error=''
+    )
+    try:
+        for user_id, email, idioma in recipients(checkpoint, chunk_size):
+            future = publisher.publish(
+                topic_path,
+                encode_message(checkpoint, user_id, email, idioma),
+                campaign=checkpoint.campaign,
+                user_id=str(user_id),
+            )
+            in_flight.append((user_id, future))
+            settle(block=len(in_flight) >= max_in_flight)
+        while in_flight:
+            settle(block=True)
+    except Exception as exc:
+        logger.exception('Fan-out of campaign %s failed', checkpoint.campaign)
+        checkpoint.status = FanoutCheckpoint.Status.FAILED
+        _save_progress(checkpoint, status=checkpoint.status, error=str(exc))
+        raise
+
+    checkpoint.status = FanoutCheckpoint.Status.DONE
+    _save_progress(checkpoint, status=checkpoint.status)
+    return checkpoint.published - published_before
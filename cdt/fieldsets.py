@@ -0,0 +1,136 @@
+"""
+Sparse fieldsets for the user and preference endpoints.
+
+``?fields=id,username`` narrows the primary resource and
+``?fields[preferencias]=idioma`` the nested preferences (or, on the
+preference endpoints, the primary resource itself). The same selection
+narrows the serializer output, through SparseFieldsetMixin, and the columns
+the view selects, through ``project``.
+"""
+import re
+
+from django.core.exceptions import FieldDoesNotExist
+
+from .exceptions import ValidationException
+
+FIELDS_PARAM = 'fields'
+_NESTED_PARAM = re.compile(r'^fields\[(\w+)\]$')
+
+
+class SparseFieldsetMixin:
+    """
+    Serializer mixin taking ``fields`` (names to keep) and ``nested_fields``
+    (nested serializer name -> names to keep) keyword arguments.
+    """
+
+    def __init__(self, *args, fields=None, nested_fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+        for name, nested in (nested_fields or {}).items():
+            if name in self.fields:
+                serializer = self.fields[name]
+                for field_name in set(serializer.fields) - set(nested):
+                    serializer.fields.pop(field_name)
+
+
+def _split(value):
+    return [name for name in (part.strip() for part in value.split(',')) if name]
+
+
+def _check(requested, available, param):
+    unknown = sorted(set(requested) - set(available))
+    if unknown:
+        raise ValidationException({param: [f'Unknown field(s): {", ".join(unknown)}']})
+
+
+def sparse_fieldsets(query_params, serializer_class, resource=None):
+    """
+    Read the fieldsets of a request for ``serializer_class``, as keyword
+    arguments for it: ``fields`` and ``nested_fields``. ``resource`` names
+    the primary resource so ``?fields[<resource>]=`` applies to it.
+    Unknown names raise ValidationException.
+    """
+    available = serializer_class().fields
+    selection = {}
+    nested_fields = {}
+    for param in query_params:
+        if param == FIELDS_PARAM:
+            name = None
+        else:
+            match = _NESTED_PARAM.match(param)
+            if match is None:
+                continue
+            name = match.group(1)
+        requested = _split(query_params.get(param))
+        if name is None or name == resource:
+            _check(requested, available, param)
+            # ?fields[<resource>]= wins over ?fields=
+            if name is not None or 'fields' not in selection:
+                selection['fields'] = requested
+            continue
+        nested = available.get(name)
+        if not hasattr(nested, 'fields'):
+            raise ValidationException({param: [f'Unknown resource: {name}']})
+        _check(requested, nested.fields, param)
+        nested_fields[name] = requested
+    if nested_fields:
+        selection['nested_fields'] = nested_fields
+    return selection
+
+
+def _columns(model, names, prefix=''):
+    columns = {prefix + model._meta.pk.name}
+    for name in names:
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            continue
+        if field.concrete:
+            columns.add(prefix + field.name)
+    return columns
+
+
+def project(queryset, serializer_class, fields=None, nested_fields=None):
+    """
+    Narrow ``queryset`` with ``.only()`` to the columns ``serializer_class``
+    outputs for a sparse fieldset (all of its fields by default), joining
+    the nested relations it keeps.
+    """
+    model = queryset.model
+    serializer = serializer_class()
+    names = fields if fields is not None else list(serializer.fields)
+    columns = _columns(model, names)
+    for name in names:
+        nested = serializer.fields[name]
+        if not hasattr(nested, 'fields'):
+            continue
+        related_model = model._meta.get_field(name).related_model
+        nested_names = (nested_fields or {}).get(name, list(nested.fields))
+        queryset = queryset.select_related(name)
+        columns |= _columns(related_model, nested_names, prefix=f'{name}__')
+    return queryset.only(*columns)
+
+
+def narrow(data, fields=None, **kwargs):
+    """
+    Apply a sparse fieldset to already serialized ``data`` (e.g. from the cache).
+    """
+    if fields is None:
+        return data
+    return {name: value for name, value in data.items() if name in fields}
+
+
+def variant(selection):
+    """
+    A stable string naming the representation, to tell ETags apart.
+    """
+    if not selection:
+        return ''
+    parts = []
+    if 'fields' in selection:
+        parts.append('fields=' + ','.join(sorted(selection['fields'])))
+    for name, nested in sorted(selection.get('nested_fields', {}).items()):
+        parts.append(f'fields[{name}]=' + ','.join(sorted(nested)))
+    return ';'.join(parts)
@@ -0,0 +1,62 @@
+"""
+Password hashing on a process pool.
+
+PBKDF2 is pure CPU work that holds the GIL, so hashing thousands of passwords
+in the request thread uses a single core. Batches are spread over a pool of
+worker processes instead; small batches are hashed inline to skip the IPC.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+
+_executor = None
+_workers = None
+
+
+def _init_worker():
+    import django
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+    django.setup()
+
+
+def get_hashing_executor():
+    global _executor, _workers
+    if _executor is None:
+        _workers = settings.PASSWORD_HASHING_WORKERS or os.cpu_count()
+        _executor = ProcessPoolExecutor(max_workers=_workers, initializer=_init_worker)
+    return _executor
+
+
+def discard_hashing_executor():
+    """
+    Drop the pool, e.g. once broken by a worker that died: the next
+    ``get_hashing_executor()`` starts a new one.
+    """
+    global _executor
+    executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _map(passwords):
+    executor = get_hashing_executor()
+    chunksize = max(1, len(passwords) // (_workers * 4))
+    return list(executor.map(make_password, passwords, chunksize=chunksize))
+
+
+def hash_passwords(passwords):
+    """
+    Return ``make_password(p)`` for every password, in order.
+    """
+    passwords = list(passwords)
+    if len(passwords) < settings.PASSWORD_HASHING_MIN_BATCH:
+        return [make_password(password) for password in passwords]
+    try:
+        return _map(passwords)
+    except BrokenProcessPool:
+        # A worker was killed (OOM, ...): the pool refuses all work from then on
+        discard_hashing_executor()
+        return _map(passwords)
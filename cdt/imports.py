@@ -0,0 +1,111 @@
+"""
+Import specs for users and their preferences (see config.imports).
+"""
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db.models.functions import Upper
+from rest_framework import serializers
+
+from config.imports import ImportSpec
+from . import aggregates
+from .cache import invalidate_users
+from .models import Preferencias
+from .serializers import EMAIL_TAKEN, PreferenciasSerializer, UserSerializer
+from .signals import preferencias_bulk_changed
+
+USER_REQUIRED = 'A username or user_id is required.'
+USER_NOT_FOUND = 'User not found.'
+
+
+class UserImportSerializer(UserSerializer):
+    def validate_email(self, value):
+        # Checked for the whole chunk by UserImport.check
+        return value
+
+
+class UserImport(ImportSpec):
+    """
+    Users matched on username. New users get an unusable password.
+    """
+    model = User
+    serializer_class = UserImportSerializer
+    key = 'username'
+    fields = ('username', 'email', 'first_name', 'last_name')
+
+    def check(self, rows):
+        # Emails must be unique ignoring case, within the chunk and against
+        # the users with another username
+        emails = {values['email'].upper() for values in rows.values() if values.get('email')}
+        owners = dict(
+            User.objects.annotate(email_upper=Upper('email'))
+            .filter(email_upper__in=list(emails))
+            .values_list('email_upper', 'username')
+        ) if emails else {}
+        errors = {}
+        for line, values in rows.items():
+            email = values.get('email', '').upper()
+            if not email:
+                continue
+            owner = owners.setdefault(email, values['username'])
+            if owner != values['username']:
+                errors[line] = {'email': [EMAIL_TAKEN]}
+        return errors
+
+    def insert_values(self):
+        return {'password': make_password(None)}
+
+    def after_merge(self, keys, created, state):
+        # No post_save: forget the cached versions of the updated users
+        created = set(created)
+        updated = [key for key in keys if key not in created]
+        if updated:
+            invalidate_users(*User.objects.filter(username__in=updated).values_list('pk', flat=True))
+
+
+class PreferenciasImport(ImportSpec):
+    """
+    Preferencias matched on their user, given by ``user_id`` or ``username``.
+    """
+    model = Preferencias
+    serializer_class = PreferenciasSerializer
+    key = 'user_id'
+    fields = ('user_id', *PreferenciasSerializer.Meta.fields)
+
+    def validate(self, row):
+        values = super().validate(row)
+        user = row.get('user_id', row.get('username'))
+        if user is None:
+            raise serializers.ValidationError({'user_id': [USER_REQUIRED]})
+        values['user_id'] = user if 'user_id' in row else None
+        values['username'] = None if 'user_id' in row else str(user)
+        return values
+
+    def check(self, rows):
+        # Resolve usernames and check ids, one query each for the chunk
+        usernames = {values['username'] for values in rows.values() if values['username']}
+        ids = {str(values['user_id']) for values in rows.values() if values['user_id'] is not None}
+        by_username = dict(
+            User.objects.filter(username__in=usernames).values_list('username', 'pk')
+        ) if usernames else {}
+        valid_ids = {
+            str(pk) for pk in User.objects.filter(pk__in=[i for i in ids if i.isdigit()])
+            .values_list('pk', flat=True)
+        } if ids else set()
+        errors = {}
+        for line, values in rows.items():
+            username = values.pop('username')
+            user_id = by_username.get(username) if username else values['user_id']
+            if user_id is None or (not username and str(user_id) not in valid_ids):
+                errors[line] = {'user_id': [USER_NOT_FOUND]}
+                continue
+            values['user_id'] = int(user_id)
+        return errors
+
+    def before_merge(self, keys):
+        return aggregates.group_counts_for(Preferencias._base_manager.using(self.using), 'user_id', keys)
+
+    def after_merge(self, keys, created, state):
+        # Same bookkeeping as PreferenciasQuerySet.bulk_create/update
+        after = aggregates.group_counts_for(Preferencias._base_manager.using(self.using), 'user_id', keys)
+        aggregates.apply_deltas(aggregates.diff(state, after), using=self.using)
+        preferencias_bulk_changed.send(sender=Preferencias, user_ids=list(keys), using=self.using)
@@ -0,0 +1,70 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cdt import fanout
+from cdt.models import FanoutCheckpoint
+
+
+def boolean(value):
+    if value.lower() in {'true', '1', 'yes'}:
+        return True
+    if value.lower() in {'false', '0', 'no'}:
+        return False
+    raise ValueError(value)
+
+
+class Command(BaseCommand):
+    help = (
+        'Publish one Pub/Sub message per user of a preferences segment. '
+        'Running it again for the same campaign resumes from its checkpoint.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('campaign', help='Unique campaign name, also the checkpoint key.')
+        parser.add_argument('--topic', help='Pub/Sub topic (defaults to PUBSUB_FANOUT_TOPIC).')
+        parser.add_argument('--payload', type=json.loads,
+                            help='JSON object sent to every recipient under "data".')
+        for field in ('tema_oscuro', 'notificaciones_email', 'notificaciones_push'):
+            parser.add_argument(f'--{field.replace("_", "-")}', dest=field, type=boolean)
+        parser.add_argument('--idioma')
+        parser.add_argument('--create-topic', action='store_true',
+                            help='Create the topic first, e.g. on a fresh emulator.')
+        parser.add_argument('--restart', action='store_true',
+                            help='Start the campaign over from the first recipient.')
+
+    def handle(self, *args, **options):
+        filters = {
+            field: options[field]
+            for field in ('tema_oscuro', 'notificaciones_email', 'notificaciones_push', 'idioma')
+            if options[field] is not None
+        }
+        checkpoint = fanout.get_checkpoint(
+            options['campaign'], topic=options['topic'], filters=filters,
+            payload=options['payload'], restart=options['restart'],
+        )
+        if filters and filters != checkpoint.filters:
+            raise CommandError(
+                f'Campaign "{checkpoint.campaign}" was started with filters '
+                f'{checkpoint.filters}; use --restart to change them.'
+            )
+        if checkpoint.status == FanoutCheckpoint.Status.DONE:
+            self.stdout.write(f'Campaign "{checkpoint.campaign}" already finished.')
+            return
+
+        publisher = fanout.get_publisher()
+        if options['create_topic']:
+            fanout.ensure_topic(publisher, checkpoint.topic)
+        if checkpoint.last_user_id:
+            self.stdout.write(f'Resuming after user {checkpoint.last_user_id}.')
+        try:
+            published = fanout.fan_out(checkpoint, publisher=publisher)
+        except Exception as exc:
+            raise CommandError(
+                f'Fan-out failed after user {checkpoint.last_user_id}: {exc}. '
+                'Run the command again to resume.'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Published {published} messages to "{checkpoint.topic}" '
+            f'({checkpoint.published} in total).'
+        ))
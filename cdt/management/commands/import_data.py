@@ -0,0 +1,58 @@
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from cdt.imports import PreferenciasImport, UserImport
+from config.imports import CHUNK_SIZE, FORMATS, InvalidImportException, detect_format, run_import
+from tenants.imports import TenantImport
+
+SPECS = {'users': UserImport, 'preferencias': PreferenciasImport, 'tenants': TenantImport}
+
+
+class Command(BaseCommand):
+    help = (
+        'Import users, preferencias or tenants from a CSV (with a header row) or '
+        'NDJSON file, streamed in chunks: rows are validated like the API does, '
+        'staged with COPY on PostgreSQL and merged on their key (username, user, '
+        'schema_name). Rejected rows are written to a report file.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(SPECS))
+        parser.add_argument('path', help='File to import.')
+        parser.add_argument('--format', choices=sorted(set(FORMATS.values())),
+                            help='Format of the file (default: from its extension).')
+        parser.add_argument('--report',
+                            help='Where to write the rejected rows (default: <path>.rejected.ndjson).')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        format = options['format'] or detect_format(path.name)
+        if format is None:
+            raise CommandError(f'Cannot tell the format of {path}, use --format.')
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1.')
+        report = Path(options['report'] or f'{path}.rejected.ndjson')
+
+        started = time.perf_counter()
+        try:
+            with open(path, encoding='utf-8-sig', newline='') as stream, \
+                    open(report, 'w', encoding='utf-8') as rejected:
+                spec = SPECS[options['kind']](using=options['database'])
+                result = run_import(spec, stream, format, rejected, options['chunk_size'])
+        except (OSError, InvalidImportException) as exc:
+            raise CommandError(str(exc)) from exc
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Read {result.rows} rows in {elapsed:.1f}s: {result.created} created, '
+            f'{result.updated} updated, {result.rejected} rejected.'
+        ))
+        if result.rejected:
+            self.stdout.write(self.style.WARNING(f'Rejected rows written to {report}'))
+        else:
+            report.unlink()
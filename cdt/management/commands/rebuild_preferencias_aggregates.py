@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from cdt import aggregates
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute the PreferenciasAggregate totals from Preferencias. '
+        'With --check, only report the drift and fail if there is any.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Report groups whose stored total differs, without fixing them.',
+        )
+
+    def handle(self, *args, **options):
+        drift = aggregates.check() if options['check'] else aggregates.rebuild()
+        for group, (stored, actual) in sorted(drift.items(), key=repr):
+            labels = ', '.join(f'{field}={value}' for field, value in zip(aggregates.GROUP_FIELDS, group))
+            self.stdout.write(f'{labels}: stored {stored}, actual {actual}')
+
+        if options['check']:
+            if drift:
+                raise CommandError(f'{len(drift)} aggregate group(s) drifted.')
+            self.stdout.write(self.style.SUCCESS('Aggregates are up to date.'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt aggregates, {len(drift)} group(s) fixed.'))
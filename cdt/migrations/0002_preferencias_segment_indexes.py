@@ -0,0 +1,33 @@
+# Generated by Django 4.2.21 on 2026-10-18 09:20
+
+from django.db import migrations, models
+
+from config.migration_operations import AddIndexConcurrentlyIfPostgres
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('cdt', '0001_initial'),
+    ]
+
+    operations = [
+        AddIndexConcurrentlyIfPostgres(
+            model_name='preferencias',
+            index=models.Index(fields=['idioma', 'notificaciones_email', 'notificaciones_push', 'tema_oscuro'], name='prefs_segment_idx'),
+        ),
+        AddIndexConcurrentlyIfPostgres(
+            model_name='preferencias',
+            index=models.Index(condition=models.Q(('notificaciones_email', True)), fields=['user'], name='prefs_email_on_idx'),
+        ),
+        AddIndexConcurrentlyIfPostgres(
+            model_name='preferencias',
+            index=models.Index(condition=models.Q(('notificaciones_push', True)), fields=['user'], name='prefs_push_on_idx'),
+        ),
+        AddIndexConcurrentlyIfPostgres(
+            model_name='preferencias',
+            index=models.Index(condition=models.Q(('tema_oscuro', True)), fields=['user'], name='prefs_dark_on_idx'),
+        ),
+    ]
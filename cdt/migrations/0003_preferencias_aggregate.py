@@ -0,0 +1,50 @@
+# Generated by Django 4.2.21 on 2026-10-18 09:22
+
+from django.db import migrations, models
+from django.db.models import Count
+
+GROUP_FIELDS = ('idioma', 'tema_oscuro', 'notificaciones_email', 'notificaciones_push')
+
+
+def fill_aggregates(apps, schema_editor):
+    """
+    Count the existing Preferencias, which later writes only adjust.
+    """
+    using = schema_editor.connection.alias
+    Preferencias = apps.get_model('cdt', 'Preferencias')
+    PreferenciasAggregate = apps.get_model('cdt', 'PreferenciasAggregate')
+    rows = (Preferencias.objects.using(using).order_by()
+            .values(*GROUP_FIELDS).annotate(total=Count('pk')))
+    PreferenciasAggregate.objects.using(using).bulk_create(
+        PreferenciasAggregate(**row) for row in rows
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cdt', '0002_preferencias_segment_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PreferenciasAggregate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('idioma', models.CharField(max_length=10)),
+                ('tema_oscuro', models.BooleanField()),
+                ('notificaciones_email', models.BooleanField()),
+                ('notificaciones_push', models.BooleanField()),
+                ('total', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Agregado de Preferencias',
+                'verbose_name_plural': 'Agregados de Preferencias',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='preferenciasaggregate',
+            constraint=models.UniqueConstraint(fields=('idioma', 'tema_oscuro', 'notificaciones_email', 'notificaciones_push'), name='prefs_aggregate_group_uniq'),
+        ),
+        migrations.RunPython(fill_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.21 on 2026-10-18 09:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cdt', '0003_preferencias_aggregate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FanoutCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('campaign', models.CharField(max_length=100, unique=True)),
+                ('topic', models.CharField(max_length=255)),
+                ('filters', models.JSONField(blank=True, default=dict)),
+                ('payload', models.JSONField(blank=True, default=dict)),
+                ('last_user_id', models.BigIntegerField(default=0)),
+                ('published', models.BigIntegerField(default=0)),
+                ('status', models.CharField(choices=[('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='running', max_length=10)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Checkpoint de Fan-out',
+                'verbose_name_plural': 'Checkpoints de Fan-out',
+            },
+        ),
+    ]
@@ -0,0 +1,49 @@
+from django.db import migrations
+from django.db.models import Count
+from django.db.models.functions import Upper
+
+from config.migration_operations import RunSQLConcurrentlyIfPostgres
+
+
+def check_duplicate_emails(apps, schema_editor):
+    """
+    Stop before building the index if emails already clash ignoring case:
+    a failed CREATE UNIQUE INDEX CONCURRENTLY leaves an invalid index behind.
+    """
+    User = apps.get_model('auth', 'User')
+    duplicates = (
+        User.objects.using(schema_editor.connection.alias)
+        .exclude(email='')
+        .values(key=Upper('email'))
+        .annotate(users=Count('id'))
+        .filter(users__gt=1)
+        .order_by()
+    )
+    clashes = list(duplicates.values_list('key', flat=True)[:20])
+    if clashes:
+        raise RuntimeError(
+            'These emails are used by more than one user (ignoring case); '
+            f'merge or change them before migrating: {", ".join(clashes)}'
+        )
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('cdt', '0004_fanoutcheckpoint'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_emails, migrations.RunPython.noop),
+        # Case-insensitive email uniqueness for cdt.serializers.UserSerializer,
+        # also serving its UPPER(email) IN (...) lookups. Users without an
+        # email are left out.
+        RunSQLConcurrentlyIfPostgres(
+            sql="CREATE UNIQUE INDEX {concurrently} auth_user_email_upper_uniq "
+                "ON auth_user (UPPER(email)) WHERE email <> ''",
+            reverse_sql='DROP INDEX {concurrently} IF EXISTS auth_user_email_upper_uniq',
+        ),
+    ]
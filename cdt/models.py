@@ -1,5 +1,7 @@
-from django.db import models
+from django.db import models, router, transaction
 from django.contrib.auth.models import User
+from . import aggregates, bitmaps
+from .signals import preferencias_bulk_changed
 
 """
 // TypeScript Interface equivalente:
@@ -30,18 +32,137 @@ interface Preferencias {
 """
 
 class PreferenciasQuerySet(models.QuerySet):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Segment filters applied so far, or None once the query was narrowed
+        # or combined some other way: bitmap_count() answers from cdt.bitmaps
+        # while set
+        self._segment_filters = {}
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._segment_filters = self._segment_filters
+        return clone
+
+    def _not_segment(self, queryset):
+        queryset._segment_filters = None
+        return queryset
+
+    def _filter_or_exclude(self, negate, args, kwargs):
+        return self._not_segment(super()._filter_or_exclude(negate, args, kwargs))
+
+    def complex_filter(self, filter_obj):
+        return self._not_segment(super().complex_filter(filter_obj))
+
+    def _combinator_query(self, combinator, *other_qs, all=False):
+        return self._not_segment(super()._combinator_query(combinator, *other_qs, all=all))
+
+    def _combined(self, combined, other):
+        # The operators return an operand as is when the other one is none()
+        return combined if combined is self or combined is other else self._not_segment(combined)
+
+    def __and__(self, other):
+        return self._combined(super().__and__(other), other)
+
+    def __or__(self, other):
+        return self._combined(super().__or__(other), other)
+
+    def __xor__(self, other):
+        return self._combined(super().__xor__(other), other)
+
+    def _segment_filter(self, field, value):
+        clone = self.filter(**{field: value})
+        filters = self._segment_filters
+        if filters is not None and filters.get(field, value) == value:
+            clone._segment_filters = {**filters, field: value}
+        return clone
+
     # Custom queryset methods
     def with_dark_theme(self):
-        return self.filter(tema_oscuro=True)
+        return self._segment_filter('tema_oscuro', True)
     
     def with_email_notifications(self):
-        return self.filter(notificaciones_email=True)
+        return self._segment_filter('notificaciones_email', True)
     
     def with_push_notifications(self):
-        return self.filter(notificaciones_push=True)
+        return self._segment_filter('notificaciones_push', True)
     
     def by_language(self, language):
-        return self.filter(idioma=language)
+        return self._segment_filter('idioma', language)
+
+    def segment(self, tema_oscuro=None, notificaciones_email=None,
+                notificaciones_push=None, idioma=None):
+        # Combine the filters above; None leaves a criterion out
+        queryset = self
+        if tema_oscuro is not None:
+            queryset = queryset._segment_filter('tema_oscuro', tema_oscuro)
+        if notificaciones_email is not None:
+            queryset = queryset._segment_filter('notificaciones_email', notificaciones_email)
+        if notificaciones_push is not None:
+            queryset = queryset._segment_filter('notificaciones_push', notificaciones_push)
+        if idioma is not None:
+            queryset = queryset.by_language(idioma)
+        return queryset
+
+    def bitmap(self):
+        """
+        The matching user ids as a cdt.bitmaps.Bitmap, or None when the
+        index is cold or the query is more than segment filters.
+        """
+        query = self.query
+        if (self._segment_filters is None or self._result_cache is not None
+                or query.is_sliced or query.distinct or query.combinator
+                or query.extra or query.annotations or query.is_empty()):
+            return None
+        return bitmaps.segment(self._segment_filters, using=self.db)
+
+    def bitmap_count(self):
+        """
+        count() answered from the bitmap index when it can be, for segment
+        counts: other processes' writes show up to
+        settings.PREFERENCIAS_BITMAP_MAX_AGE seconds late.
+        """
+        bitmap = self.bitmap()
+        return self.count() if bitmap is None else len(bitmap)
+
+    # Bulk writes skip save/delete signals: keep PreferenciasAggregate in
+    # step here and tell listeners (cache, ...) which users changed
+    def update(self, **kwargs):
+        self._for_write = True
+        if not any(field in kwargs for field in aggregates.GROUP_FIELDS):
+            # No group changes: nothing to lock or count
+            user_ids = list(self.values_list('user_id', flat=True))
+            updated = super().update(**kwargs)
+            preferencias_bulk_changed.send(sender=self.model, user_ids=user_ids, using=self.db)
+            return updated
+        with transaction.atomic(using=self.db):
+            rows = list(self.select_for_update().values_list('pk', 'user_id'))
+            before = aggregates.group_counts(self)
+            after = aggregates.updated_group_counts(before, self.model, kwargs)
+            updated = super().update(**kwargs)
+            if after is None:
+                after = aggregates.group_counts_for(
+                    self.model._base_manager.using(self.db), 'pk', [pk for pk, _ in rows]
+                )
+            aggregates.apply_deltas(aggregates.diff(before, after), using=self.db)
+        preferencias_bulk_changed.send(
+            sender=self.model, user_ids=[user_id for _, user_id in rows], using=self.db
+        )
+        return updated
+    update.alters_data = True
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        user_ids = [obj.user_id for obj in objs]
+        self._for_write = True
+        with transaction.atomic(using=self.db):
+            before = aggregates.group_counts_for(self.model._base_manager.using(self.db), 'user_id', user_ids)
+            created = super().bulk_create(objs, *args, **kwargs)
+            after = aggregates.group_counts_for(self.model._base_manager.using(self.db), 'user_id', user_ids)
+            aggregates.apply_deltas(aggregates.diff(before, after), using=self.db)
+        preferencias_bulk_changed.send(sender=self.model, user_ids=user_ids, using=self.db)
+        return created
+    bulk_create.alters_data = True
 
 
 class PreferenciasManager(models.Manager):
@@ -63,6 +184,89 @@ class Preferencias(models.Model):
     class Meta:
         verbose_name = 'Preferencia'
         verbose_name_plural = 'Preferencias'
+        indexes = [
+            # Audience segments (PreferenciasQuerySet.segment): equality on any
+            # prefix, and segment counts answered from the index alone
+            models.Index(
+                fields=['idioma', 'notificaciones_email', 'notificaciones_push', 'tema_oscuro'],
+                name='prefs_segment_idx',
+            ),
+            # Segments without a language: only the rows with the flag on
+            models.Index(
+                fields=['user'], condition=models.Q(notificaciones_email=True),
+                name='prefs_email_on_idx',
+            ),
+            models.Index(
+                fields=['user'], condition=models.Q(notificaciones_push=True),
+                name='prefs_push_on_idx',
+            ),
+            models.Index(
+                fields=['user'], condition=models.Q(tema_oscuro=True),
+                name='prefs_dark_on_idx',
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        # cdt.receivers locks the row to read the group it leaves: hold the
+        # lock until the aggregate totals are adjusted
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return f'Preferencias de {self.user.username}'
+
+
+class PreferenciasAggregate(models.Model):
+    """
+    Number of Preferencias per idioma and flag combination, kept up to date
+    on every write (see cdt.aggregates).
+    """
+    idioma = models.CharField(max_length=10)
+    tema_oscuro = models.BooleanField()
+    notificaciones_email = models.BooleanField()
+    notificaciones_push = models.BooleanField()
+    total = models.BigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Agregado de Preferencias'
+        verbose_name_plural = 'Agregados de Preferencias'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['idioma', 'tema_oscuro', 'notificaciones_email', 'notificaciones_push'],
+                name='prefs_aggregate_group_uniq',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.idioma} {self.tema_oscuro}/{self.notificaciones_email}/{self.notificaciones_push}: {self.total}'
+
+
+class FanoutCheckpoint(models.Model):
+    """
+    Progress of a campaign fan-out to Pub/Sub (see cdt.fanout): every
+    recipient up to ``last_user_id`` has been acknowledged by Pub/Sub, so a
+    crashed run resumes right after it.
+    """
+    class Status(models.TextChoices):
+        RUNNING = 'running', 'Running'
+        DONE = 'done', 'Done'
+        FAILED = 'failed', 'Failed'
+
+    campaign = models.CharField(max_length=100, unique=True)
+    topic = models.CharField(max_length=255)
+    filters = models.JSONField(default=dict, blank=True)
+    payload = models.JSONField(default=dict, blank=True)
+    last_user_id = models.BigIntegerField(default=0)
+    published = models.BigIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.RUNNING)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Checkpoint de Fan-out'
+        verbose_name_plural = 'Checkpoints de Fan-out'
+
+    def __str__(self):
+        return f'{self.campaign} ({self.status}, {self.published} publicados)'
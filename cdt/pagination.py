@@ -0,0 +1,8 @@
+from config.pagination import KeysetPagination
+
+
+class UserPagination(KeysetPagination):
+    """
+    Keyset pagination for users, walking the primary key
+    """
+    ordering = ('id',)
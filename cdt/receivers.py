@@ -0,0 +1,67 @@
+from collections import Counter
+
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.contrib.auth.models import User
+from django.dispatch import receiver
+
+from . import aggregates, bitmaps
+from .cache import invalidate_preferencias, invalidate_users
+from .models import Preferencias
+from .signals import preferencias_bulk_changed
+
+
+@receiver(post_save, sender=Preferencias)
+@receiver(post_delete, sender=Preferencias)
+def preferencias_changed(sender, instance, **kwargs):
+    invalidate_preferencias(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    invalidate_users(instance.pk)
+
+
+@receiver(preferencias_bulk_changed, sender=Preferencias)
+def preferencias_bulk_changed_handler(sender, user_ids, using='default', **kwargs):
+    invalidate_preferencias(*user_ids)
+    bitmaps.record_bulk_change(user_ids, using)
+
+
+@receiver(post_save, sender=Preferencias)
+def update_bitmaps_on_save(sender, instance, using, raw=False, **kwargs):
+    if not raw:
+        bitmaps.record_change(instance.user_id, instance.__dict__, using)
+
+
+@receiver(post_delete, sender=Preferencias)
+def update_bitmaps_on_delete(sender, instance, using, **kwargs):
+    bitmaps.record_change(instance.user_id, None, using)
+
+
+@receiver(pre_save, sender=Preferencias)
+def remember_aggregate_group(sender, instance, using, raw=False, **kwargs):
+    instance._aggregate_group = None
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    # Locked until Preferencias.save commits: a concurrent save of the row
+    # waits here and then reads the group this one leaves it in
+    row = (Preferencias._base_manager.using(using).select_for_update()
+           .filter(pk=instance.pk).values_list(*aggregates.GROUP_FIELDS).first())
+    instance._aggregate_group = row
+
+
+@receiver(post_save, sender=Preferencias)
+def update_aggregates_on_save(sender, instance, created, using, raw=False, **kwargs):
+    if raw:
+        return
+    deltas = Counter({aggregates.group_of(instance): 1})
+    previous = getattr(instance, '_aggregate_group', None)
+    if not created and previous is not None:
+        deltas[previous] -= 1
+    aggregates.apply_deltas(deltas, using=using)
+
+
+@receiver(post_delete, sender=Preferencias)
+def update_aggregates_on_delete(sender, instance, using, **kwargs):
+    aggregates.apply_deltas({aggregates.group_of(instance): -1}, using=using)
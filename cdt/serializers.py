@@ -1,9 +1,75 @@
+from contextlib import contextmanager
+
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from django.db import IntegrityError
+from django.db.models.functions import Upper
 from .models import Preferencias
+from .exceptions import ValidationException
+from .fieldsets import SparseFieldsetMixin
+
+EMAIL_TAKEN = 'A user with this email already exists.'
+USERNAME_TAKEN = 'A user with that username already exists.'
+EMAIL_INDEX = 'auth_user_email_upper_uniq'
+
+
+def taken_emails(emails, exclude_pk=None):
+    """
+    The upper-cased ``emails`` already used by a user, in one query on the
+    auth_user UPPER(email) unique index (cdt migration 0005).
+    """
+    keys = {email.upper() for email in emails if email}
+    if not keys:
+        return set()
+    queryset = User.objects.annotate(email_upper=Upper('email')).filter(email_upper__in=keys)
+    if exclude_pk is not None:
+        queryset = queryset.exclude(pk=exclude_pk)
+    return set(queryset.values_list('email_upper', flat=True))
+
+
+@contextmanager
+def unique_user_errors():
+    """
+    Report a user insert or update that lost a race against a concurrent one
+    on the email or username unique index as the validation error it would
+    have got a moment later. Sync callers wrap the write in an atomic block.
+    """
+    try:
+        yield
+    except IntegrityError as exc:
+        message = str(exc)
+        if EMAIL_INDEX in message:
+            raise ValidationException({'email': [EMAIL_TAKEN]}) from exc
+        if 'username' in message:
+            raise ValidationException({'username': [USERNAME_TAKEN]}) from exc
+        raise
+
+
+class UserListSerializer(serializers.ListSerializer):
+    """
+    Validates a list of users checking every email in one query, instead of
+    one per item, and catching duplicates within the list.
+    """
+
+    def to_internal_value(self, data):
+        validated = super().to_internal_value(data)
+        emails = [item.get('email', '') for item in validated]
+        taken = taken_emails(emails)
+        seen = set()
+        errors = []
+        for email in emails:
+            key = email.upper()
+            if key and (key in taken or key in seen):
+                errors.append({'email': [EMAIL_TAKEN]})
+            else:
+                errors.append({})
+            seen.add(key)
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return validated
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """
     Serializer for the User model
     """
@@ -15,17 +81,21 @@ class UserSerializer(serializers.ModelSerializer):
             'email': {'required': True},
             'username': {'required': True}
         }
+        list_serializer_class = UserListSerializer
 
     def validate_email(self, value):
         """
-        Check that the email is unique
+        Check that the email is unique, ignoring case. Lists check all their
+        emails at once (UserListSerializer); the unique index settles races.
         """
-        if User.objects.filter(email=value).exists():
-            raise serializers.ValidationError("A user with this email already exists.")
+        if isinstance(self.parent, serializers.ListSerializer):
+            return value
+        if taken_emails([value], exclude_pk=getattr(self.instance, 'pk', None)):
+            raise serializers.ValidationError(EMAIL_TAKEN)
         return value
 
 
-class PreferenciasSerializer(serializers.ModelSerializer):
+class PreferenciasSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """
     Serializer for the Preferencias model
     """
@@ -40,7 +110,7 @@ class PreferenciasSerializer(serializers.ModelSerializer):
         read_only_fields = ['created_at', 'updated_at']
 
 
-class UserWithPreferenciasSerializer(serializers.ModelSerializer):
+class UserWithPreferenciasSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """
     Serializer that includes user data with their preferences
     """
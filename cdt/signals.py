@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+# Sent after Preferencias rows were written without save/delete signals
+# (QuerySet.update, bulk_create). Arguments: user_ids, using.
+preferencias_bulk_changed = Signal()
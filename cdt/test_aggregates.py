@@ -0,0 +1,146 @@
+from importlib import import_module
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.apps import apps
+from django.db import DatabaseError, connection
+from django.db.models import F, Value
+from django.db.models.functions import Concat
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from tenants.resolver import resolve_tenant
+from . import aggregates
+from .factories import PreferenciasFactory, UserFactory
+from .models import Preferencias, PreferenciasAggregate, PreferenciasQuerySet
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+})
+class PreferenciasAggregateTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def totals(self):
+        return {
+            aggregates.group_of(row): row.total
+            for row in PreferenciasAggregate.objects.exclude(total=0)
+        }
+
+    def assertInSync(self):
+        self.assertEqual(aggregates.check(), {})
+
+    def test_save_and_delete(self):
+        """Test that create, update and delete through the model adjust the totals"""
+        preferencias = PreferenciasFactory(idioma='es', tema_oscuro=False,
+                                           notificaciones_email=True, notificaciones_push=True)
+        PreferenciasFactory(idioma='es', tema_oscuro=False,
+                            notificaciones_email=True, notificaciones_push=True)
+        self.assertEqual(self.totals(), {('es', False, True, True): 2})
+
+        preferencias.notificaciones_push = False
+        preferencias.save()
+        self.assertEqual(self.totals(), {('es', False, True, True): 1, ('es', False, True, False): 1})
+
+        preferencias.delete()
+        self.assertEqual(self.totals(), {('es', False, True, True): 1})
+        self.assertInSync()
+
+    def test_user_delete_cascades(self):
+        """Test that deleting the user removes its preferences from the totals"""
+        preferencias = PreferenciasFactory(idioma='en')
+        preferencias.user.delete()
+        self.assertEqual(self.totals(), {})
+
+    def test_queryset_update(self):
+        """Test that QuerySet.update() moves rows between groups"""
+        PreferenciasFactory.create_batch(3, idioma='es', tema_oscuro=False)
+        PreferenciasFactory(idioma='en', tema_oscuro=False)
+        Preferencias.objects.all().by_language('es').update(tema_oscuro=True)
+        self.assertInSync()
+        totals = aggregates.aggregate_totals({'tema_oscuro': True})
+        self.assertEqual(totals, {'total': 3, 'por_idioma': {'es': 3}})
+
+    def test_queryset_update_with_expression(self):
+        """Test that an update to an expression recounts the updated rows"""
+        PreferenciasFactory.create_batch(2, idioma='es')
+        Preferencias.objects.all().update(idioma=Concat(F('idioma'), Value('-ar')))
+        self.assertInSync()
+        self.assertEqual(aggregates.aggregate_totals({})['por_idioma'], {'es-ar': 2})
+
+    def test_queryset_update_outside_groups(self):
+        """Test that an update leaving the groups alone neither locks nor counts rows"""
+        PreferenciasFactory.create_batch(2, idioma='es')
+        with mock.patch.object(PreferenciasQuerySet, 'select_for_update') as select_for_update, \
+                self.assertNumQueries(2):  # the changed users, the UPDATE
+            Preferencias.objects.all().update(updated_at=F('created_at'))
+        select_for_update.assert_not_called()
+        self.assertInSync()
+
+    def test_bulk_create_with_conflicts(self):
+        """Test that upserts through bulk_create count inserts and updates"""
+        existing = PreferenciasFactory(idioma='es')
+        new_user = UserFactory()
+        Preferencias.objects.bulk_create(
+            [Preferencias(user=existing.user, idioma='fr'), Preferencias(user=new_user, idioma='fr')],
+            update_conflicts=True, unique_fields=['user'], update_fields=['idioma'],
+        )
+        self.assertInSync()
+        self.assertEqual(aggregates.aggregate_totals({})['por_idioma'], {'fr': 2})
+
+    def test_rebuild_command(self):
+        """Test that --check reports drift and a rebuild fixes it"""
+        PreferenciasFactory.create_batch(2, idioma='es')
+        PreferenciasAggregate.objects.update(total=7)
+
+        out = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('rebuild_preferencias_aggregates', '--check', stdout=out)
+        self.assertIn('stored 7, actual 2', out.getvalue())
+
+        call_command('rebuild_preferencias_aggregates', stdout=StringIO())
+        self.assertInSync()
+        call_command('rebuild_preferencias_aggregates', '--check', stdout=StringIO())
+
+    def test_migration_fills_totals(self):
+        """Test that the migration creating the table counts the existing rows"""
+        PreferenciasFactory.create_batch(2, idioma='es', tema_oscuro=False)
+        PreferenciasFactory(idioma='en', tema_oscuro=True)
+        PreferenciasAggregate.objects.all().delete()
+        migration = import_module('cdt.migrations.0003_preferencias_aggregate')
+        migration.fill_aggregates(apps, mock.Mock(connection=connection))
+        self.assertInSync()
+
+    def test_aggregates_endpoint(self):
+        """Test that the endpoint answers from the aggregate table only"""
+        PreferenciasFactory.create_batch(2, idioma='es', notificaciones_push=True)
+        PreferenciasFactory(idioma='en', notificaciones_push=True)
+        PreferenciasFactory(idioma='en', notificaciones_push=False)
+
+        client = APIClient()
+        url = reverse('preferencias-aggregates')
+        resolve_tenant('testserver')
+        with self.assertNumQueries(1):
+            response = client.get(url, {'notificaciones_push': 'true'}, HTTP_HOST='testserver')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total'], 3)
+        self.assertEqual(response.data['por_idioma'], {'en': 1, 'es': 2})
+
+        response = client.get(url, {'notificaciones_push': 'maybe'})
+        self.assertEqual(response.status_code, 400)
+
+
+class PreferenciasAggregateSaveTest(TransactionTestCase):
+    def test_save_and_totals_commit_together(self):
+        """Test that a save rolls back when its aggregate totals cannot be adjusted"""
+        preferencias = PreferenciasFactory(idioma='es')
+        preferencias.idioma = 'en'
+        with mock.patch('cdt.aggregates.apply_deltas', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                preferencias.save()
+        self.assertEqual(Preferencias.objects.get().idioma, 'es')
+        self.assertEqual(aggregates.check(), {})
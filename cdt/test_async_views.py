@@ -0,0 +1,78 @@
+from django.test import TestCase
+from django.contrib.auth.models import User
+from .models import Preferencias
+from .factories import PreferenciasFactory, UserFactory
+
+
+class AsyncUserAPIViewTest(TestCase):
+    def setUp(self):
+        for i in range(3):
+            UserFactory(username=f'user{i}')
+
+    async def test_list_users(self):
+        response = await self.async_client.get('/api/users/', {'page_size': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([u['username'] for u in response.json()], ['user0', 'user1'])
+        self.assertIn('rel="next"', response['Link'])
+
+    async def test_stream_users(self):
+        response = await self.async_client.get('/api/users/', headers={'Accept': 'application/x-ndjson'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = [line async for line in response.streaming_content]
+        self.assertEqual(len(b''.join(lines).splitlines()), 3)
+
+    async def test_create_user(self):
+        data = {'username': 'newuser', 'email': 'new@example.com', 'password': 'newpass'}
+        response = await self.async_client.post('/api/users/', data, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        user = await User.objects.aget(username='newuser')
+        self.assertTrue(user.check_password('newpass'))
+
+    async def test_create_user_invalid(self):
+        response = await self.async_client.post(
+            '/api/users/', {'email': 'new@example.com'}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class AsyncPreferenciasAPIViewTest(TestCase):
+    def setUp(self):
+        self.preferencias = PreferenciasFactory(idioma='es')
+        self.url = f'/api/preferencias/{self.preferencias.user_id}/'
+
+    async def test_get_and_put(self):
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response.json()['idioma'], 'es')
+        response = await self.async_client.put(
+            self.url, {'idioma': 'en'}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        preferencias = await Preferencias.objects.aget(pk=self.preferencias.pk)
+        self.assertEqual(preferencias.idioma, 'en')
+
+    async def test_user_detail_includes_preferencias(self):
+        response = await self.async_client.get(f'/api/users/{self.preferencias.user_id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['preferencias']['idioma'], 'es')
+
+    async def test_not_modified(self):
+        response = await self.async_client.get(self.url)
+        response = await self.async_client.get(self.url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+    async def test_missing_preferencias(self):
+        response = await self.async_client.get('/api/preferencias/999999/')
+        self.assertEqual(response.status_code, 404)
+
+
+class AsyncNismanAPIViewTest(TestCase):
+    async def test_create_and_conflict(self):
+        response = await self.async_client.post(
+            '/api/nisman/', {'username': 'ana'}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 201)
+        response = await self.async_client.post(
+            '/api/nisman/', {'username': 'ana'}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 303)
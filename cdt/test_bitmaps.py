@@ -0,0 +1,169 @@
+from itertools import product
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from . import bitmaps
+from .factories import PreferenciasFactory
+from .models import Preferencias
+
+LOCMEM = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+class BitmapTest(TestCase):
+    def test_operations(self):
+        """Test AND, OR, NOT, difference, membership and iteration"""
+        universe = 0b111110
+        evens = bitmaps.Bitmap(0b101010, universe)
+        low = bitmaps.Bitmap(0b001110, universe)
+        self.assertEqual(list(evens & low), [1, 3])
+        self.assertEqual(list(evens | low), [1, 2, 3, 5])
+        self.assertEqual(list(~evens), [2, 4])
+        self.assertEqual(list(evens - low), [5])
+        self.assertEqual(len(evens), 3)
+        self.assertIn(5, evens)
+        self.assertNotIn(4, evens)
+
+
+@override_settings(CACHES=LOCMEM)
+class BitmapIndexTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        bitmaps._indexes.clear()
+        for dark, email, push, idioma in product([True, False], [True, False], [True, False], ['es', 'pt']):
+            PreferenciasFactory(tema_oscuro=dark, notificaciones_email=email,
+                                notificaciones_push=push, idioma=idioma)
+        PreferenciasFactory(tema_oscuro=True, notificaciones_push=True, idioma='pt')
+        bitmaps.warm_up()
+        self.index = bitmaps.get_index()
+
+    def tearDown(self):
+        bitmaps._indexes.clear()
+
+    def test_segments_match_sql(self):
+        """Test that every segment count agrees with the database"""
+        for dark, push, idioma in product([True, False, None], [True, False, None], ['es', 'pt', None]):
+            filters = {
+                field: value for field, value in
+                [('tema_oscuro', dark), ('notificaciones_push', push), ('idioma', idioma)]
+                if value is not None
+            }
+            expected = Preferencias.objects.filter(**filters)
+            bitmap = self.index.segment(**filters)
+            self.assertEqual(len(bitmap), expected.count(), filters)
+            self.assertEqual(sorted(bitmap), sorted(expected.values_list('user_id', flat=True)))
+
+    def test_set_row(self):
+        """Test that a changed and a deleted row move between bitmaps"""
+        preferencias = Preferencias.objects.filter(idioma='es', tema_oscuro=True).first()
+        values = {field: getattr(preferencias, field) for field in bitmaps.FIELDS}
+        self.index.set_row(preferencias.user_id, {**values, 'idioma': 'pt', 'tema_oscuro': False})
+        self.assertIn(preferencias.user_id, self.index.get('idioma', 'pt'))
+        self.assertNotIn(preferencias.user_id, self.index.get('idioma', 'es'))
+        self.assertIn(preferencias.user_id, self.index.get('tema_oscuro', False))
+
+        self.index.set_row(preferencias.user_id, None)
+        self.assertNotIn(preferencias.user_id, self.index.all())
+        self.assertEqual(len(self.index.all()), 16)
+
+    def test_uncommitted_writes_use_sql(self):
+        """Test that a transaction that wrote Preferencias does not read the index"""
+        PreferenciasFactory(tema_oscuro=True, idioma='pt')
+        with self.assertNumQueries(1):
+            count = Preferencias.objects.all().with_dark_theme().by_language('pt').bitmap_count()
+        self.assertEqual(count, 6)
+
+
+@override_settings(CACHES=LOCMEM)
+class BitmapQuerySetTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        bitmaps._indexes.clear()
+        PreferenciasFactory.create_batch(3, notificaciones_push=True, tema_oscuro=True, idioma='pt')
+        PreferenciasFactory.create_batch(2, notificaciones_push=False, idioma='pt')
+        bitmaps.warm_up()
+
+    def tearDown(self):
+        bitmaps._indexes.clear()
+
+    def test_count_without_sql(self):
+        """Test that segment counts are answered from a warm index"""
+        queryset = Preferencias.objects.all().with_push_notifications().with_dark_theme().by_language('pt')
+        with self.assertNumQueries(0):
+            self.assertEqual(queryset.bitmap_count(), 3)
+            self.assertEqual(Preferencias.objects.all().segment(notificaciones_push=False).bitmap_count(), 2)
+
+    def test_count_and_exists_use_sql(self):
+        """Test that only bitmap_count() reads the index"""
+        queryset = Preferencias.objects.all().with_dark_theme()
+        with self.assertNumQueries(2):
+            self.assertEqual(queryset.count(), 3)
+            self.assertTrue(queryset.exists())
+
+    def test_other_filters_use_sql(self):
+        """Test that anything beyond segment filters goes to the database"""
+        with self.assertNumQueries(1):
+            Preferencias.objects.all().with_dark_theme().filter(user__is_active=True).bitmap_count()
+
+    def test_combined_querysets_use_sql(self):
+        """Test that querysets combined with |, & or union are counted by the database"""
+        dark = Preferencias.objects.all().with_dark_theme()
+        no_push = Preferencias.objects.all().segment(notificaciones_push=False)
+        with self.assertNumQueries(3):
+            self.assertEqual((dark | no_push).bitmap_count(), 5)
+            self.assertEqual((dark & no_push).bitmap_count(), 0)
+            self.assertEqual(dark.union(no_push).bitmap_count(), 5)
+        with self.assertNumQueries(0):
+            self.assertEqual((dark | Preferencias.objects.none()).bitmap_count(), 3)
+
+    def test_kept_current_by_signals(self):
+        """Test that saves, deletes and bulk updates reach the index on commit"""
+        created = PreferenciasFactory(notificaciones_push=True, tema_oscuro=True, idioma='pt')
+        Preferencias.objects.all().by_language('pt').filter(notificaciones_push=False).update(idioma='es')
+        Preferencias.objects.filter(user_id=created.user_id).first().delete()
+
+        segment = Preferencias.objects.all().by_language('es')
+        with self.assertNumQueries(0):
+            self.assertEqual(segment.bitmap_count(), 2)
+        self.assertEqual(len(bitmaps.get_index().segment(tema_oscuro=True)), 3)
+
+    @override_settings(PREFERENCIAS_BITMAP_MAX_AGE=0)
+    def test_stale_index_uses_sql(self):
+        """Test that an index past its max age is not used"""
+        bitmaps.get_index().load = lambda queryset: False
+        with self.assertNumQueries(1):
+            self.assertEqual(Preferencias.objects.all().by_language('pt').bitmap_count(), 5)
+
+
+class IndexRegistryTest(SimpleTestCase):
+    def setUp(self):
+        bitmaps._indexes.clear()
+        self.addCleanup(bitmaps._indexes.clear)
+
+    @override_settings(PREFERENCIAS_BITMAP_MAX_INDEXES=2)
+    def test_bounded(self):
+        """Test that the least recently used index is dropped past the limit"""
+        acme = bitmaps.get_index(schema='acme')
+        bitmaps.get_index(schema='globex')
+        self.assertIs(bitmaps.get_index(schema='acme'), acme)
+        bitmaps.get_index(schema='initech')
+        self.assertEqual(list(bitmaps._indexes), [('default', 'acme'), ('default', 'initech')])
+
+    def test_forgotten_after_fork(self):
+        """Test that a forked worker does not inherit an index stuck loading"""
+        index = bitmaps.get_index(schema='acme')
+        index._loading = True
+        bitmaps._forget_indexes_after_fork()
+        fresh = bitmaps.get_index(schema='acme')
+        self.assertIsNot(fresh, index)
+        self.assertFalse(fresh._loading)
+
+    def test_warm_up_once_per_process(self):
+        with mock.patch.object(bitmaps, '_warmed_up_pid', None), \
+                mock.patch.object(bitmaps, 'warm_up_in_background') as warm_up:
+            bitmaps.warm_up_on_first_request()
+            bitmaps.warm_up_on_first_request()
+            self.assertEqual(warm_up.call_count, 1)
+            bitmaps._warmed_up_pid = -1
+            bitmaps.warm_up_on_first_request()
+            self.assertEqual(warm_up.call_count, 2)
@@ -0,0 +1,74 @@
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from .cache import cache_stats, get_preferencias_data, preferencias_version
+from .factories import PreferenciasFactory
+from .models import Preferencias
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+})
+class PreferenciasCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.preferencias = PreferenciasFactory(idioma='es')
+        self.user_id = self.preferencias.user_id
+
+    def test_read_through(self):
+        """Test that the second read is served from the cache"""
+        before = cache_stats()
+        with self.assertNumQueries(1):
+            get_preferencias_data(self.user_id)
+        with self.assertNumQueries(0):
+            data = get_preferencias_data(self.user_id)
+        self.assertEqual(data['idioma'], 'es')
+        after = cache_stats()
+        self.assertEqual(after['misses'] - before['misses'], 1)
+        self.assertEqual(after['hits'] - before['hits'], 1)
+
+    def test_put_invalidates(self):
+        """Test that a successful PUT is visible on the next GET"""
+        url = reverse('preferencias-detail', args=[self.user_id])
+        self.assertEqual(self.client.get(url).data['idioma'], 'es')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put(url, {'idioma': 'en'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(url).data['idioma'], 'en')
+
+    def test_delete_invalidates(self):
+        """Test that deleted preferences are not served from the cache"""
+        get_preferencias_data(self.user_id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.preferencias.delete()
+        with self.assertRaises(Preferencias.DoesNotExist):
+            get_preferencias_data(self.user_id)
+
+    def test_version_token_expires(self):
+        """Test that version tokens get a TTL longer than the cached copies"""
+        with mock.patch.object(cache, 'add', wraps=cache.add) as add:
+            preferencias_version(self.user_id)
+        self.assertEqual(add.call_args.kwargs['timeout'], settings.PREFERENCIAS_VERSION_TIMEOUT)
+        self.assertGreater(settings.PREFERENCIAS_VERSION_TIMEOUT, settings.PREFERENCIAS_CACHE_TIMEOUT)
+
+    def test_cache_unavailable(self):
+        """Test that reads and writes fall back to the database while the cache is down"""
+        url = reverse('preferencias-detail', args=[self.user_id])
+        down = mock.Mock(**{
+            f'{method}.side_effect': ConnectionError for method in ('get', 'add', 'set', 'set_many')
+        })
+        with mock.patch('cdt.cache.cache', down), self.assertLogs('cdt.cache', 'WARNING'):
+            self.assertIsNone(preferencias_version(self.user_id))
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['idioma'], 'es')
+            self.assertNotIn('ETag', response)
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.put(url, {'idioma': 'en'}, format='json')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(self.client.get(url).data['idioma'], 'en')
@@ -0,0 +1,76 @@
+import json
+from concurrent.futures import Future
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from . import fanout
+from .factories import PreferenciasFactory
+from .models import FanoutCheckpoint
+
+
+class RecordingPublisher:
+    """In-memory stand-in for PublisherClient, failing at ``fail_on`` user ids"""
+
+    def __init__(self, fail_on=()):
+        self.messages = []
+        self.fail_on = set(fail_on)
+
+    def topic_path(self, project, topic):
+        return f'projects/{project}/topics/{topic}'
+
+    def publish(self, topic, data, **attributes):
+        future = Future()
+        if int(attributes['user_id']) in self.fail_on:
+            future.set_exception(RuntimeError('publish failed'))
+        else:
+            self.messages.append((topic, json.loads(data), attributes))
+            future.set_result(str(len(self.messages)))
+        return future
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+})
+class FanoutTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.subscribed = PreferenciasFactory.create_batch(5, notificaciones_email=True, idioma='es')
+        PreferenciasFactory.create_batch(2, notificaciones_email=False)
+
+    def test_publishes_segment(self):
+        """Test that every recipient of the segment gets one message, in user_id order"""
+        checkpoint = fanout.get_checkpoint(
+            'welcome', filters={'notificaciones_email': True}, payload={'template': 'welcome'}
+        )
+        publisher = RecordingPublisher()
+        self.assertEqual(fanout.fan_out(checkpoint, publisher=publisher, max_in_flight=2), 5)
+
+        user_ids = [message['user_id'] for _, message, _ in publisher.messages]
+        self.assertEqual(user_ids, sorted(p.user_id for p in self.subscribed))
+        topic, message, attributes = publisher.messages[0]
+        self.assertEqual(topic, 'projects/nisman/topics/notificaciones')
+        self.assertEqual(message['data'], {'template': 'welcome'})
+        self.assertEqual(attributes['campaign'], 'welcome')
+
+        checkpoint.refresh_from_db()
+        self.assertEqual(checkpoint.status, FanoutCheckpoint.Status.DONE)
+        self.assertEqual(checkpoint.published, 5)
+        self.assertEqual(fanout.fan_out(checkpoint, publisher=publisher), 0)
+
+    def test_resumes_from_checkpoint(self):
+        """Test that a failed run checkpoints before the failure and a rerun finishes"""
+        user_ids = sorted(p.user_id for p in self.subscribed)
+        checkpoint = fanout.get_checkpoint('retry', filters={'notificaciones_email': True})
+        with self.assertRaises(RuntimeError):
+            fanout.fan_out(checkpoint, publisher=RecordingPublisher(fail_on={user_ids[3]}),
+                           checkpoint_every=1)
+
+        checkpoint.refresh_from_db()
+        self.assertEqual(checkpoint.status, FanoutCheckpoint.Status.FAILED)
+        self.assertEqual(checkpoint.last_user_id, user_ids[2])
+
+        publisher = RecordingPublisher()
+        self.assertEqual(fanout.fan_out(checkpoint, publisher=publisher), 2)
+        self.assertEqual([m['user_id'] for _, m, _ in publisher.messages], user_ids[3:])
+        checkpoint.refresh_from_db()
+        self.assertEqual(checkpoint.published, 5)
@@ -0,0 +1,87 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+from .factories import PreferenciasFactory, UserFactory
+from .fieldsets import project, sparse_fieldsets
+from .serializers import UserWithPreferenciasSerializer
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+})
+class SparseFieldsetsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.preferencias = PreferenciasFactory(idioma='es')
+        self.user = self.preferencias.user
+
+    def test_user_detail_fields(self):
+        """Test that ?fields= and ?fields[preferencias]= narrow the output and the SELECT"""
+        url = reverse('user-detail', args=[self.user.id])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'fields': 'username,preferencias', 'fields[preferencias]': 'idioma'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'username': self.user.username, 'preferencias': {'idioma': 'es'}})
+
+        select = next(q['sql'] for q in queries.captured_queries if 'FROM "auth_user"' in q['sql'])
+        self.assertIn('"cdt_preferencias"."idioma"', select)
+        self.assertNotIn('"auth_user"."email"', select)
+        self.assertNotIn('"auth_user"."password"', select)
+        self.assertNotIn('"cdt_preferencias"."tema_oscuro"', select)
+
+    def test_default_projection_skips_unused_columns(self):
+        """Test that full responses never read password or last_login"""
+        url = reverse('user-detail', args=[self.user.id])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.data['preferencias']['idioma'], 'es')
+        select = next(q['sql'] for q in queries.captured_queries if 'FROM "auth_user"' in q['sql'])
+        self.assertNotIn('"auth_user"."password"', select)
+        self.assertNotIn('"auth_user"."last_login"', select)
+
+    def test_user_without_preferencias(self):
+        """Test that the joined projection copes with a missing relation"""
+        user = UserFactory()
+        response = self.client.get(reverse('user-detail', args=[user.id]), {'fields': 'id,preferencias'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'id': user.id, 'preferencias': None})
+
+    def test_user_list_fields(self):
+        """Test that the list endpoint narrows every row"""
+        response = self.client.get(reverse('user-list'), {'fields': 'id'})
+        self.assertEqual(response.data, [{'id': self.user.id}])
+
+    def test_preferencias_fields(self):
+        """Test that the preference endpoints accept both parameter spellings"""
+        url = reverse('preferencias-detail', args=[self.user.id])
+        self.assertEqual(self.client.get(url, {'fields': 'idioma'}).data, {'idioma': 'es'})
+        response = self.client.get(url, {'fields[preferencias]': 'idioma,tema_oscuro'})
+        self.assertEqual(response.data, {'idioma': 'es', 'tema_oscuro': False})
+        response = self.client.get(reverse('preferencias'), {'user_id': self.user.id, 'fields': 'idioma'})
+        self.assertEqual(response.data, {'idioma': 'es'})
+
+    def test_fieldsets_change_etag(self):
+        """Test that different fieldsets of a resource have different ETags"""
+        url = reverse('preferencias-detail', args=[self.user.id])
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, {'fields': 'idioma'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_unknown_field(self):
+        """Test that unknown field names are rejected"""
+        response = self.client.get(reverse('user-detail', args=[self.user.id]), {'fields': 'password'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('user-detail', args=[self.user.id]), {'fields[grupos]': 'id'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_project(self):
+        """Test the columns project() keeps"""
+        sparse = sparse_fieldsets({'fields': 'email'}, UserWithPreferenciasSerializer)
+        user = project(User.objects.all(), UserWithPreferenciasSerializer, **sparse).get()
+        self.assertEqual(user.get_deferred_fields() & {'email', 'id'}, set())
+        self.assertIn('password', user.get_deferred_fields())
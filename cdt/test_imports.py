@@ -0,0 +1,304 @@
+import json
+import os
+import tempfile
+import time
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from config.imports import CONFLICT, read_rows, run_import
+from . import aggregates
+from .factories import PreferenciasFactory, UserFactory
+from .imports import PreferenciasImport, UserImport
+from .models import Preferencias
+from .serializers import EMAIL_TAKEN
+
+
+def ndjson(*rows):
+    return StringIO(''.join(json.dumps(row) + '\n' for row in rows))
+
+
+def rejected(report):
+    return [json.loads(line) for line in report.getvalue().splitlines()]
+
+
+class ReadRowsTest(TestCase):
+    def test_csv(self):
+        """Test that empty cells are left out and lines are numbered from the header"""
+        rows = list(read_rows(StringIO('username,email\nana,\n"b\nc",b@example.com\n'), 'csv'))
+        self.assertEqual(rows, [
+            (2, {'username': 'ana'}, None),
+            (4, {'username': 'b\nc', 'email': 'b@example.com'}, None),
+        ])
+
+    def test_ndjson(self):
+        """Test that unparsable lines come with an error and blank ones are skipped"""
+        rows = list(read_rows(StringIO('{"username": "ana", "email": null}\n\n{oops\n[1]\n'), 'ndjson'))
+        self.assertEqual(rows, [
+            (1, {'username': 'ana'}, None),
+            (3, '{oops', 'Invalid JSON.'),
+            (4, [1], 'Expected a JSON object.'),
+        ])
+
+
+class UserImportTest(TestCase):
+    def run_import(self, stream, format='ndjson', chunk_size=100):
+        report = StringIO()
+        result = run_import(UserImport(), stream, format, report, chunk_size)
+        return result, rejected(report)
+
+    def test_creates_and_updates(self):
+        """Test that rows are merged on username, missing values kept"""
+        existing = UserFactory(username='ana', email='ana@example.com', first_name='Ana', last_name='Old')
+        result, report = self.run_import(ndjson(
+            {'username': 'ana', 'email': 'ana@example.com', 'last_name': 'New'},
+            {'username': 'bob', 'email': 'bob@example.com', 'first_name': 'Bob'},
+        ))
+        self.assertEqual((result.rows, result.created, result.updated, result.rejected), (2, 1, 1, 0))
+        self.assertEqual(report, [])
+
+        existing.refresh_from_db()
+        self.assertEqual((existing.first_name, existing.last_name), ('Ana', 'New'))
+        bob = User.objects.get(username='bob')
+        self.assertEqual((bob.email, bob.first_name, bob.last_name), ('bob@example.com', 'Bob', ''))
+        self.assertTrue(bob.is_active)
+        self.assertFalse(bob.has_usable_password())
+        self.assertIsNotNone(bob.date_joined)
+
+    def test_rejects_invalid_rows(self):
+        """Test that rows failing UserSerializer validation go to the report"""
+        result, report = self.run_import(StringIO(
+            'username,email\n'
+            'ana,ana@example.com\n'
+            'bad name!,bad@example.com\n'
+            'carla,not-an-email\n'
+            'dario,\n'
+        ), format='csv')
+        self.assertEqual((result.created, result.rejected), (1, 3))
+        self.assertEqual([entry['line'] for entry in report], [3, 4, 5])
+        self.assertIn('username', report[0]['errors'])
+        self.assertEqual(report[1]['row'], {'username': 'carla', 'email': 'not-an-email'})
+        self.assertIn('email', report[2]['errors'])
+        self.assertEqual(list(User.objects.values_list('username', flat=True)), ['ana'])
+
+    def test_unique_emails(self):
+        """Test that emails are checked per chunk, ignoring case"""
+        UserFactory(username='ana', email='ana@example.com')
+        result, report = self.run_import(ndjson(
+            {'username': 'bob', 'email': 'ANA@example.com'},
+            {'username': 'carla', 'email': 'carla@example.com'},
+            {'username': 'dario', 'email': 'Carla@Example.com'},
+            {'username': 'ana', 'email': 'ana@example.com', 'first_name': 'Ana'},
+        ))
+        self.assertEqual((result.created, result.updated, result.rejected), (1, 1, 2))
+        self.assertEqual([(entry['line'], entry['errors']) for entry in report], [
+            (1, {'email': [EMAIL_TAKEN]}), (3, {'email': [EMAIL_TAKEN]}),
+        ])
+
+    def test_last_row_wins(self):
+        """Test that of several rows for one username the last is imported"""
+        result, report = self.run_import(ndjson(
+            {'username': 'ana', 'email': 'ana@example.com', 'first_name': 'Uno'},
+            {'username': 'ana', 'email': 'ana@example.com', 'first_name': 'Dos'},
+        ))
+        self.assertEqual((result.created, result.rejected), (1, 1))
+        self.assertEqual(report[0]['line'], 1)
+        self.assertEqual(User.objects.get().first_name, 'Dos')
+
+    def test_chunks(self):
+        """Test that rows are validated and merged one chunk at a time"""
+        rows = [{'username': f'user{n}', 'email': f'user{n}@example.com'} for n in range(25)]
+        # Creating and dropping the staging table, then per chunk: the email
+        # check, clearing and loading the staging table, the existing keys,
+        # the UPDATE, the INSERT, the rows left out and 4 savepoint queries
+        with self.assertNumQueries(3 + 5 * 11):
+            result, report = self.run_import(ndjson(*rows), chunk_size=5)
+        self.assertEqual(result.created, 25)
+        self.assertEqual(User.objects.count(), 25)
+
+    def test_conflicts(self):
+        """Test that rows clashing on a unique index are rejected, not the chunk"""
+        UserFactory(username='ana', email='ana@example.com')
+        UserFactory(username='bob', email='bob@example.com')
+        spec = UserImport()
+        # Other writers took the emails after the chunk was checked
+        spec.check = lambda rows: {}
+        report = StringIO()
+        result = run_import(spec, ndjson(
+            {'username': 'bob', 'email': 'ana@example.com'},
+            {'username': 'carla', 'email': 'ANA@example.com'},
+            {'username': 'dario', 'email': 'dario@example.com'},
+            {'username': 'ana', 'email': 'ana@example.com', 'first_name': 'Ana'},
+        ), 'ndjson', report)
+        self.assertEqual((result.created, result.updated, result.rejected), (1, 1, 2))
+        entries = rejected(report)
+        self.assertEqual(sorted(entry['line'] for entry in entries), [1, 2])
+        for entry in entries:
+            self.assertTrue(entry['errors']['non_field_errors'][0].startswith(CONFLICT.format(error='')))
+        self.assertEqual(User.objects.get(username='bob').email, 'bob@example.com')
+        self.assertEqual(User.objects.get(username='ana').first_name, 'Ana')
+        self.assertTrue(User.objects.filter(username='dario').exists())
+
+
+class PreferenciasImportTest(TestCase):
+    def setUp(self):
+        self.addCleanup(cache.clear)
+
+    def test_by_username_or_id(self):
+        """Test that rows name their user either way and unknown users are rejected"""
+        ana = UserFactory(username='ana')
+        bob = PreferenciasFactory(user__username='bob', idioma='es').user
+        report = StringIO()
+        result = run_import(PreferenciasImport(), ndjson(
+            {'username': 'ana', 'idioma': 'en', 'tema_oscuro': True},
+            {'user_id': bob.pk, 'idioma': 'pt'},
+            {'username': 'nadie', 'idioma': 'en'},
+            {'user_id': 'x'},
+            {'idioma': 'en'},
+            {'username': 'ana', 'idioma': 'klingon-long'},
+        ), 'ndjson', report)
+        self.assertEqual((result.created, result.updated, result.rejected), (1, 1, 4))
+        self.assertEqual(sorted(entry['line'] for entry in rejected(report)), [3, 4, 5, 6])
+
+        ana_preferencias = Preferencias.objects.get(user=ana)
+        self.assertEqual((ana_preferencias.idioma, ana_preferencias.tema_oscuro), ('en', True))
+        self.assertTrue(ana_preferencias.notificaciones_email)
+        bob_preferencias = Preferencias.objects.get(user=bob)
+        self.assertEqual((bob_preferencias.idioma, bob_preferencias.tema_oscuro), ('pt', False))
+
+    def test_keeps_aggregates(self):
+        """Test that the aggregates follow the imported rows"""
+        users = [PreferenciasFactory().user for _ in range(3)] + [UserFactory() for _ in range(2)]
+        run_import(PreferenciasImport(), StringIO(
+            'username,idioma,notificaciones_push\n'
+            + ''.join(f'{user.username},fr,false\n' for user in users)
+        ), 'csv', StringIO())
+        self.assertEqual(Preferencias.objects.filter(idioma='fr', notificaciones_push=False).count(), 5)
+        self.assertEqual(aggregates.check(), {})
+
+
+class ImportDataCommandTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+    def test_import(self):
+        """Test that the command imports a file and reports the rejected rows"""
+        path = self.directory / 'users.csv'
+        path.write_text('username,email\nana,ana@example.com\nbob,oops\n')
+        out = StringIO()
+        call_command('import_data', 'users', str(path), stdout=out)
+        self.assertIn('1 created, 0 updated, 1 rejected', out.getvalue())
+        report = (self.directory / 'users.csv.rejected.ndjson').read_text().splitlines()
+        self.assertEqual([json.loads(line)['line'] for line in report], [3])
+
+    def test_no_report_without_rejections(self):
+        path = self.directory / 'users.jsonl'
+        path.write_text('{"username": "ana", "email": "ana@example.com"}\n')
+        call_command('import_data', 'users', str(path), '--report', str(self.directory / 'r.ndjson'),
+                     stdout=StringIO())
+        self.assertTrue(User.objects.filter(username='ana').exists())
+        self.assertFalse((self.directory / 'r.ndjson').exists())
+
+    def test_unknown_format(self):
+        path = self.directory / 'users.txt'
+        path.write_text('')
+        with self.assertRaises(CommandError):
+            call_command('import_data', 'users', str(path), stdout=StringIO())
+
+
+class ImportAPIViewTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        settings = override_settings(IMPORT_REPORT_DIR=directory.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.client = APIClient()
+        self.client.force_authenticate(UserFactory(is_staff=True))
+        self.url = reverse('user-import')
+
+    def upload(self, name, content, **data):
+        return self.client.post(self.url, {'file': SimpleUploadedFile(name, content), **data}, format='multipart')
+
+    def test_import_and_report(self):
+        """Test that the upload is imported and its rejected rows served"""
+        response = self.upload('users.csv', b'\xef\xbb\xbfusername,email\nana,ana@example.com\nbob,oops\n')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            {key: response.data[key] for key in ('rows', 'created', 'updated', 'rejected')},
+            {'rows': 2, 'created': 1, 'updated': 0, 'rejected': 1},
+        )
+        report = self.client.get(response.data['report'])
+        self.assertEqual(report.status_code, status.HTTP_200_OK)
+        entry, = [json.loads(line) for line in b''.join(report.streaming_content).splitlines()]
+        self.assertEqual(entry['row'], {'username': 'bob', 'email': 'oops'})
+
+    def test_format_parameter(self):
+        """Test that the format can be given when the extension does not tell"""
+        response = self.upload('upload', b'{"username": "ana", "email": "ana@example.com"}\n', format='ndjson')
+        self.assertEqual(response.data['created'], 1)
+        self.assertIsNone(response.data['report'])
+
+    def test_unknown_format(self):
+        response = self.upload('users.txt', b'')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(IMPORT_BACKGROUND_SIZE=10, IMPORT_ASYNC=False)
+    def test_background_import(self):
+        """Test that large files are imported in the background and their status polled"""
+        response = self.upload('users.csv', b'username,email\nana,ana@example.com\nbob,oops\n')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response['Location'], response.data['status_url'])
+
+        response = self.client.get(response.data['status_url'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            {key: response.data[key] for key in ('status', 'rows', 'created', 'rejected')},
+            {'status': 'done', 'rows': 2, 'created': 1, 'rejected': 1},
+        )
+        self.assertEqual(self.client.get(response.data['report']).status_code, status.HTTP_200_OK)
+        self.assertTrue(User.objects.filter(username='ana').exists())
+        self.assertEqual(list(Path(self.directory).glob('*.upload')), [])
+
+    @override_settings(IMPORT_BACKGROUND_SIZE=10, IMPORT_ASYNC=True)
+    def test_background_import_within_budget(self):
+        """Test that handing a large file to the background job keeps to the route's budget"""
+        with mock.patch('config.imports.get_import_executor') as executor:
+            response = self.upload('users.csv', b'username,email\nana,ana@example.com\n')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        executor.return_value.submit.assert_called_once()
+
+    def test_not_utf8(self):
+        """Test that a file in another encoding is rejected before any row is imported"""
+        content = 'username,email\nana,ana@example.com\njosé,jose@example.com\n'.encode('latin-1')
+        response = self.upload('users.csv', content)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(User.objects.filter(username='ana').exists())
+
+    @override_settings(IMPORT_REPORT_TTL=60)
+    def test_reports_expire(self):
+        """Test that the files of old imports are deleted"""
+        old, recent = Path(self.directory) / 'old.ndjson', Path(self.directory) / 'recent.ndjson'
+        old.write_text('')
+        recent.write_text('')
+        os.utime(old, (time.time() - 61, time.time() - 61))
+        self.upload('users.csv', b'username,email\n')
+        self.assertFalse(old.exists())
+        self.assertTrue(recent.exists())
+
+    def test_admins_only(self):
+        self.client.force_authenticate(UserFactory())
+        response = self.upload('users.csv', b'username,email\n')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
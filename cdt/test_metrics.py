@@ -0,0 +1,116 @@
+import json
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from config.metrics import ARCHIVE, CONTENT_TYPE, LATENCY_BUCKETS, collect, exposition, registry
+from .cache import _stats
+from .factories import PreferenciasFactory
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        settings = override_settings(METRICS_DIR=directory.name, METRICS_FLUSH_INTERVAL=3600)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        registry.reset()
+        self.addCleanup(registry.reset)
+        self.addCleanup(cache.clear)
+        self.client = APIClient()
+        self.preferencias = PreferenciasFactory()
+
+    def _sample(self, text, line_start):
+        for line in text.splitlines():
+            if line.startswith(line_start + ' '):
+                return float(line.rsplit(' ', 1)[1])
+        self.fail(f'{line_start} not in metrics')
+
+    def test_exposition_format(self):
+        """Test that /metrics is served in the text exposition format"""
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], CONTENT_TYPE)
+        text = response.content.decode()
+        self.assertIn('# TYPE http_requests_total counter', text)
+        self.assertIn('# TYPE http_request_duration_seconds histogram', text)
+        self.assertIn('# TYPE cache_hit_ratio gauge', text)
+
+    def test_requests_by_route_and_status(self):
+        """Test that requests are counted by URL name, method and status class"""
+        url = reverse('preferencias-detail', args=[self.preferencias.user_id])
+        self.client.get(url)
+        self.client.get(url)
+        self.client.get(reverse('preferencias-detail', args=[0]))
+        text = self.client.get('/metrics').content.decode()
+        self.assertEqual(self._sample(
+            text, 'http_requests_total{route="preferencias-detail",method="GET",status="2xx"}'), 2)
+        self.assertEqual(self._sample(
+            text, 'http_requests_total{route="preferencias-detail",method="GET",status="4xx"}'), 1)
+        self.assertGreaterEqual(self._sample(text, 'db_queries_total{route="preferencias-detail"}'), 1)
+
+    def test_histogram_buckets(self):
+        """Test that histogram buckets are cumulative and end with +Inf"""
+        registry.observe('user-list', 'GET', 200, 0.003)
+        registry.observe('user-list', 'GET', 200, 0.2)
+        registry.observe('user-list', 'GET', 200, 60)
+        text = exposition(collect())
+        name = 'http_request_duration_seconds'
+        labels = 'route="user-list",method="GET"'
+        self.assertEqual(self._sample(text, f'{name}_bucket{{{labels},le="{LATENCY_BUCKETS[0]!r}"}}'), 1)
+        self.assertEqual(self._sample(text, f'{name}_bucket{{{labels},le="0.25"}}'), 2)
+        self.assertEqual(self._sample(text, f'{name}_bucket{{{labels},le="10.0"}}'), 2)
+        self.assertEqual(self._sample(text, f'{name}_bucket{{{labels},le="+Inf"}}'), 3)
+        self.assertEqual(self._sample(text, f'{name}_count{{{labels}}}'), 3)
+        self.assertAlmostEqual(self._sample(text, f'{name}_sum{{{labels}}}'), 60.203)
+
+    def test_aggregates_processes(self):
+        """Test that the totals of every worker process are added up"""
+        registry.observe('user-list', 'GET', 200, 0.003)
+        other = registry.snapshot()
+        (self.directory / 'other-worker.json').write_text(json.dumps(other))
+        registry.observe('user-list', 'GET', 500, 0.003)
+        totals = collect()
+        self.assertEqual(totals['http_requests_total'][('user-list', 'GET', '2xx')], 2)
+        self.assertEqual(totals['http_requests_total'][('user-list', 'GET', '5xx')], 1)
+        self.assertEqual(totals['http_request_duration_seconds'][('user-list', 'GET')][0], 3)
+
+    def test_exited_processes(self):
+        """Test that exited processes keep their counters and lose their gauges and file"""
+        registry.observe('user-list', 'GET', 200, 0.003)
+        exited = registry.snapshot()
+        exited['db_pool_connections'] = [[['default', 'idle'], 4]]
+        exited['db_pool_checkouts_total'] = [[['default'], 10]]
+        # Beyond any pid_max
+        path = self.directory / '2147483647-0123abcd.json'
+        path.write_text(json.dumps(exited))
+        for _ in range(2):
+            totals = collect()
+            self.assertEqual(totals['http_requests_total'][('user-list', 'GET', '2xx')], 2)
+            self.assertEqual(totals['db_pool_checkouts_total'][('default',)], 10)
+            self.assertNotIn(('default', 'idle'), totals.get('db_pool_connections', {}))
+        self.assertFalse(path.exists())
+        self.assertEqual(len(list(self.directory.glob('*.json'))), 2)
+        self.assertTrue((self.directory / ARCHIVE).exists())
+
+    def test_flushed_off_the_request(self):
+        """Test that recording a request does not write the metrics file"""
+        with mock.patch.object(registry, 'flush') as flush:
+            registry.observe('user-list', 'GET', 200, 0.003)
+        flush.assert_not_called()
+        self.assertTrue(registry._flusher.is_alive())
+
+    def test_cache_hit_ratio(self):
+        """Test that the preference cache reports its hit ratio"""
+        hits, misses = _stats['hits'], _stats['misses']
+        self.addCleanup(_stats.update, hits=hits, misses=misses)
+        _stats.update(hits=3, misses=1)
+        text = exposition(collect())
+        self.assertEqual(self._sample(text, 'cache_requests_total{cache="preferencias",result="hit"}'), 3)
+        self.assertEqual(self._sample(text, 'cache_hit_ratio{cache="preferencias"}'), 0.75)
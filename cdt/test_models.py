@@ -1,3 +1,4 @@
+from django.db import connection
 from django.test import TestCase
 from django.core.exceptions import ValidationError
 from django.contrib.auth.models import User
@@ -49,4 +50,45 @@ class PreferenciasModelTest(TestCase):
         self.assertTrue(preferencias.tema_oscuro)
         self.assertFalse(preferencias.notificaciones_email)
         self.assertFalse(preferencias.notificaciones_push)
-        self.assertEqual(preferencias.idioma, 'en') 
\ No newline at end of file
+        self.assertEqual(preferencias.idioma, 'en') 
+
+class PreferenciasSegmentTest(TestCase):
+    def setUp(self):
+        PreferenciasFactory(idioma='pt', tema_oscuro=True, notificaciones_push=True)
+        PreferenciasFactory(idioma='pt', tema_oscuro=False, notificaciones_push=True)
+        PreferenciasFactory(idioma='es', tema_oscuro=True, notificaciones_email=False)
+
+    def _plan(self, queryset):
+        if connection.vendor == 'postgresql':
+            # Tiny test tables are cheaper to scan; make the planner show its index choice
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        return queryset.explain()
+
+    def test_segment_combines_filters(self):
+        """Test that segment() matches the chained queryset methods"""
+        segment = Preferencias.objects.all().segment(
+            tema_oscuro=True, notificaciones_push=True, idioma='pt'
+        )
+        chained = (Preferencias.objects.all()
+                   .with_dark_theme().with_push_notifications().by_language('pt'))
+        self.assertEqual(list(segment), list(chained))
+        self.assertEqual(segment.count(), 1)
+        self.assertEqual(
+            Preferencias.objects.all().segment(notificaciones_email=False).count(), 1
+        )
+
+    def test_language_segment_uses_composite_index(self):
+        """Test that segments with a language are served by prefs_segment_idx"""
+        queryset = Preferencias.objects.all().segment(
+            idioma='pt', notificaciones_email=True, notificaciones_push=True
+        )
+        self.assertIn('prefs_segment_idx', self._plan(queryset))
+
+    def test_flag_segment_uses_partial_index(self):
+        """Test that single-flag segments are served by an index"""
+        queryset = Preferencias.objects.all().with_email_notifications()
+        plan = self._plan(queryset.order_by('user_id'))
+        self.assertTrue(
+            any(name in plan for name in ('prefs_email_on_idx', 'prefs_segment_idx')), plan
+        )
@@ -0,0 +1,167 @@
+import threading
+import time
+from unittest import skipUnless
+
+from django.db import connection, connections
+from django.test import SimpleTestCase, TestCase
+from config.db.pool import ConnectionPool, PoolTimeout
+from config.metrics import _pools, registry, register_pool
+
+
+class FakeConnection:
+    def __init__(self, healthy=True):
+        self.healthy = healthy
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTest(SimpleTestCase):
+    def pool(self, **options):
+        self.connections = []
+
+        def connect():
+            self.connections.append(FakeConnection())
+            return self.connections[-1]
+
+        return ConnectionPool('test', connect, check=lambda c: c.healthy, **options)
+
+    def test_reuses_connections(self):
+        """Test that a released connection is handed out again"""
+        pool = self.pool()
+        entry = pool.acquire()
+        pool.release(entry)
+        self.assertIs(pool.acquire(), entry)
+        stats = pool.stats()
+        self.assertEqual((stats['opened'], stats['checkouts'], stats['in_use'], stats['idle']), (1, 2, 1, 0))
+
+    def test_waits_then_times_out(self):
+        """Test that a full pool makes callers wait, up to the timeout"""
+        pool = self.pool(max_size=1, timeout=0.05)
+        entry = pool.acquire()
+        with self.assertRaises(PoolTimeout):
+            pool.acquire()
+        self.assertEqual(pool.stats()['timeouts'], 1)
+
+        threading.Timer(0.01, pool.release, [entry]).start()
+        pool.timeout = 5
+        self.assertIs(pool.acquire(), entry)
+        stats = pool.stats()
+        self.assertEqual((stats['waits'], stats['opened']), (1, 1))
+        self.assertGreater(stats['wait_seconds'], 0)
+
+    def test_threads_share_connections(self):
+        """Test that many threads get by with max_size connections"""
+        pool = self.pool(max_size=2)
+
+        def work():
+            for _ in range(20):
+                entry = pool.acquire()
+                time.sleep(0.0005)
+                pool.release(entry)
+
+        threads = [threading.Thread(target=work) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stats = pool.stats()
+        self.assertLessEqual(stats['opened'], 2)
+        self.assertEqual((stats['checkouts'], stats['in_use']), (120, 0))
+
+    def test_health_check(self):
+        """Test that an idle connection failing its check is replaced"""
+        pool = self.pool(check_interval=0)
+        entry = pool.acquire()
+        pool.release(entry)
+        entry.connection.healthy = False
+        replacement = pool.acquire()
+        self.assertIsNot(replacement, entry)
+        self.assertTrue(entry.connection.closed)
+        self.assertEqual(pool.stats()['closed'], 1)
+
+    def test_lifetime_and_idle_time(self):
+        """Test that old connections and idle ones above min_size are closed"""
+        pool = self.pool(min_size=1, max_lifetime=60, max_idle=0)
+        first, second = pool.acquire(), pool.acquire()
+        pool.release(first)
+        pool.release(second)
+        # Idle for max_idle: only min_size stays open
+        self.assertEqual(pool.stats()['size'], 1)
+        self.assertTrue(first.connection.closed)
+
+        second.created_at -= 60
+        entry = pool.acquire()
+        self.assertIsNot(entry, second)
+        self.assertTrue(second.connection.closed)
+
+    def test_discard(self):
+        pool = self.pool()
+        entry = pool.acquire()
+        pool.release(entry, discard=True)
+        self.assertTrue(entry.connection.closed)
+        self.assertEqual(pool.stats()['size'], 0)
+
+    def test_warm_up_and_close(self):
+        """Test that warm_up opens min_size connections and close ends them"""
+        pool = self.pool(min_size=3)
+        pool.warm_up()
+        self.assertEqual(pool.stats()['idle'], 3)
+        entry = pool.acquire()
+        pool.close()
+        self.assertEqual(sum(c.closed for c in self.connections), 2)
+        pool.release(entry)
+        self.assertTrue(entry.connection.closed)
+        self.assertEqual(pool.stats()['size'], 0)
+
+    def test_failed_connect_frees_the_slot(self):
+        pool = ConnectionPool('test', lambda: 1 / 0, max_size=1, timeout=0)
+        for _ in range(2):
+            with self.assertRaises(ZeroDivisionError):
+                pool.acquire()
+        self.assertEqual(pool.stats()['size'], 0)
+
+    def test_metrics(self):
+        """Test that pools are exported with the request metrics"""
+        pool = self.pool()
+        pool.acquire()
+        register_pool('test', pool.stats)
+        self.addCleanup(_pools.pop, 'test')
+        data = registry.snapshot()
+        self.assertIn([['test', 'in_use'], 1], data['db_pool_connections'])
+        self.assertIn([['test'], 1], data['db_pool_connections_opened_total'])
+
+
+@skipUnless(connection.vendor == 'postgresql' and connection.settings_dict.get('POOL'),
+            'needs the pooled PostgreSQL backend')
+class PooledBackendTest(TestCase):
+    def wrapper(self):
+        # Outside the test's transaction, like a request's connection
+        wrapper = connections.create_connection('default')
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def test_connection_returns_to_the_pool(self):
+        """Test that close() hands the connection back with its schema"""
+        wrapper = self.wrapper()
+        wrapper.ensure_connection()
+        raw = wrapper.connection
+        wrapper.tenant_schema = 'acme'
+        wrapper.close()
+
+        other = self.wrapper()
+        other.ensure_connection()
+        self.assertIs(other.connection, raw)
+        self.assertEqual(other.tenant_schema, 'acme')
+
+    def test_open_transaction_rolled_back(self):
+        wrapper = self.wrapper()
+        wrapper.ensure_connection()
+        wrapper.set_autocommit(False)
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        raw = wrapper.connection
+        wrapper.close()
+        self.assertFalse(raw.closed)
+        self.assertEqual(raw.info.transaction_status, 0)
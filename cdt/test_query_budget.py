@@ -0,0 +1,114 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import URLPattern, URLResolver, get_resolver, reverse
+from rest_framework.test import APIClient
+from config.middlewares import QueryBudgetMiddleware
+from config.query_budget import QueryBudgetExceeded, budget_for, query_budget
+from .factories import PreferenciasFactory
+
+
+def _make_view():
+    def view(request):
+        list(User.objects.all())
+        list(User.objects.all())
+        return HttpResponse('ok')
+    return view
+
+
+class QueryBudgetTest(TestCase):
+    def setUp(self):
+        # Ids are reused between tests: a copy cached for the same user_id
+        # would answer without a query
+        cache.clear()
+        self.client = APIClient()
+        self.preferencias = PreferenciasFactory()
+
+    def _run(self, view):
+        request = RequestFactory().get('/')
+        middleware = QueryBudgetMiddleware(lambda request: view(request))
+        middleware.process_view(request, view, (), {})
+        return middleware(request)
+
+    def test_budget_per_method(self):
+        """Test that per method budgets override the default one"""
+        view = query_budget(1, post=3)(_make_view())
+        self.assertEqual(budget_for(view, 'GET'), 1)
+        self.assertEqual(budget_for(view, 'POST'), 3)
+        self.assertIsNone(budget_for(_make_view(), 'GET'))
+
+    @override_settings(QUERY_BUDGET_ENFORCE=True)
+    def test_over_budget_fails(self):
+        """Test that a view running more queries than declared raises"""
+        with self.assertRaises(QueryBudgetExceeded) as caught:
+            self._run(query_budget(1)(_make_view()))
+        self.assertEqual((caught.exception.count, caught.exception.budget), (2, 1))
+        self.assertIn('auth_user', str(caught.exception))
+
+    @override_settings(QUERY_BUDGET_ENFORCE=False)
+    def test_over_budget_logged(self):
+        """Test that outside of tests going over the budget is only logged"""
+        with self.assertLogs('config.middlewares', 'WARNING'):
+            response = self._run(query_budget(1)(_make_view()))
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(QUERY_BUDGET_HEADERS=True)
+    def test_debug_headers(self):
+        """Test that the query count, time and budget are sent in debug"""
+        response = self.client.get(reverse('preferencias-detail', args=[self.preferencias.user_id]))
+        self.assertEqual(response['X-Query-Count'], '1')
+        self.assertEqual(response['X-Query-Budget'], '1')
+        self.assertGreaterEqual(float(response['X-Query-Time']), 0)
+
+    @override_settings(QUERY_BUDGET_HEADERS=False)
+    def test_no_headers_in_production(self):
+        response = self.client.get(reverse('preferencias-detail', args=[self.preferencias.user_id]))
+        self.assertNotIn('X-Query-Count', response)
+
+    @override_settings(QUERY_BUDGET_HEADERS=True)
+    def test_user_detail_single_query(self):
+        """Test that a user and its preferences are read in one query"""
+        response = self.client.get(reverse('user-detail', args=[self.preferencias.user_id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Query-Count'], '1')
+
+
+@override_settings(QUERY_BUDGET_HEADERS=True)
+class AsyncQueryBudgetTest(TestCase):
+    def setUp(self):
+        self.preferencias = PreferenciasFactory()
+
+    async def test_async_views_are_counted(self):
+        """Test that queries made through the async ORM are counted"""
+        response = await self.async_client.get(f'/api/users/{self.preferencias.user_id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Query-Count'], '1')
+
+
+def _views(patterns, prefix=''):
+    """
+    (route, view) of every URL pattern in ``patterns``, included ones too.
+    """
+    for pattern in patterns:
+        route = prefix + str(pattern.pattern)
+        if isinstance(pattern, URLResolver):
+            yield from _views(pattern.url_patterns, route)
+        elif isinstance(pattern, URLPattern):
+            yield route, pattern.callback
+
+
+class RouteBudgetsTest(SimpleTestCase):
+    def test_every_route_declares_a_budget(self):
+        """Test that every method of every API route has a query budget"""
+        for urlconf in ('cdt.urls', 'tenants.urls', 'cdt.async_urls', 'tenants.async_urls'):
+            for route, view in _views(get_resolver(urlconf).url_patterns):
+                view_class = view.view_class
+                methods = [
+                    method.upper() for method in view_class.http_method_names
+                    if method not in ('head', 'options') and hasattr(view_class, method)
+                ]
+                self.assertTrue(methods, route)
+                for method in methods:
+                    with self.subTest(urlconf=urlconf, route=route, method=method):
+                        self.assertIsNotNone(budget_for(view, method))
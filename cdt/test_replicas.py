@@ -0,0 +1,168 @@
+import time
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.db import DatabaseError, connections, transaction
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from config.replicas import ReplicaRouter, _health, choose_replica, primary_reads, read_from, route_reads
+from .factories import PreferenciasFactory, UserFactory
+
+
+class ReplicaRouterTest(SimpleTestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+
+    def test_reads(self):
+        """Test that reads go to the replica picked for the request only"""
+        self.assertEqual(self.router.db_for_read(User), 'default')
+        with read_from('replica'):
+            self.assertEqual(self.router.db_for_read(User), 'replica')
+            self.assertEqual(self.router.db_for_read(Session), 'default')
+            with primary_reads():
+                self.assertEqual(self.router.db_for_read(User), 'default')
+        self.assertEqual(self.router.db_for_read(User), 'default')
+
+    @override_settings(DATABASE_REPLICAS=['replica'])
+    def test_writes_and_migrations(self):
+        with read_from('replica'):
+            self.assertEqual(self.router.db_for_write(User), 'default')
+        self.assertFalse(self.router.allow_migrate('replica', 'auth'))
+        self.assertIsNone(self.router.allow_migrate('default', 'auth'))
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], REPLICA_MAX_LAG=5, REPLICA_LAG_CHECK_INTERVAL=60)
+class ReplicaLagTest(SimpleTestCase):
+    def setUp(self):
+        _health.clear()
+        self.addCleanup(_health.clear)
+
+    def test_lagging_replica_skipped(self):
+        """Test that a replica too far behind is not chosen"""
+        with mock.patch('config.replicas.replica_lag', return_value=6.0):
+            self.assertIsNone(choose_replica())
+        _health.clear()
+        with mock.patch('config.replicas.replica_lag', return_value=1.0):
+            self.assertEqual(choose_replica(), 'replica')
+
+    def test_unreachable_replica_skipped(self):
+        with mock.patch('config.replicas.replica_lag', side_effect=DatabaseError):
+            self.assertIsNone(choose_replica())
+
+    def test_checked_once_per_interval(self):
+        """Test that the lag is measured at most once per REPLICA_LAG_CHECK_INTERVAL"""
+        with mock.patch('config.replicas.replica_lag', return_value=0.0) as replica_lag:
+            for _ in range(3):
+                self.assertEqual(choose_replica(), 'replica')
+        self.assertEqual(replica_lag.call_count, 1)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], REPLICA_STICKY_SECONDS=10)
+class ReplicaMiddlewareTest(TransactionTestCase):
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        _health.clear()
+        self.addCleanup(_health.clear)
+        self.addCleanup(cache.clear)
+        UserFactory(username='ana')
+
+    def reads(self, method, *args, **kwargs):
+        """
+        The response, and the aliases of the databases the request read users from.
+        """
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica']) as replica:
+            response = method(*args, **kwargs)
+        aliases = [
+            alias for alias, queries in (('default', primary), ('replica', replica))
+            if any('FROM "auth_user"' in query['sql'] for query in queries.captured_queries)
+        ]
+        return response, aliases
+
+    def test_safe_requests_read_from_replica(self):
+        """Test that marked views read from the replica, others from the primary"""
+        response, aliases = self.reads(self.client.get, '/api/users/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([user['username'] for user in response.json()], ['ana'])
+        self.assertEqual(aliases, ['replica'])
+
+        user = User.objects.get()
+        response, aliases = self.reads(self.client.get, f'/api/users/{user.pk}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(aliases, ['default'])
+
+    def test_reads_stick_to_primary_after_write(self):
+        """Test that a client reads from the primary for a while after it writes"""
+        response = self.client.post(
+            '/api/users/', {'username': 'bob', 'email': 'bob@example.com'}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 201)
+        cookie = response.cookies['primary_reads_until']
+        self.assertEqual(cookie['max-age'], 10)
+        self.assertTrue(cookie['httponly'])
+
+        response, aliases = self.reads(self.client.get, '/api/users/')
+        self.assertEqual(len(response.json()), 2)
+        self.assertEqual(aliases, ['default'])
+
+        self.client.cookies['primary_reads_until'] = str(time.time() - 1)
+        response, aliases = self.reads(self.client.get, '/api/users/')
+        self.assertEqual(aliases, ['replica'])
+
+    def test_failed_write_does_not_stick(self):
+        response = self.client.post('/api/users/', {'email': 'bob@example.com'}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertNotIn('primary_reads_until', response.cookies)
+
+    def test_lagging_replica_falls_back_to_primary(self):
+        with mock.patch('config.replicas.replica_lag', return_value=3600.0):
+            response, aliases = self.reads(self.client.get, '/api/users/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(aliases, ['default'])
+
+    def test_transaction_reads_from_primary(self):
+        """Test that reads inside a transaction see its writes"""
+        with read_from('replica'), CaptureQueriesContext(connections['replica']) as replica:
+            with transaction.atomic():
+                UserFactory(username='bob')
+                self.assertEqual(User.objects.count(), 2)
+            self.assertEqual(User.objects.count(), 2)
+        self.assertEqual(len(replica.captured_queries), 1)
+
+    def test_preferencias_cache_filled_from_primary(self):
+        """Test that the cached preferences are never read from a replica"""
+        preferencias = PreferenciasFactory(idioma='es')
+        with CaptureQueriesContext(connections['replica']) as replica:
+            response = self.client.get(f'/api/preferencias/{preferencias.user_id}/')
+        self.assertEqual(response.json()['idioma'], 'es')
+        self.assertEqual(replica.captured_queries, [])
+
+    async def test_async_views(self):
+        """Test that requests served by the async views are routed the same"""
+        with mock.patch('config.middlewares.route_reads', wraps=route_reads) as routed:
+            response = await self.async_client.get('/api/users/')
+            self.assertEqual(response.status_code, 200)
+            response = await self.async_client.post(
+                '/api/users/', {'username': 'bob', 'email': 'bob@example.com'}, content_type='application/json'
+            )
+            self.assertIn('primary_reads_until', response.cookies)
+            await self.async_client.get('/api/users/')
+        self.assertEqual([call.args[0] for call in routed.call_args_list], ['replica', None, None])
+
+    async def test_async_replica_reads(self):
+        """Test that the replica picked before an async view serves its reads"""
+        routed = []
+        db_for_read = ReplicaRouter.db_for_read
+
+        def record(router, model, **hints):
+            alias = db_for_read(router, model, **hints)
+            routed.append((model, alias))
+            return alias
+
+        with mock.patch.object(ReplicaRouter, 'db_for_read', record):
+            response = await self.async_client.get('/api/users/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn((User, 'replica'), routed)
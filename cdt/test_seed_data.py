@@ -0,0 +1,121 @@
+import datetime
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from config.bulk_load import bulk_load, copy_text, next_id
+from tenants.models import Tenant
+from . import aggregates
+from .factories import PreferenciasFactory
+from .models import Preferencias
+
+
+class SeedDataTest(TestCase):
+    def seed(self, *args):
+        call_command('seed_data', *args, stdout=StringIO())
+
+    def test_users_follow_the_factories(self):
+        """Test that users get factory usernames, emails and preferences"""
+        existing = PreferenciasFactory()
+        self.seed('--users', '25', '--batch-size', '10')
+
+        users = User.objects.exclude(pk=existing.user_id).order_by('id')
+        self.assertEqual(users.count(), 25)
+        for user in users:
+            self.assertEqual(user.username, f'user_{user.pk}')
+            self.assertEqual(user.email, f'{user.username}@example.com')
+            self.assertTrue(user.first_name and user.last_name)
+            self.assertFalse(user.has_usable_password())
+        self.assertEqual(Preferencias.objects.filter(user__in=users, idioma='es').count(), 25)
+        # Signals are skipped, the aggregates are rebuilt instead
+        self.assertEqual(aggregates.check(), {})
+
+    def test_password_hashed_once(self):
+        """Test that every user shares the one precomputed hash"""
+        self.seed('--users', '3', '--password', 'secreto')
+        hashes = set(User.objects.values_list('password', flat=True))
+        self.assertEqual(len(hashes), 1)
+        self.assertTrue(User.objects.first().check_password('secreto'))
+
+    def test_spread_preferences(self):
+        """Test that --spread varies languages and flags reproducibly"""
+        self.seed('--users', '200', '--spread', '--seed', '7')
+        self.assertGreater(Preferencias.objects.values('idioma').distinct().count(), 1)
+        self.assertTrue(Preferencias.objects.filter(tema_oscuro=True).exists())
+        self.assertEqual(aggregates.check(), {})
+
+    def test_tenants(self):
+        """Test that tenants get factory schema names and domains"""
+        self.seed('--tenants', '12', '--batch-size', '5')
+        self.assertEqual(Tenant.objects.count(), 12)
+        for tenant in Tenant.objects.all():
+            self.assertEqual(tenant.schema_name, f'schema_{tenant.pk}')
+            self.assertEqual(tenant.domain, f'tenant{tenant.pk}.example.com')
+            self.assertEqual(tenant.provisioning_status, Tenant.ProvisioningStatus.PENDING)
+
+    def test_provision_tenants(self):
+        """Test that --provision leaves the added tenants ready to serve requests"""
+        self.seed('--tenants', '3', '--provision')
+        self.assertEqual(
+            set(Tenant.objects.values_list('provisioning_status', flat=True)),
+            {Tenant.ProvisioningStatus.READY},
+        )
+
+    def test_seed_reproduces_factory_values(self):
+        """Test that --seed also fixes the Faker values drawn from the factories"""
+        self.seed('--users', '20', '--seed', '3')
+        first = list(User.objects.order_by('id').values_list('first_name', 'last_name'))
+        self.seed('--users', '20', '--seed', '3')
+        second = list(User.objects.order_by('id').values_list('first_name', 'last_name'))[20:]
+        self.assertEqual(first, second)
+
+    def test_runs_again(self):
+        """Test that a second run adds rows after the existing ones"""
+        self.seed('--users', '5', '--tenants', '5')
+        self.seed('--users', '5', '--tenants', '5')
+        self.assertEqual(User.objects.count(), 10)
+        self.assertEqual(Preferencias.objects.count(), 10)
+        self.assertEqual(Tenant.objects.count(), 10)
+
+    def test_invalid_counts(self):
+        with self.assertRaises(CommandError):
+            self.seed('--users', '-1')
+
+
+class BulkLoadTest(TestCase):
+    def test_load(self):
+        """Test that rows are inserted column by column"""
+        start = next_id(Tenant)
+        now = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+        loaded = bulk_load(Tenant, {
+            'id': [start, start + 1],
+            'name': ['Uno', 'Dos'],
+            'schema_name': ['uno', 'dos'],
+            'domain': ['uno.example.com', 'dos.example.com'],
+            'created_at': [now, now],
+            'updated_at': [now, now],
+        })
+        self.assertEqual(loaded, 2)
+        self.assertEqual(Tenant.objects.get(pk=start + 1).name, 'Dos')
+        self.assertEqual(Tenant.objects.get(pk=start).created_at, now)
+        self.assertEqual(next_id(Tenant), start + 2)
+
+    def test_columns_of_different_lengths(self):
+        with self.assertRaises(ValueError):
+            bulk_load(Tenant, {'name': ['Uno'], 'schema_name': []})
+
+    def test_copy_text(self):
+        """Test that values are escaped for the COPY text format"""
+        fields = [Tenant._meta.get_field(name) for name in ('id', 'name', 'is_active', 'updated_at')]
+        text = copy_text(fields, [
+            [1, 2],
+            ['tab\there', 'back\\slash\nnewline'],
+            [True, None],
+            [datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc), None],
+        ])
+        self.assertEqual(text, (
+            '1\ttab\\there\tt\t2024-01-01T00:00:00+00:00\n'
+            '2\tback\\\\slash\\nnewline\t\\N\t\\N\n'
+        ))
@@ -0,0 +1,100 @@
+import datetime
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from config import renderers, serialization
+from config.renderers import FastJSONRenderer, fast_dumps
+from config.serialization import ValuesSerializer
+from tenants.models import Tenant
+from tenants.serializers import TenantSearchSerializer, TenantSerializer
+from .factories import UserFactory
+from .serializers import PreferenciasSerializer, UserSerializer, UserWithPreferenciasSerializer
+
+
+class ValuesSerializerTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        UserFactory(username='ana', first_name='Ána ', last_name='Q"uote\\')
+        UserFactory(username='bob', first_name='', last_name='\x1f')
+        self.tenant = Tenant.objects.create(name='Ñandú', schema_name='nandu', domain='nandu.example.com')
+        Tenant.objects.filter(pk=self.tenant.pk).update(
+            created_at=datetime.datetime(2024, 5, 1, 12, 0, tzinfo=datetime.timezone.utc),
+            updated_at=datetime.datetime(2024, 5, 1, 12, 0, 0, 123456, tzinfo=datetime.timezone.utc),
+        )
+
+    def assertSameBytes(self, queryset, serializer_class, **kwargs):
+        expected = JSONRenderer().render(serializer_class(queryset, many=True, **kwargs).data)
+        fast = ValuesSerializer(serializer_class(**kwargs))
+        rows = fast.to_representation(list(fast.values(queryset)))
+        self.assertEqual(FastJSONRenderer().render(rows), expected)
+
+    def test_users_byte_for_byte(self):
+        """Test that value rows render exactly like UserSerializer"""
+        self.assertSameBytes(User.objects.order_by('id'), UserSerializer)
+        self.assertSameBytes(User.objects.order_by('id'), UserSerializer, fields=['email', 'id'])
+
+    def test_tenants_byte_for_byte(self):
+        """Test that datetimes render exactly like DateTimeField"""
+        self.assertSameBytes(Tenant.objects.order_by('id'), TenantSerializer)
+
+    def test_json_fallback(self):
+        """Test that the output is the same without orjson"""
+        with mock.patch.object(serialization, 'orjson', None), mock.patch.object(renderers, 'orjson', None):
+            self.assertSameBytes(Tenant.objects.order_by('id'), TenantSerializer)
+            self.assertSameBytes(User.objects.order_by('id'), UserSerializer)
+
+    @override_settings(TIME_ZONE='America/Argentina/Buenos_Aires')
+    def test_local_time_zone(self):
+        """Test that datetimes follow the current time zone like DateTimeField"""
+        self.assertSameBytes(Tenant.objects.order_by('id'), TenantSerializer)
+
+    def test_extra_fields_are_dropped(self):
+        """Test that ordering fields read for pagination do not leak into the output"""
+        fast = ValuesSerializer(UserSerializer(fields=['email']))
+        rows = list(fast.values(User.objects.order_by('id'), '-id'))
+        self.assertEqual(fast.to_representation(rows), [{'email': row['email']} for row in rows])
+        self.assertIn('id', rows[0])
+
+    def test_unsupported_serializers(self):
+        """Test that nested, related and computed fields are refused"""
+        self.assertTrue(ValuesSerializer.supports(UserSerializer()))
+        self.assertTrue(ValuesSerializer.supports(TenantSerializer()))
+        self.assertFalse(ValuesSerializer.supports(UserWithPreferenciasSerializer()))
+        self.assertFalse(ValuesSerializer.supports(TenantSearchSerializer()))
+        self.assertTrue(ValuesSerializer.supports(PreferenciasSerializer()))
+        with self.assertRaises(TypeError):
+            ValuesSerializer(UserWithPreferenciasSerializer())
+
+    def test_renderer_defers_indented_output(self):
+        """Test that indented output is left to JSONRenderer"""
+        data = [{'a': 1}]
+        self.assertEqual(
+            FastJSONRenderer().render(data, 'application/json; indent=2'),
+            JSONRenderer().render(data, 'application/json; indent=2'),
+        )
+        self.assertEqual(fast_dumps({1: 2 ** 70}), JSONRenderer().render({1: 2 ** 70}))
+
+    def test_list_endpoints(self):
+        """Test that the list endpoints answer with the serializers' bytes and keep paginating"""
+        response = self.client.get(reverse('user-list'), {'page_size': 1})
+        first = User.objects.order_by('id').first()
+        self.assertEqual(response.content, JSONRenderer().render(UserSerializer([first], many=True).data))
+        self.assertIn('rel="next"', response['Link'])
+
+        response = self.client.get(reverse('user-list'), {'fields': 'email'})
+        self.assertEqual(response.json(), [{'email': user.email} for user in User.objects.order_by('id')])
+
+        response = self.client.get('/api/tenants/')
+        expected = TenantSerializer(Tenant.objects.order_by('name', 'id'), many=True).data
+        self.assertEqual(response.content, JSONRenderer().render(expected))
+
+    def test_ndjson_stream(self):
+        """Test that NDJSON lines match the serializer output"""
+        response = self.client.get('/api/tenants/', HTTP_ACCEPT='application/x-ndjson')
+        lines = b''.join(response.streaming_content).splitlines()
+        expected = TenantSerializer(Tenant.objects.order_by('name', 'id'), many=True).data
+        self.assertEqual(lines, [JSONRenderer().render(row) for row in expected])
@@ -1,7 +1,14 @@
+from unittest import mock
+
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import User
+from django.db import IntegrityError, connection, transaction
+from rest_framework.test import APIClient
 from .models import Preferencias
-from .serializers import UserSerializer, PreferenciasSerializer, UserWithPreferenciasSerializer
+from .serializers import (
+    EMAIL_TAKEN, UserSerializer, PreferenciasSerializer, UserWithPreferenciasSerializer
+)
 
 
 class UserSerializerTest(TestCase):
@@ -95,12 +102,7 @@ class UserSerializerTest(TestCase):
 
     def test_validation_email(self):
         """Test email validation"""
-        # Create a user with the email we want to test
-        User.objects.create_user(
-            username='first_user',
-            email='test@example.com'
-        )
-        # Try to create another user with the same email
+        # Try to create another user with the email of the setUp user
         data = {
             'username': 'second_user',
             'email': 'test@example.com',  # Same email as first user
@@ -111,6 +113,53 @@ class UserSerializerTest(TestCase):
         self.assertFalse(serializer.is_valid())
         self.assertIn('email', serializer.errors)
 
+    def test_validation_email_ignores_case(self):
+        """Test that emails differing only in case clash"""
+        serializer = UserSerializer(data={'username': 'other', 'email': 'TEST@Example.com'})
+        self.assertFalse(serializer.is_valid())
+        self.assertEqual(serializer.errors['email'], [EMAIL_TAKEN])
+
+    def test_update_keeps_own_email(self):
+        """Test that a user may be saved with its current email"""
+        serializer = UserSerializer(self.user, data={'email': 'Test@example.com'}, partial=True)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+
+    def test_email_index(self):
+        """Test that the database refuses a clashing email written past the serializer"""
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            User.objects.create_user(username='racer', email='TEST@example.com')
+        # Users without an email do not clash
+        User.objects.create_user(username='blank1', email='')
+        User.objects.create_user(username='blank2', email='')
+
+    def test_list_checks_emails_in_one_query(self):
+        """Test that a list of users is checked with a single email query"""
+        data = [
+            {'username': f'user{i}', 'email': f'user{i}@example.com'} for i in range(10)
+        ] + [
+            {'username': 'taken', 'email': 'Test@Example.com'},
+            {'username': 'twice', 'email': 'USER3@example.com'},
+        ]
+        serializer = UserSerializer(data=data, many=True)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertFalse(serializer.is_valid())
+        email_queries = [q for q in queries.captured_queries if 'UPPER' in q['sql']]
+        self.assertEqual(len(email_queries), 1)
+        self.assertEqual(serializer.errors[10], {'email': [EMAIL_TAKEN]})
+        self.assertEqual(serializer.errors[11], {'email': [EMAIL_TAKEN]})
+        self.assertFalse(any(serializer.errors[:10]))
+
+    def test_lost_race_is_a_validation_error(self):
+        """Test that an insert beaten by a concurrent one answers 400, not 500"""
+        client = APIClient()
+        data = {'username': 'racer', 'email': 'RACE@example.com', 'password': 'x'}
+        # The concurrent insert lands after validation ran
+        with mock.patch('cdt.serializers.taken_emails', return_value=set()):
+            User.objects.create_user(username='winner', email='race@example.com')
+            response = client.post('/api/users/', data, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error5'], str({'email': [EMAIL_TAKEN]}))
+
 
 class PreferenciasSerializerTest(TestCase):
     def setUp(self):
@@ -1,8 +1,17 @@
-from django.test import TestCase
+import json
+import os
+from concurrent.futures.process import BrokenProcessPool
+from unittest import mock
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework.test import APIClient
 from django.contrib.auth.models import User
 from .models import Preferencias
+from .factories import PreferenciasFactory
+from .views import NismanBatchAPIView
+from .hashing import discard_hashing_executor, get_hashing_executor, hash_passwords
 
 class UserAPIViewTest(TestCase):
     def setUp(self):
@@ -28,6 +37,42 @@ class UserAPIViewTest(TestCase):
         self.assertEqual(response.data['username'], 'newuser')
         self.assertTrue(User.objects.filter(username='newuser').exists())
 
+    def test_get_users_paginated(self):
+        for i in range(5):
+            User.objects.create_user(username=f'user{i}', email=f'user{i}@example.com')
+        response = self.client.get(self.url, {'page_size': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([u['username'] for u in response.data], ['user0', 'user1'])
+        self.assertIn('rel="next"', response['Link'])
+        self.assertNotIn('rel="prev"', response['Link'])
+
+        next_url = response['Link'].split(';')[0].strip('<>')
+        response = self.client.get(next_url)
+        self.assertEqual([u['username'] for u in response.data], ['user2', 'user3'])
+        self.assertIn('rel="prev"', response['Link'])
+
+        prev_url = [
+            link.split(';')[0].strip(' <>') for link in response['Link'].split(',')
+            if 'rel="prev"' in link
+        ][0]
+        response = self.client.get(prev_url)
+        self.assertEqual([u['username'] for u in response.data], ['user0', 'user1'])
+
+    def test_get_users_ndjson_stream(self):
+        for i in range(3):
+            User.objects.create_user(username=f'user{i}', email=f'user{i}@example.com')
+        response = self.client.get(self.url, HTTP_ACCEPT='application/x-ndjson')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual([row['username'] for row in rows], ['user0', 'user1', 'user2'])
+
+    def test_get_users_invalid_cursor(self):
+        response = self.client.get(self.url, {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
 
 class PreferenciasAPIViewTest(TestCase):
     def setUp(self):
@@ -71,4 +116,173 @@ class PreferenciasAPIViewTest(TestCase):
         self.assertEqual(response.data['notificaciones_email'], True)
         self.assertEqual(response.data['notificaciones_push'], False)
         self.assertEqual(response.data['idioma'], 'en')
-        self.assertTrue(Preferencias.objects.filter(user=new_user).exists()) 
\ No newline at end of file
+        self.assertTrue(Preferencias.objects.filter(user=new_user).exists()) 
+
+class PreferenciasBulkAPIViewTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.url = reverse('preferencias-bulk')
+        self.existing = User.objects.create_user(username='existing', email='existing@example.com')
+        Preferencias.objects.create(user=self.existing, tema_oscuro=True, idioma='es')
+        self.new = User.objects.create_user(username='new', email='new@example.com')
+
+    def test_bulk_upsert(self):
+        data = [
+            {'user_id': self.existing.id, 'idioma': 'pt'},
+            {'user_id': self.new.id, 'idioma': 'en'},
+            {'user_id': 999999, 'idioma': 'en'},
+            {'user_id': self.new.id, 'idioma': 'x' * 11},
+            {'idioma': 'en'},
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, data, format='json')
+        sql = [query['sql'] for query in queries.captured_queries]
+        self.assertEqual(len([q for q in sql if 'FROM "auth_user"' in q]), 1)
+        self.assertEqual(len([q for q in sql if q.startswith('INSERT INTO "cdt_preferencias"')]), 1)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['upserted'], 2)
+        self.assertEqual(
+            [result['status'] for result in response.data['results']],
+            ['upserted', 'upserted', 'error', 'error', 'error']
+        )
+
+        existing = Preferencias.objects.get(user=self.existing)
+        self.assertEqual(existing.idioma, 'pt')
+        self.assertTrue(existing.tema_oscuro)  # fields absent from the item are kept
+        self.assertEqual(Preferencias.objects.get(user=self.new).idioma, 'en')
+
+    def test_bulk_upsert_requires_list(self):
+        response = self.client.post(self.url, {'user_id': self.new.id}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class NismanBatchAPIViewTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.url = reverse('nisman-batch')
+        User.objects.create_user(username='taken', email='taken@example.com')
+
+    def test_batch_create(self):
+        data = {'usernames': ['ana', 'beto', 'taken', 'ana', '  ']}
+        response = self.client.post(self.url, data, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], ['ana', 'beto'])
+        self.assertEqual(sorted(response.data['conflicts']), ['ana', 'taken'])
+        self.assertEqual(response.data['invalid'], ['  '])
+        user = User.objects.get(username='beto')
+        self.assertEqual(user.email, 'beto@example.com')
+        self.assertTrue(user.check_password('securepassword'))
+
+    def test_batch_email_conflicts_ignore_case(self):
+        """Test that names whose generated email is taken, ignoring case, are conflicts"""
+        data = {'usernames': ['Taken', 'Beto', 'beto']}
+        response = self.client.post(self.url, data, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], ['Beto'])
+        self.assertEqual(sorted(response.data['conflicts']), ['Taken', 'beto'])
+
+    @override_settings(QUERY_BUDGET_ENFORCE=False)
+    def test_batch_names_taken_concurrently(self):
+        """Test that names taken between the check and the insert are reported as conflicts"""
+        User.objects.create_user(username='beto', email='beto@example.com')
+        split_taken = NismanBatchAPIView._split_taken
+        checks = [lambda view, usernames: (usernames, []), split_taken]
+
+        # The retry runs over the budget of the endpoint
+        with mock.patch.object(NismanBatchAPIView, '_split_taken',
+                               lambda view, usernames: checks.pop(0)(view, usernames)), \
+                self.assertLogs('config.middlewares', 'WARNING'):
+            response = self.client.post(self.url, {'usernames': ['ana', 'beto']}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], ['ana'])
+        self.assertEqual(response.data['conflicts'], ['beto'])
+        self.assertTrue(User.objects.get(username='ana').check_password('securepassword'))
+
+    @override_settings(PASSWORD_HASHING_MIN_BATCH=2, PASSWORD_HASHING_WORKERS=2)
+    def test_batch_create_on_process_pool(self):
+        usernames = [f'pool{i}' for i in range(4)]
+        response = self.client.post(self.url, {'usernames': usernames}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], usernames)
+        self.assertTrue(User.objects.get(username='pool3').check_password('securepassword'))
+
+    @override_settings(PASSWORD_HASHING_MIN_BATCH=2, PASSWORD_HASHING_WORKERS=2)
+    def test_broken_process_pool_replaced(self):
+        """Test that a pool broken by a dead worker is replaced"""
+        self.addCleanup(discard_hashing_executor)
+        with self.assertRaises(BrokenProcessPool):
+            get_hashing_executor().submit(os._exit, 1).result()
+        self.assertEqual(len(hash_passwords(['a', 'b', 'c'])), 3)
+
+
+class PreferenciasSegmentCountAPIViewTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.url = reverse('preferencias-segment-count')
+        PreferenciasFactory(idioma='pt', tema_oscuro=True)
+        PreferenciasFactory(idioma='pt', notificaciones_push=False)
+        PreferenciasFactory(idioma='es', tema_oscuro=True)
+
+    def test_count_segments(self):
+        response = self.client.get(self.url, {'idioma': 'pt'})
+        self.assertEqual(response.data['count'], 2)
+        response = self.client.get(self.url, {'idioma': 'pt', 'notificaciones_push': 'false'})
+        self.assertEqual(response.data['count'], 1)
+        response = self.client.get(self.url, {'tema_oscuro': 'true'})
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual(self.client.get(self.url).data['count'], 3)
+
+    def test_invalid_flag(self):
+        response = self.client.get(self.url, {'tema_oscuro': 'maybe'})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+})
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.client = APIClient()
+        self.preferencias = PreferenciasFactory(idioma='es')
+        self.user_id = self.preferencias.user_id
+
+    def test_preferencias_not_modified(self):
+        """Test that a matching ETag gets a 304 without touching the database"""
+        url = reverse('preferencias-detail', args=[self.user_id])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+
+    def test_preferencias_modified(self):
+        """Test that a change invalidates the ETag"""
+        url = reverse('preferencias-detail', args=[self.user_id])
+        etag = self.client.get(url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put(url, {'idioma': 'en'}, format='json')
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['idioma'], 'en')
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_user_detail_if_modified_since(self):
+        """Test If-Modified-Since on the user detail, and that user changes count"""
+        url = reverse('user-detail', args=[self.user_id])
+        last_modified = self.client.get(url)['Last-Modified']
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+        etag = response['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.filter(pk=self.user_id).first().save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
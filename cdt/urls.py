@@ -4,19 +4,48 @@ URL configuration for the cdt app.
 from django.urls import path
 from .views import (
     UserAPIView, UserDetailAPIView,
-    PreferenciasAPIView, PreferenciasDetailAPIView,
-    NismanAPIView
+    PreferenciasAPIView, PreferenciasBulkAPIView, PreferenciasDetailAPIView,
+    PreferenciasSegmentCountAPIView, PreferenciasAggregatesAPIView,
+    NismanAPIView, NismanBatchAPIView
 )
+from .imports import PreferenciasImport, UserImport
+from config.imports import ImportAPIView
+from config.query_budget import query_budget
+from config.replicas import replica_reads
 
 urlpatterns = [
     # User endpoints
-    path('users/', UserAPIView.as_view(), name='user-list'),
-    path('users/<int:user_id>/', UserDetailAPIView.as_view(), name='user-detail'),
+    path('users/', query_budget(1, post=5)(replica_reads(UserAPIView.as_view())), name='user-list'),
+    path('users/<int:user_id>/', query_budget(1, put=5)(UserDetailAPIView.as_view()), name='user-detail'),
+    # File imports: the budget covers the session and user lookups and handing
+    # a large file to the background job; files imported inline run queries
+    # growing with them and are exempt (see config.imports)
+    path('users/import/', query_budget(post=2)(ImportAPIView.as_view(spec_class=UserImport)), name='user-import'),
     
     # Preferences endpoints
-    path('preferencias/', PreferenciasAPIView.as_view(), name='preferencias'),
-    path('preferencias/<int:user_id>/', PreferenciasDetailAPIView.as_view(), name='preferencias-detail'),
+    path('preferencias/', query_budget(1, post=6)(PreferenciasAPIView.as_view()), name='preferencias'),
+    path('preferencias/bulk/', query_budget(post=25)(PreferenciasBulkAPIView.as_view()), name='preferencias-bulk'),
+    # File imports: the budget covers the session and user lookups and handing
+    # a large file to the background job; files imported inline run queries
+    # growing with them and are exempt (see config.imports)
+    path(
+        'preferencias/import/',
+        query_budget(post=2)(ImportAPIView.as_view(spec_class=PreferenciasImport)),
+        name='preferencias-import'
+    ),
+    path(
+        'preferencias/segments/count/',
+        query_budget(1)(PreferenciasSegmentCountAPIView.as_view()),
+        name='preferencias-segment-count'
+    ),
+    path(
+        'preferencias/aggregates/',
+        query_budget(1)(PreferenciasAggregatesAPIView.as_view()),
+        name='preferencias-aggregates'
+    ),
+    path('preferencias/<int:user_id>/', query_budget(1, put=8)(replica_reads(PreferenciasDetailAPIView.as_view())), name='preferencias-detail'),
     
     # Nisman endpoint
-    path('nisman/', NismanAPIView.as_view(), name='nisman'),
+    path('nisman/', query_budget(post=4)(NismanAPIView.as_view()), name='nisman'),
+    path('nisman/batch/', query_budget(post=5)(NismanBatchAPIView.as_view()), name='nisman-batch'),
 ] 
\ No newline at end of file
@@ -1,6 +1,9 @@
+from functools import partial
 from django.shortcuts import render, get_object_or_404
+from django.db import IntegrityError, transaction
 from rest_framework.views import APIView
 from rest_framework import permissions, status
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.response import Response
 from django.contrib.auth.models import User
 from .models import Preferencias
@@ -10,7 +13,22 @@ from .exceptions import (
     UserIdRequiredException, UserNotFoundException,
     PreferenciasNotFoundException, ValidationException
 )
-from .serializers import UserSerializer, PreferenciasSerializer, UserWithPreferenciasSerializer
+from .serializers import (
+    UserSerializer, PreferenciasSerializer, UserWithPreferenciasSerializer,
+    taken_emails, unique_user_errors
+)
+from .pagination import UserPagination
+from .fieldsets import narrow, project, sparse_fieldsets, variant
+from .cache import get_preferencias_data, preferencias_version, user_version
+from .aggregates import aggregate_totals
+from .hashing import hash_passwords
+from config.conditional import not_modified, set_validators, version_validators
+from config.renderers import FastJSONRenderer, NDJSONRenderer, ndjson_response
+from config.serialization import ValuesSerializer
+
+SEGMENT_BOOLEAN_FILTERS = ('tema_oscuro', 'notificaciones_email', 'notificaciones_push')
+TRUTHY = {'true', '1', 'yes'}
+FALSY = {'false', '0', 'no'}
 
 # Create your views here.
 
@@ -19,15 +37,25 @@ class UserAPIView(APIView):
     API endpoint for user operations
     """
     permission_classes = [permissions.AllowAny]
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer, NDJSONRenderer]
 
     def get(self, request):
         """
         GET /api/users/
-        List all users
+        List users, one page at a time (?cursor=&page_size=)
+        With Accept: application/x-ndjson, stream every user instead
+        ?fields= narrows the output and the columns read
         """
-        users = User.objects.all()
-        serializer = UserSerializer(users, many=True)
-        return Response(serializer.data)
+        sparse = sparse_fieldsets(request.query_params, UserSerializer)
+        if isinstance(request.accepted_renderer, NDJSONRenderer):
+            queryset = project(User.objects.order_by('id'), UserSerializer, **sparse)
+            return ndjson_response(queryset, partial(UserSerializer, **sparse))
+
+        paginator = UserPagination()
+        fast = ValuesSerializer(UserSerializer(**sparse))
+        queryset = fast.values(User.objects.all(), *paginator.ordering)
+        users = paginator.paginate_queryset(queryset, request, view=self)
+        return paginator.get_paginated_response(fast.to_representation(users))
 
     def post(self, request):
         """
@@ -36,13 +64,14 @@ class UserAPIView(APIView):
         """
         serializer = UserSerializer(data=request.data)
         if serializer.is_valid():
-            user = User.objects.create_user(
-                username=serializer.validated_data['username'],
-                email=serializer.validated_data.get('email', ''),
-                password=request.data.get('password'),
-                first_name=serializer.validated_data.get('first_name', ''),
-                last_name=serializer.validated_data.get('last_name', '')
-            )
+            with unique_user_errors(), transaction.atomic():
+                user = User.objects.create_user(
+                    username=serializer.validated_data['username'],
+                    email=serializer.validated_data.get('email', ''),
+                    password=request.data.get('password'),
+                    first_name=serializer.validated_data.get('first_name', ''),
+                    last_name=serializer.validated_data.get('last_name', '')
+                )
             return Response(UserSerializer(user).data, status=status.HTTP_201_CREATED)
         raise ValidationException(serializer.errors)
 
@@ -57,10 +86,19 @@ class UserDetailAPIView(APIView):
         """
         GET /api/users/{user_id}/
         Get specific user details
+        Conditional on If-None-Match / If-Modified-Since, answered from the cache
+        ?fields= and ?fields[preferencias]= narrow the output and the columns read
         """
-        user = User.objects.get(id=user_id)
-        serializer = UserWithPreferenciasSerializer(user)
-        return Response(serializer.data)
+        sparse = sparse_fieldsets(request.query_params, UserWithPreferenciasSerializer)
+        validators = version_validators(
+            user_version(user_id), preferencias_version(user_id), variant=variant(sparse)
+        )
+        response = not_modified(request, *validators)
+        if response is None:
+            queryset = project(User.objects.all(), UserWithPreferenciasSerializer, **sparse)
+            user = queryset.get(id=user_id)
+            response = Response(UserWithPreferenciasSerializer(user, **sparse).data)
+        return set_validators(response, *validators)
 
     def put(self, request, user_id):
         """
@@ -72,7 +110,8 @@ class UserDetailAPIView(APIView):
         if serializer.is_valid():
             if 'password' in request.data:
                 user.set_password(request.data['password'])
-            serializer.save()
+            with unique_user_errors(), transaction.atomic():
+                serializer.save()
             return Response(UserSerializer(user).data)
         raise ValidationException(serializer.errors)
 
@@ -87,15 +126,14 @@ class PreferenciasAPIView(APIView):
         """
         GET /api/preferencias/
         Get preferences by user_id
+        ?fields= (or ?fields[preferencias]=) narrows the output
         """
         user_id = request.query_params.get('user_id')
         if not user_id:
             raise UserIdRequiredException()
-            
-        user = User.objects.get(id=user_id)
-        preferencias = Preferencias.objects.get(user=user)
-        serializer = PreferenciasSerializer(preferencias)
-        return Response(serializer.data)
+
+        sparse = sparse_fieldsets(request.query_params, PreferenciasSerializer, 'preferencias')
+        return Response(narrow(get_preferencias_data(user_id), **sparse))
 
     def post(self, request):
         """
@@ -114,6 +152,144 @@ class PreferenciasAPIView(APIView):
         raise ValidationException(serializer.errors)
 
 
+class PreferenciasBulkAPIView(APIView):
+    """
+    API endpoint for bulk preference upserts
+    """
+    permission_classes = [permissions.AllowAny]
+    batch_size = 1000
+
+    def post(self, request):
+        """
+        POST /api/preferencias/bulk/
+        Create or update preferences for many users at once.
+        Body: [{"user_id": 1, "idioma": "en", ...}, ...]
+        Only the fields present in an item are written on update.
+        Cache and aggregates follow through PreferenciasQuerySet.bulk_create.
+        """
+        items = request.data
+        if not isinstance(items, list):
+            raise ValidationException('Expected a list of preferencias')
+
+        user_ids = set()
+        for item in items:
+            try:
+                user_ids.add(int(item.get('user_id')))
+            except (AttributeError, TypeError, ValueError):
+                pass
+        existing = set(User.objects.filter(id__in=user_ids).values_list('id', flat=True))
+
+        results = []
+        last_index = {}
+        for index, item in enumerate(items):
+            result = {'index': index, 'user_id': None}
+            results.append(result)
+            if not isinstance(item, dict) or not item.get('user_id'):
+                result.update(status='error', errors={'user_id': ['user_id is required']})
+                continue
+            try:
+                user_id = int(item['user_id'])
+            except (TypeError, ValueError):
+                result.update(status='error', errors={'user_id': ['A valid integer is required.']})
+                continue
+            result['user_id'] = user_id
+            if user_id not in existing:
+                result.update(status='error', errors={'user_id': ['User not found']})
+                continue
+            serializer = PreferenciasSerializer(data=item, partial=True)
+            if not serializer.is_valid():
+                result.update(status='error', errors=serializer.errors)
+                continue
+            if user_id in last_index:
+                results[last_index[user_id]].update(
+                    status='error', errors={'user_id': ['Superseded by a later item']}
+                )
+            last_index[user_id] = index
+            result.update(status='upserted', data=serializer.validated_data)
+
+        # Group rows by the fields they carry so each upsert only overwrites those
+        groups = {}
+        for result in results:
+            if result['status'] != 'upserted':
+                continue
+            data = result.pop('data')
+            groups.setdefault(tuple(sorted(data)), []).append(
+                Preferencias(user_id=result['user_id'], **data)
+            )
+        with transaction.atomic():
+            for fields, objs in groups.items():
+                Preferencias.objects.bulk_create(
+                    objs,
+                    batch_size=self.batch_size,
+                    update_conflicts=True,
+                    unique_fields=['user'],
+                    update_fields=[*fields, 'updated_at'],
+                )
+
+        for result in results:
+            result.pop('data', None)
+        upserted = sum(1 for result in results if result['status'] == 'upserted')
+        return Response({
+            'upserted': upserted,
+            'errors': len(results) - upserted,
+            'results': results,
+        })
+
+
+def segment_filters(query_params):
+    """
+    Read the audience segment filters of PreferenciasQuerySet.segment:
+    ?tema_oscuro=&notificaciones_email=&notificaciones_push= (true/false) and ?idioma=
+    """
+    filters = {}
+    for field in SEGMENT_BOOLEAN_FILTERS:
+        value = query_params.get(field)
+        if value is None:
+            continue
+        if value.lower() in TRUTHY:
+            filters[field] = True
+        elif value.lower() in FALSY:
+            filters[field] = False
+        else:
+            raise ValidationException({field: ['Must be true or false.']})
+    if 'idioma' in query_params:
+        filters['idioma'] = query_params['idioma']
+    return filters
+
+
+class PreferenciasSegmentCountAPIView(APIView):
+    """
+    API endpoint for audience segment counts
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        """
+        GET /api/preferencias/segments/count/
+        Count the preferences matching any combination of
+        ?tema_oscuro=&notificaciones_email=&notificaciones_push= (true/false) and ?idioma=
+        """
+        filters = segment_filters(request.query_params)
+        count = Preferencias.objects.all().segment(**filters).bitmap_count()
+        return Response({'filters': filters, 'count': count})
+
+
+class PreferenciasAggregatesAPIView(APIView):
+    """
+    API endpoint for dashboard totals, read from PreferenciasAggregate
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        """
+        GET /api/preferencias/aggregates/
+        Number of preferences per idioma matching the same filters as
+        /api/preferencias/segments/count/, without scanning Preferencias
+        """
+        filters = segment_filters(request.query_params)
+        return Response({'filters': filters, **aggregate_totals(filters)})
+
+
 class PreferenciasDetailAPIView(APIView):
     """
     API endpoint for specific user preferences
@@ -124,15 +300,21 @@ class PreferenciasDetailAPIView(APIView):
         """
         GET /api/preferencias/{user_id}/
         Get specific user's preferences
+        Conditional on If-None-Match / If-Modified-Since, answered from the cache
+        ?fields= (or ?fields[preferencias]=) narrows the output
         """
-        preferencias = Preferencias.objects.get(user_id=user_id)
-        serializer = PreferenciasSerializer(preferencias)
-        return Response(serializer.data)
+        sparse = sparse_fieldsets(request.query_params, PreferenciasSerializer, 'preferencias')
+        validators = version_validators(preferencias_version(user_id), variant=variant(sparse))
+        response = not_modified(request, *validators)
+        if response is None:
+            response = Response(narrow(get_preferencias_data(user_id), **sparse))
+        return set_validators(response, *validators)
 
     def put(self, request, user_id):
         """
         PUT /api/preferencias/{user_id}/
         Update specific user's preferences
+        The cached copy is invalidated by the Preferencias post_save signal
         """
         preferencias = Preferencias.objects.get(user_id=user_id)
         serializer = PreferenciasSerializer(preferencias, data=request.data, partial=True)
@@ -160,10 +342,91 @@ class NismanAPIView(APIView):
         if User.objects.filter(username=username).exists():
             raise UserAlreadyExistsException()
 
-        # Create the user
-        user = User.objects.create_user(
-            username=username,
-            email=f'{username}@example.com',
-            password='securepassword'
-        )
+        # Create the user; its email may differ from a taken one only in case
+        try:
+            with transaction.atomic():
+                user = User.objects.create_user(
+                    username=username,
+                    email=f'{username}@example.com',
+                    password='securepassword'
+                )
+        except IntegrityError:
+            raise UserAlreadyExistsException()
         return Response({'message': f'User "{username}" created successfully'}, status=status.HTTP_201_CREATED)
+
+
+class NismanBatchAPIView(APIView):
+    """
+    API endpoint for /nisman/batch POST
+    """
+    permission_classes = [permissions.AllowAny]
+    batch_size = 1000
+
+    def _split_taken(self, usernames):
+        """
+        Split ``usernames`` into the free ones and the ones whose name, or
+        email ignoring case, is taken by a user or an earlier name of the list.
+        One query for every name that is already taken, one for every email.
+        """
+        existing = set(
+            User.objects.filter(username__in=usernames).values_list('username', flat=True)
+        )
+        emails = taken_emails(f'{username}@example.com' for username in usernames)
+        free, taken = [], []
+        for username in usernames:
+            email = f'{username}@example.com'.upper()
+            if username in existing or email in emails:
+                taken.append(username)
+            else:
+                emails.add(email)
+                free.append(username)
+        return free, taken
+
+    def post(self, request):
+        """
+        POST /api/nisman/batch/
+        Create many users at once.
+        Body: {"usernames": ["ana", "beto", ...]}
+        """
+        usernames = request.data.get('usernames')
+        if not isinstance(usernames, list):
+            raise ValidationException('usernames must be a list')
+
+        invalid, conflicts, candidates = [], [], []
+        seen = set()
+        for username in usernames:
+            if not isinstance(username, str) or not username.strip():
+                invalid.append(username)
+            elif username in seen:
+                conflicts.append(username)
+            else:
+                seen.add(username)
+                candidates.append(username)
+
+        to_create, taken = self._split_taken(candidates)
+        conflicts += taken
+
+        passwords = hash_passwords(['securepassword'] * len(to_create))
+        users = [
+            User(username=username, email=f'{username}@example.com', password=password)
+            for username, password in zip(to_create, passwords)
+        ]
+        while True:
+            try:
+                with transaction.atomic():
+                    User.objects.bulk_create(users, batch_size=self.batch_size)
+                break
+            except IntegrityError:
+                # A concurrent request took some of the names after they were
+                # checked: report them, like the single endpoint, and retry
+                to_create, taken = self._split_taken(to_create)
+                if not taken:
+                    raise
+                conflicts += taken
+                users = [user for user in users if user.username not in taken]
+
+        return Response({
+            'created': to_create,
+            'conflicts': conflicts,
+            'invalid': invalid,
+        }, status=status.HTTP_201_CREATED)
@@ -14,3 +14,15 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_asgi_application()
+
+# Open the pooled database connections before the first requests need them
+from config.db.postgresql.base import warm_up_pools  # noqa: E402
+
+warm_up_pools()
+
+# Load the Preferencias bitmap index in the background, in each worker
+from django.core.signals import request_started  # noqa: E402
+
+from cdt.bitmaps import warm_up_on_first_request  # noqa: E402
+
+request_started.connect(warm_up_on_first_request, dispatch_uid='preferencias-bitmaps')
@@ -0,0 +1,83 @@
+"""
+Helpers shared by the async views served under config.asgi.
+
+The async views mirror the DRF APIViews one to one but are plain Django
+class-based views, since DRF dispatches synchronously. They read and write
+through the async ORM and only hop to a thread for work that has no async
+API (serializer validation hitting the database, model signals).
+"""
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.views import View
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from cdt.exceptions import ValidationException
+
+
+class AsyncAPIView(View):
+    """
+    Base class for async API views: CSRF exempt like DRF's APIView.
+    """
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        view.csrf_exempt = True
+        return view
+
+
+async def authenticate(request):
+    """
+    Authenticate ``request`` with DRF's DEFAULT_AUTHENTICATION_CLASSES
+    (session, HTTP Basic, ...) like the sync APIViews do. Returns the user,
+    or None when the request is anonymous. Raises the DRF APIException of a
+    failed authentication (bad credentials, CSRF).
+    """
+    drf_request = Request(
+        request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+    )
+    user = await sync_to_async(lambda: drf_request.user)()
+    return user if user.is_authenticated else None
+
+
+def json_response(data, status=200, headers=None, renderer_class=JSONRenderer):
+    """
+    Render ``data`` byte for byte like DRF's JSONRenderer.
+    """
+    return HttpResponse(
+        renderer_class().render(data),
+        content_type='application/json',
+        status=status,
+        headers=headers,
+    )
+
+
+def request_data(request):
+    """
+    Parse a JSON or form encoded body into a dict.
+    """
+    if request.content_type == 'application/json':
+        try:
+            return json.loads(request.body or b'{}')
+        except ValueError:
+            raise ValidationException('JSON parse error')
+    return request.POST.dict()
+
+
+def wants_ndjson(request):
+    return (
+        request.GET.get('format') == 'ndjson'
+        or 'application/x-ndjson' in request.headers.get('Accept', '')
+    )
+
+
+async def run_in_executor(executor, func, *args):
+    """
+    Run blocking ``func`` on ``executor`` without tying up the event loop.
+    """
+    return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
@@ -0,0 +1,171 @@
+"""
+Bulk loading of rows straight into a model's table.
+
+``bulk_load`` takes the rows column by column (field attname -> list of
+values) and writes them without model instances, save() or signals: COPY
+on PostgreSQL, a single INSERT run with executemany() elsewhere (SQLite in
+development and tests). Anything kept up to date by
+signals or custom managers (aggregates, caches) is up to the caller.
+"""
+import io
+import json
+
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connections, models
+from django.utils import timezone
+
+# Rows sent per COPY / executemany() call
+BATCH_SIZE = 50000
+
+_COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+
+def _copy_formatter(field):
+    """
+    Function turning values of ``field`` into COPY text format.
+    """
+    field = field.target_field if field.is_relation else field
+    if isinstance(field, models.IntegerField):
+        return lambda value: '\\N' if value is None else str(value)
+    if isinstance(field, models.BooleanField):
+        return lambda value: '\\N' if value is None else ('t' if value else 'f')
+    if isinstance(field, models.JSONField):
+        return lambda value: '\\N' if value is None else json.dumps(value).translate(_COPY_ESCAPES)
+    if isinstance(field, (models.DateTimeField, models.DateField, models.TimeField)):
+        # Typically one timestamp for a whole batch: format each distinct value once
+        formatted = {None: '\\N'}
+        return lambda value: formatted.get(value) or formatted.setdefault(value, value.isoformat())
+    if isinstance(field, (models.CharField, models.TextField)):
+        return lambda value: '\\N' if value is None else value.translate(_COPY_ESCAPES)
+    return lambda value: '\\N' if value is None else str(value).translate(_COPY_ESCAPES)
+
+
+def copy_text(fields, columns):
+    """
+    The rows of ``columns`` (one list of values per field) in COPY text format.
+    """
+    text = [list(map(_copy_formatter(field), column)) for field, column in zip(fields, columns)]
+    return '\n'.join(map('\t'.join, zip(*text))) + '\n'
+
+
+def _copy(connection, table, fields, columns, count):
+    table = connection.ops.quote_name(table)
+    names = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+    sql = f'COPY {table} ({names}) FROM STDIN'
+    with connection.cursor() as cursor:
+        for start in range(0, count, BATCH_SIZE):
+            stop = min(start + BATCH_SIZE, count)
+            text = copy_text(fields, [column[start:stop] for column in columns])
+            cursor.copy_expert(sql, io.StringIO(text))
+
+
+# Fields that hand int/str/bool values to the driver unchanged
+PLAIN_FIELDS = (models.BooleanField, models.CharField, models.IntegerField, models.TextField)
+
+
+def _prepare(field, values, connection):
+    """
+    ``values`` as get_db_prep_save() prepares them for ``connection``.
+    """
+    target = field.target_field if field.is_relation else field
+    prepare = field.get_db_prep_save
+    if isinstance(target, PLAIN_FIELDS):
+        return [
+            value if value is None or type(value) in (int, str, bool) else prepare(value, connection)
+            for value in values
+        ]
+    # Typically one timestamp for a whole batch: prepare each distinct value once
+    prepared = {}
+    try:
+        return [
+            prepared[value] if value in prepared
+            else prepared.setdefault(value, prepare(value, connection))
+            for value in values
+        ]
+    except TypeError:  # unhashable, e.g. JSONField values
+        return [prepare(value, connection) for value in values]
+
+
+def _insert(connection, table, fields, columns, count):
+    # bulk_create compiles SQL for every value of every row; one prepared
+    # INSERT run through executemany() is an order of magnitude faster
+    table = connection.ops.quote_name(table)
+    names = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+    placeholders = ', '.join(['%s'] * len(fields))
+    sql = f'INSERT INTO {table} ({names}) VALUES ({placeholders})'
+    with connection.cursor() as cursor:
+        for start in range(0, count, BATCH_SIZE):
+            stop = min(start + BATCH_SIZE, count)
+            prepared = [
+                _prepare(field, column[start:stop], connection) for field, column in zip(fields, columns)
+            ]
+            cursor.executemany(sql, list(zip(*prepared)))
+
+
+def load_table(table, fields, columns, using=DEFAULT_DB_ALIAS):
+    """
+    Insert rows into ``table``, given as one list of values per field of
+    ``fields`` (which may belong to no model, e.g. for staging tables).
+    Returns the number of rows.
+    """
+    count = len(columns[0]) if columns else 0
+    if any(len(column) != count for column in columns):
+        raise ValueError(f'Columns of different lengths for {table}')
+    if count:
+        connection = connections[using]
+        load = _copy if connection.vendor == 'postgresql' else _insert
+        load(connection, table, fields, columns, count)
+    return count
+
+
+def insert_defaults(model, exclude=(), now=None):
+    """
+    (field, value) for the concrete fields of ``model`` outside ``exclude``
+    and its primary key: what Model() would give them, or ``now`` (the
+    current time by default) for auto_now(_add) fields.
+    """
+    now = now or timezone.now()
+    defaults = []
+    for field in model._meta.concrete_fields:
+        if field in exclude or field.primary_key:
+            continue
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False):
+            defaults.append((field, now))
+        else:
+            # The default, '' for strings, else None
+            defaults.append((field, field.get_default()))
+    return defaults
+
+
+def bulk_load(model, data, using=DEFAULT_DB_ALIAS):
+    """
+    Insert the rows of ``data``, a dict of field attname -> list of values
+    (one per row, all of the same length), into ``model``'s table. Fields
+    left out get their ``insert_defaults``, evaluated once for all rows.
+    When the primary key is given, the table's id sequence is moved past it.
+    Returns the number of rows.
+    """
+    meta = model._meta
+    fields = [meta.get_field(name) for name in data]
+    columns = list(data.values())
+    count = len(columns[0]) if columns else 0
+    for field, default in insert_defaults(model, exclude=fields):
+        fields.append(field)
+        columns.append([default] * count)
+
+    load_table(meta.db_table, fields, columns, using)
+    connection = connections[using]
+    if count and meta.pk in fields and connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [model]):
+                cursor.execute(sql)
+    return count
+
+
+def next_id(model, using=DEFAULT_DB_ALIAS):
+    """
+    The first primary key after the rows of ``model``, for loads that set it.
+    """
+    last = models.QuerySet(model, using=using).aggregate(last=models.Max('pk'))['last']
+    return (last or 0) + 1
+
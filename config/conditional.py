@@ -0,0 +1,62 @@
+"""
+Conditional GET (ETag / Last-Modified) for the API detail views.
+
+Views work out the validators of a resource first, from a version token in
+the cache or an ``updated_at``-only query, and answer ``304 Not Modified``
+through ``not_modified`` before loading anything else. Full responses get
+the same validators through ``set_validators``.
+"""
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+
+def _etag(value, variant):
+    # Different representations of a resource (e.g. sparse fieldsets) need
+    # different ETags
+    if variant:
+        value = f'{value}-{hashlib.md5(variant.encode()).hexdigest()[:12]}'
+    return f'"{value}"'
+
+
+def version_validators(*versions, variant=''):
+    """
+    (ETag, Last-Modified) for time_ns() version tokens, see cdt.cache.
+    (None, None) when a token is unavailable: the response then carries no
+    validators and is never a 304.
+    """
+    if None in versions:
+        return None, None
+    etag = _etag('.'.join(str(version) for version in versions), variant)
+    return etag, max(versions) // 10**9
+
+
+def timestamp_validators(updated_at, variant=''):
+    """
+    (ETag, Last-Modified) for an ``updated_at`` datetime.
+    """
+    seconds = int(updated_at.timestamp())
+    return _etag(seconds * 10**6 + updated_at.microsecond, variant), seconds
+
+
+def set_validators(response, etag, last_modified):
+    if etag is None:
+        return response
+    response.headers['ETag'] = etag
+    response.headers['Last-Modified'] = http_date(last_modified)
+    # Clients may keep the body but must revalidate before using it
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def not_modified(request, etag, last_modified):
+    """
+    A 304 response if the client's copy matches the validators, else None.
+    """
+    if etag is None:
+        return None
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        return None
+    return set_validators(response, etag, last_modified)
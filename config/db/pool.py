@@ -0,0 +1,254 @@
+"""
+A pool of open database connections shared by the threads of a process.
+
+Django opens a connection per thread and, with CONN_MAX_AGE, keeps it for
+that thread only: a worker needs as many connections as it has threads,
+idle or not, and every new thread pays for a connect. The pooled backend
+(config.db.postgresql) takes a connection from a ConnectionPool when Django
+connects and gives it back when Django closes it, at the end of every
+request with CONN_MAX_AGE = 0, so a few connections serve all threads.
+
+The pool keeps between ``min_size`` and ``max_size`` connections. When all
+are in use, callers wait up to ``timeout`` seconds for one, then get
+PoolTimeout. Connections are closed after ``max_lifetime`` seconds, and
+those above ``min_size`` after ``max_idle`` seconds unused. A connection
+idle for more than ``check_interval`` seconds is checked before being
+handed out, and replaced if the check fails.
+
+``stats()`` counts checkouts, time spent waiting, timeouts, and connections
+opened and closed (churn); config.metrics exports them per pool.
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+@dataclass(eq=False)
+class PooledConnection:
+    connection: object
+    pool: 'ConnectionPool'
+    created_at: float
+    released_at: float
+    # Session state of the connection, kept by the backend between checkouts
+    state: dict = field(default_factory=dict)
+
+
+class ConnectionPool:
+    def __init__(self, name, connect, check=None, close=None, min_size=0, max_size=10, timeout=10.0,
+                 max_lifetime=1800.0, max_idle=300.0, check_interval=30.0):
+        if not 0 <= min_size <= max_size or max_size < 1:
+            raise ValueError(f'Pool {name}: need 0 <= min_size <= max_size and max_size >= 1')
+        self.name = name
+        self._connect = connect
+        self._check = check or (lambda connection: True)
+        self._close = close or (lambda connection: connection.close())
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.max_idle = max_idle
+        self.check_interval = check_interval
+
+        self._lock = threading.Condition()
+        # Most recently released last: reused first, oldest retired first
+        self._idle = deque()
+        self._size = 0
+        self._in_use = 0
+        self._closed = False
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.timeouts = 0
+        self.opened = 0
+        self.closed = 0
+
+    def acquire(self):
+        """
+        A PooledConnection for the caller's exclusive use, until ``release``.
+        """
+        started = time.monotonic()
+        deadline = started + self.timeout
+        with self._lock:
+            waited = False
+            while not self._idle and self._size >= self.max_size:
+                waited = True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolTimeout(
+                        f'No connection of pool {self.name} free after {self.timeout}s '
+                        f'({self.max_size} in use)'
+                    )
+                self._lock.wait(remaining)
+            entry = self._idle.pop() if self._idle else None
+            if entry is None:
+                # Reserve the slot of the connection about to be opened
+                self._size += 1
+            self._in_use += 1
+            self.checkouts += 1
+            if waited:
+                self.waits += 1
+                self.wait_seconds += time.monotonic() - started
+
+        if entry is not None and not self._usable(entry):
+            self._discard(entry.connection)
+            with self._lock:
+                self.closed += 1
+            entry = None
+        if entry is None:
+            try:
+                entry = self._open()
+            except BaseException:
+                with self._lock:
+                    self._size -= 1
+                    self._in_use -= 1
+                    self._lock.notify()
+                raise
+        return entry
+
+    def release(self, entry, discard=False):
+        """
+        Give back a connection from ``acquire``; ``discard`` closes it.
+        """
+        now = time.monotonic()
+        retired = []
+        with self._lock:
+            self._in_use -= 1
+            if discard or self._closed or now - entry.created_at >= self.max_lifetime:
+                retired.append(entry)
+            else:
+                entry.released_at = now
+                self._idle.append(entry)
+            while (self._idle and self._size - len(retired) > self.min_size
+                   and now - self._idle[0].released_at >= self.max_idle):
+                retired.append(self._idle.popleft())
+            self._size -= len(retired)
+            self.closed += len(retired)
+            self._lock.notify(max(len(retired), 1))
+        for old in retired:
+            self._discard(old.connection)
+
+    def warm_up(self):
+        """
+        Open connections until the pool holds ``min_size``.
+        """
+        while True:
+            with self._lock:
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                entry = self._open()
+            except BaseException:
+                with self._lock:
+                    self._size -= 1
+                raise
+            with self._lock:
+                self._idle.append(entry)
+                self._lock.notify()
+
+    def close(self):
+        """
+        Close the idle connections, and those in use when released.
+        """
+        with self._lock:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self.closed += len(idle)
+        for entry in idle:
+            self._discard(entry.connection)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._in_use,
+                'checkouts': self.checkouts,
+                'waits': self.waits,
+                'wait_seconds': self.wait_seconds,
+                'timeouts': self.timeouts,
+                'opened': self.opened,
+                'closed': self.closed,
+            }
+
+    def _open(self):
+        connection = self._connect()
+        now = time.monotonic()
+        with self._lock:
+            self.opened += 1
+        return PooledConnection(connection, self, now, now)
+
+    def _usable(self, entry):
+        now = time.monotonic()
+        if now - entry.created_at >= self.max_lifetime:
+            return False
+        if now - entry.released_at < self.check_interval:
+            return True
+        try:
+            return self._check(entry.connection)
+        except Exception:
+            return False
+
+    def _discard(self, connection):
+        try:
+            self._close(connection)
+        except Exception:
+            logger.warning('Closing a connection of pool %s failed', self.name, exc_info=True)
+
+
+# Pools of this process by key, see get_pool
+_pools = {}
+_pools_lock = threading.Lock()
+# Connections inherited through fork(): the parent still uses them, and
+# closing (or garbage collecting) them here would end its sessions
+_inherited = []
+
+
+def get_pool(key, factory):
+    """
+    The pool for ``key``, created by ``factory()`` on first use.
+    """
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = _pools[key] = factory()
+    return pool
+
+
+def all_pools():
+    return list(_pools.values())
+
+
+def close_pools(match=lambda key: True):
+    """
+    Close and forget the pools whose key ``match``es.
+    """
+    with _pools_lock:
+        keys = [key for key in _pools if match(key)]
+        pools = [_pools.pop(key) for key in keys]
+    for pool in pools:
+        pool.close()
+
+
+def _forget_pools_after_fork():
+    for pool in _pools.values():
+        _inherited.extend(entry.connection for entry in pool._idle)
+    _pools.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget_pools_after_fork)
@@ -0,0 +1,182 @@
+"""
+PostgreSQL backend taking its connections from a config.db.pool pool.
+
+    'ENGINE': 'config.db.postgresql',
+    'CONN_MAX_AGE': 0,
+    'POOL': {'MIN_SIZE': 2, 'MAX_SIZE': 10, 'TIMEOUT': 10, ...},
+
+Django's connect() checks a connection out of the pool of the database and
+close() checks it back in, rolled back if a transaction was left open and
+closed instead if it errored and no longer answers. With CONN_MAX_AGE = 0
+that happens at the end of every request, sync (WSGI) or async (ASGI), so a
+worker's threads share the pool's connections. Without POOL this is the
+plain postgresql backend.
+
+Session state persists between checkouts like it does with CONN_MAX_AGE:
+the wrapper attributes in SESSION_ATTRIBUTES (the tenant search_path
+tracked by tenants.schema) go with the connection, so the next user of it
+knows what it is set to. A SET inside a transaction is undone when it rolls
+back, so the tracked search_path is then forgotten (with or without POOL)
+and the next activate_schema() sets it again.
+"""
+import logging
+
+from django.db import connections
+from django.db.backends.base.base import NO_DB_ALIAS
+from django.db.backends.postgresql import base
+from django.utils.asyncio import async_unsafe
+from psycopg2 import extensions
+
+from ..pool import ConnectionPool, PoolTimeout, get_pool
+from .creation import DatabaseCreation
+
+Database = base.Database
+
+logger = logging.getLogger(__name__)
+
+# POOL setting -> ConnectionPool argument, and its default
+POOL_OPTIONS = {
+    'MIN_SIZE': ('min_size', 0),
+    'MAX_SIZE': ('max_size', 10),
+    'TIMEOUT': ('timeout', 10.0),
+    'MAX_LIFETIME': ('max_lifetime', 1800.0),
+    'MAX_IDLE': ('max_idle', 300.0),
+    'CHECK_INTERVAL': ('check_interval', 30.0),
+}
+
+# Attributes of the wrapper describing the state of its connection's session
+SESSION_ATTRIBUTES = ('tenant_schema',)
+
+
+def check_connection(connection):
+    """
+    Whether the raw ``connection`` is open and answers a query.
+    """
+    if connection.closed:
+        return False
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        if not connection.autocommit:
+            connection.rollback()
+    except Database.Error:
+        return False
+    return True
+
+
+def pool_key(settings_dict):
+    # Aliases connecting alike share a pool; OPTIONS set up the session
+    return (
+        settings_dict['HOST'], settings_dict['PORT'], settings_dict['NAME'], settings_dict['USER'],
+        repr(sorted(settings_dict['OPTIONS'].items())),
+    )
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool_entry = None
+
+    @property
+    def pool(self):
+        """
+        The pool of this database, or None when it is not pooled.
+        """
+        options = self.settings_dict.get('POOL')
+        if not options or self.alias == NO_DB_ALIAS:
+            return None
+        return get_pool(pool_key(self.settings_dict), self._new_pool)
+
+    def _new_pool(self):
+        from config.metrics import register_pool
+        conn_params = self.get_connection_params()
+        options = self.settings_dict['POOL']
+        pool = ConnectionPool(
+            self.alias,
+            lambda: base.DatabaseWrapper.get_new_connection(self, conn_params),
+            check=check_connection,
+            **{name: options.get(setting, default) for setting, (name, default) in POOL_OPTIONS.items()},
+        )
+        register_pool(self.alias, pool.stats)
+        return pool
+
+    @async_unsafe
+    def get_new_connection(self, conn_params):
+        pool = self.pool
+        if pool is None:
+            return super().get_new_connection(conn_params)
+        try:
+            self.pool_entry = pool.acquire()
+        except PoolTimeout as exc:
+            raise Database.OperationalError(str(exc)) from exc
+        return self.pool_entry.connection
+
+    def connect(self):
+        super().connect()
+        # After connection_created, whose receivers assume a new session
+        if self.pool_entry is not None:
+            for name, value in self.pool_entry.state.items():
+                setattr(self, name, value)
+
+    def _commit(self):
+        super()._commit()
+        self.tenant_schema_uncommitted = False
+
+    def _rollback(self):
+        super()._rollback()
+        self._forget_uncommitted_schema()
+
+    def _savepoint_rollback(self, sid):
+        super()._savepoint_rollback(sid)
+        self._forget_uncommitted_schema()
+
+    def _forget_uncommitted_schema(self):
+        # Whether the SET came before the savepoint or not, the search_path
+        # is no longer known for sure
+        if getattr(self, 'tenant_schema_uncommitted', False):
+            self.tenant_schema = None
+            self.tenant_schema_uncommitted = False
+
+    def _close(self):
+        entry, self.pool_entry = self.pool_entry, None
+        if entry is None:
+            return super()._close()
+        discard = not self._reusable(entry.connection)
+        entry.state = {name: getattr(self, name) for name in SESSION_ATTRIBUTES if hasattr(self, name)}
+        entry.pool.release(entry, discard=discard)
+
+    def _reusable(self, connection):
+        """
+        Whether ``connection`` can go back to the pool, rolling back what
+        this wrapper left open.
+        """
+        if self.in_atomic_block or connection.closed:
+            # Closed in the middle of atomic(): the wrapper still holds it
+            return False
+        status = connection.info.transaction_status
+        if status in (extensions.TRANSACTION_STATUS_INTRANS, extensions.TRANSACTION_STATUS_INERROR):
+            try:
+                connection.rollback()
+            except Database.Error:
+                return False
+            self._forget_uncommitted_schema()
+        elif status != extensions.TRANSACTION_STATUS_IDLE:
+            return False
+        return not self.errors_occurred or check_connection(connection)
+
+
+def warm_up_pools():
+    """
+    Open the MIN_SIZE connections of every pooled database, at worker boot.
+    A database that is down is left to connect on first use.
+    """
+    for alias in connections:
+        connection = connections[alias]
+        if not isinstance(connection, DatabaseWrapper) or connection.pool is None:
+            continue
+        try:
+            connection.pool.warm_up()
+        except Database.Error:
+            logger.warning('Could not warm up the connection pool of %s', alias, exc_info=True)
@@ -0,0 +1,580 @@
+"""
+Streaming imports of CSV and NDJSON files into a model's table.
+
+``run_import`` reads a file CHUNK_SIZE rows at a time, so memory stays
+bounded whatever its size. Every row is validated by the serializer of an
+ImportSpec, minus its per-row unique lookups: the spec checks uniqueness for
+the whole chunk in a query or two instead. Valid rows are loaded into a
+temporary staging table (COPY on PostgreSQL, see config.bulk_load) and
+merged into the model's table on the spec's key: one UPDATE of the rows that
+already exist, one INSERT of the others. Values a row leaves out (missing,
+null, or an empty CSV cell) keep their current value on update and get the
+model default on insert. Of several rows with the same key in a chunk, the
+last one wins. A chunk that still hits a unique constraint, racing another
+writer, is merged again row by row.
+
+Rejected rows go to the ``report`` stream, one JSON object per line:
+``{"line": 12, "row": {...}, "errors": {"email": ["..."]}}``.
+
+Through the API, uploads over settings.IMPORT_BACKGROUND_SIZE bytes are
+imported by a thread pool: the request answers 202 with the URL of the
+import's status. Reports, statuses and pending uploads are kept in
+settings.IMPORT_REPORT_DIR for settings.IMPORT_REPORT_TTL seconds.
+
+Specs live next to their models, in cdt.imports and tenants.imports.
+"""
+import codecs
+import csv
+import io
+import itertools
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connection, connections, models, transaction
+from django.http import FileResponse, Http404
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import permissions, serializers, status
+from rest_framework.parsers import FormParser, MultiPartParser
+from rest_framework.response import Response
+from rest_framework.validators import UniqueTogetherValidator, UniqueValidator
+from rest_framework.views import APIView
+
+from .bulk_load import insert_defaults, load_table
+from .query_budget import exempt_from_budget
+
+FORMATS = {'csv': 'csv', 'ndjson': 'ndjson', 'jsonl': 'ndjson'}
+
+# Rows validated, staged and merged at a time
+CHUNK_SIZE = 2000
+
+SUPERSEDED = 'Superseded by a later row with the same {key}.'
+CONFLICT = 'Conflicts with a concurrent write: {error}'
+# New rows clashing on a unique column are skipped by ON CONFLICT DO NOTHING
+NOT_INSERTED = 'a unique value is already taken.'
+NOT_UTF8 = 'The file is not UTF-8 encoded.'
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+class InvalidImportException(Exception):
+    status = status.HTTP_400_BAD_REQUEST
+
+
+def detect_format(name):
+    """
+    'csv' or 'ndjson' from the extension of file ``name``, or None.
+    """
+    return FORMATS.get(Path(name).suffix.lstrip('.').lower())
+
+
+def read_rows(stream, format):
+    """
+    Yield ``(line, row, error)`` for every record of the text ``stream``:
+    the row as a dict without its missing values, or as read and with an
+    error message when it cannot be parsed.
+    """
+    if format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            # Cells past the header come under the None key
+            yield reader.line_num, {
+                name: value for name, value in row.items() if name is not None and value not in ('', None)
+            }, None
+    elif format == 'ndjson':
+        for line, text in enumerate(stream, 1):
+            if not text.strip():
+                continue
+            try:
+                row = json.loads(text)
+            except ValueError:
+                yield line, text.rstrip('\r\n'), 'Invalid JSON.'
+                continue
+            if not isinstance(row, dict):
+                yield line, row, 'Expected a JSON object.'
+                continue
+            yield line, {name: value for name, value in row.items() if value is not None}, None
+    else:
+        raise InvalidImportException(f'Unknown format {format!r}, expected csv or ndjson.')
+
+
+class ImportSpec:
+    """
+    How the rows of a file become rows of ``model``: validated by
+    ``serializer_class``, written to ``fields`` (attnames) and matched on
+    the unique field ``key``. Subclasses add the checks and follow-ups
+    their model needs, in place of save() and its signals.
+    """
+    model = None
+    serializer_class = None
+    key = None
+    fields = ()
+
+    def __init__(self, using=DEFAULT_DB_ALIAS):
+        self.using = using
+        # One serializer for every row, without its per-row unique lookups
+        self.serializer = self.serializer_class()
+        for field in self.serializer.fields.values():
+            field.validators = [
+                validator for validator in field.validators if not isinstance(validator, UniqueValidator)
+            ]
+        self.serializer.validators = [
+            validator for validator in self.serializer.validators
+            if not isinstance(validator, UniqueTogetherValidator)
+        ]
+
+    def validate(self, row):
+        """
+        The field values of ``row``; raises serializers.ValidationError.
+        """
+        return dict(self.serializer.run_validation(row))
+
+    def check(self, rows):
+        """
+        Checks needing the database, for a chunk of validated rows
+        (line -> values, which may be completed in place). Returns
+        line -> errors for the rows to reject.
+        """
+        return {}
+
+    def insert_values(self):
+        """
+        attname -> value given to new rows instead of the model default.
+        """
+        return {}
+
+    def before_merge(self, keys):
+        """
+        Called before the rows with ``keys`` are written; the result is
+        passed on to ``after_merge``.
+        """
+
+    def after_merge(self, keys, created, state):
+        """
+        Called once the rows with ``keys`` are written, ``created`` being
+        the keys that were inserted, in the same transaction.
+        """
+
+
+@dataclass
+class ImportResult:
+    rows: int = 0
+    created: int = 0
+    updated: int = 0
+    rejected: int = 0
+
+
+class StagingTable:
+    """
+    Temporary table the valid rows of a chunk are loaded into, and the
+    statements merging it into the model's table.
+    """
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.connection = connections[spec.using]
+        meta = spec.model._meta
+        self.name = f'import_{meta.db_table}'
+        self.key = meta.get_field(spec.key)
+        self.fields = [meta.get_field(name) for name in spec.fields]
+        self.line = models.IntegerField()
+        self.line.set_attributes_from_name('import_line')
+
+        qn = self.connection.ops.quote_name
+        table, staging, key = qn(meta.db_table), qn(self.name), qn(self.key.column)
+        self.line_sql = f'{staging}.import_line = %s'
+        self.create_sql = 'CREATE TEMPORARY TABLE {} ({})'.format(staging, ', '.join(
+            f'{qn(field.column)} {field.db_type(self.connection)}' for field in [self.line, *self.fields]
+        ))
+        self.drop_sql = f'DROP TABLE IF EXISTS {staging}'
+        self.clear_sql = f'DELETE FROM {staging}'
+        self.existing_sql = f'SELECT {staging}.{key} FROM {staging} JOIN {table} ON {table}.{key} = {staging}.{key}'
+        self.missing_sql = (
+            f'SELECT import_line FROM {staging} WHERE NOT EXISTS '
+            f'(SELECT 1 FROM {table} existing WHERE existing.{key} = {staging}.{key})'
+        )
+
+        now = timezone.now()
+        overrides = spec.insert_values()
+        updated = [field for field in self.fields if field != self.key]
+        auto_now = [field for field in meta.concrete_fields if getattr(field, 'auto_now', False)
+                    and field not in self.fields]
+        sets = [f'{qn(field.column)} = COALESCE({staging}.{qn(field.column)}, {table}.{qn(field.column)})'
+                for field in updated]
+        sets += [f'{qn(field.column)} = %s' for field in auto_now]
+        self.update_sql = (
+            f'UPDATE {table} SET {", ".join(sets)} FROM {staging} WHERE {table}.{key} = {staging}.{key}'
+            if sets else None
+        )
+        self.update_params = [self.prepare(field, now) for field in auto_now]
+
+        defaults = {
+            field: overrides.get(field.attname, default)
+            for field, default in insert_defaults(spec.model, exclude=[self.key], now=now)
+        }
+        columns = [self.key, *updated, *(field for field in defaults if field not in updated)]
+        values = [f'{staging}.{key}']
+        values += [f'COALESCE({staging}.{qn(field.column)}, %s)' for field in updated]
+        values += ['%s' for field in columns[len(updated) + 1:]]
+        self.insert_sql = (
+            f'INSERT INTO {table} ({", ".join(qn(field.column) for field in columns)}) '
+            f'SELECT {", ".join(values)} FROM {staging} '
+            f'WHERE NOT EXISTS (SELECT 1 FROM {table} existing WHERE existing.{key} = {staging}.{key}) '
+            'ON CONFLICT DO NOTHING'
+        )
+        self.insert_params = [self.prepare(field, defaults[field]) for field in columns[1:]]
+
+    def prepare(self, field, value):
+        return field.get_db_prep_save(value, self.connection)
+
+    def execute(self, sql, params=(), line=None):
+        """
+        Run ``sql``, narrowed to the staged row at ``line`` if given (the
+        merge statements all end with a WHERE clause). Returns the rowcount.
+        """
+        if line is not None:
+            where, conflict = sql.partition(' ON CONFLICT')[::2]
+            sql = f'{where} AND {self.line_sql}' + (f' ON CONFLICT{conflict}' if conflict else '')
+            params = [*params, line]
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.rowcount
+
+    def __enter__(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(self.drop_sql)
+            cursor.execute(self.create_sql)
+        return self
+
+    def __exit__(self, *exc_info):
+        # Left for the session to drop if the transaction can't run more queries
+        if not self.connection.needs_rollback:
+            with self.connection.cursor() as cursor:
+                cursor.execute(self.drop_sql)
+
+    def load(self, rows):
+        self.execute(self.clear_sql)
+        lines = list(rows)
+        columns = [lines] + [[rows[line].get(field.attname) for line in lines] for field in self.fields]
+        load_table(self.name, [self.line, *self.fields], columns, self.spec.using)
+
+    def existing(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(self.existing_sql)
+            return {key for key, in cursor.fetchall()}
+
+    def merge(self, line=None):
+        """
+        Write the staged rows (or the one at ``line``) to the model's table.
+        Returns the number of rows updated and inserted.
+        """
+        updated = self.execute(self.update_sql, self.update_params, line) if self.update_sql else 0
+        inserted = self.execute(self.insert_sql, self.insert_params, line)
+        return updated, inserted
+
+    def missing(self):
+        """
+        Lines of the staged rows that are not in the model's table.
+        """
+        with self.connection.cursor() as cursor:
+            cursor.execute(self.missing_sql)
+            return [line for line, in cursor.fetchall()]
+
+
+class Importer:
+    def __init__(self, spec, report):
+        self.spec = spec
+        self.report = report
+        self.result = ImportResult()
+
+    def reject(self, line, row, errors):
+        self.result.rejected += 1
+        self.report.write(json.dumps({'line': line, 'row': row, 'errors': errors}, default=str) + '\n')
+
+    def run(self, stream, format, chunk_size=CHUNK_SIZE):
+        rows = read_rows(stream, format)
+        with StagingTable(self.spec) as staging:
+            while chunk := list(itertools.islice(rows, chunk_size)):
+                self.import_chunk(chunk, staging)
+        return self.result
+
+    def import_chunk(self, chunk, staging):
+        spec = self.spec
+        self.result.rows += len(chunk)
+        raw, valid = {}, {}
+        for line, row, error in chunk:
+            raw[line] = row
+            if error:
+                self.reject(line, row, {'non_field_errors': [error]})
+                continue
+            try:
+                valid[line] = spec.validate(row)
+            except serializers.ValidationError as exc:
+                self.reject(line, row, exc.detail)
+
+        for line, errors in spec.check(valid).items():
+            del valid[line]
+            self.reject(line, raw[line], errors)
+
+        latest = {}
+        for line, values in list(valid.items()):
+            previous = latest.get(values[spec.key])
+            if previous is not None:
+                del valid[previous]
+                self.reject(previous, raw[previous], {spec.key: [SUPERSEDED.format(key=spec.key)]})
+            latest[values[spec.key]] = line
+        if not valid:
+            return
+
+        with transaction.atomic(using=spec.using):
+            staging.load(valid)
+            existing = staging.existing()
+            keys = list(latest)
+            state = spec.before_merge(keys)
+            try:
+                with transaction.atomic(using=spec.using):
+                    updated, inserted = staging.merge()
+            except IntegrityError:
+                updated, inserted = self.merge_rows(staging, valid, raw)
+            for line in staging.missing():
+                if line in valid:
+                    values = valid.pop(line)
+                    keys.remove(values[spec.key])
+                    self.reject(line, raw[line], {'non_field_errors': [CONFLICT.format(error=NOT_INSERTED)]})
+            created = [key for key in keys if key not in existing]
+            spec.after_merge(keys, created, state)
+        self.result.updated += updated
+        self.result.created += inserted
+
+    def merge_rows(self, staging, valid, raw):
+        updated = inserted = 0
+        for line in list(valid):
+            try:
+                with transaction.atomic(using=self.spec.using):
+                    row_updated, row_inserted = staging.merge(line)
+            except IntegrityError as exc:
+                del valid[line]
+                self.reject(line, raw[line], {'non_field_errors': [CONFLICT.format(error=exc)]})
+                continue
+            updated += row_updated
+            inserted += row_inserted
+        return updated, inserted
+
+
+def run_import(spec, stream, format, report, chunk_size=CHUNK_SIZE):
+    """
+    Import the text ``stream`` in ``format`` ('csv' or 'ndjson') through
+    ``spec``, writing rejected rows to the text stream ``report``.
+    Returns an ImportResult.
+    """
+    try:
+        return Importer(spec, report).run(stream, format, chunk_size)
+    except UnicodeDecodeError as exc:
+        raise InvalidImportException(NOT_UTF8) from exc
+
+
+def check_encoding(file):
+    """
+    Raise InvalidImportException unless the binary ``file`` is UTF-8, before
+    any of its rows are imported. Leaves it rewound.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    try:
+        for block in iter(lambda: file.read(64 * 1024), b''):
+            decoder.decode(block)
+        decoder.decode(b'', final=True)
+    except UnicodeDecodeError as exc:
+        raise InvalidImportException(NOT_UTF8) from exc
+    finally:
+        file.seek(0)
+
+
+def report_path(report):
+    return Path(settings.IMPORT_REPORT_DIR) / f'{report}.ndjson'
+
+
+def status_path(report):
+    return Path(settings.IMPORT_REPORT_DIR) / f'{report}.json'
+
+
+def upload_path(report):
+    return Path(settings.IMPORT_REPORT_DIR) / f'{report}.upload'
+
+
+def write_status(report, **status):
+    path = status_path(report)
+    temporary = path.with_suffix('.tmp')
+    temporary.write_text(json.dumps(status))
+    os.replace(temporary, path)
+
+
+def expire_reports():
+    """
+    Delete the files of the imports older than settings.IMPORT_REPORT_TTL.
+    """
+    directory = Path(settings.IMPORT_REPORT_DIR)
+    if not directory.is_dir():
+        return
+    oldest = time.time() - settings.IMPORT_REPORT_TTL
+    for path in directory.iterdir():
+        try:
+            if path.stat().st_mtime < oldest:
+                path.unlink()
+        except FileNotFoundError:
+            # Expired by a concurrent request
+            pass
+
+
+def get_import_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.IMPORT_WORKERS, thread_name_prefix='import',
+        )
+    return _executor
+
+
+def run_import_job(spec_class, report, format):
+    """
+    Import the upload saved for ``report`` and record the outcome in its status.
+    """
+    write_status(report, status='running')
+    try:
+        with open(upload_path(report), encoding='utf-8-sig', newline='') as stream, \
+                open(report_path(report), 'w', encoding='utf-8') as rejected:
+            result = run_import(spec_class(), stream, format, rejected)
+    except Exception as exc:
+        logger.exception('Import %s failed', report)
+        write_status(report, status='failed', error=str(exc))
+    else:
+        write_status(report, status='done', **asdict(result))
+    finally:
+        upload_path(report).unlink(missing_ok=True)
+
+
+def _import_in_worker(spec_class, report, format, schema_name):
+    from tenants.schema import activate_schema
+    try:
+        # The tenant the upload was made to
+        activate_schema(schema_name)
+        run_import_job(spec_class, report, format)
+    finally:
+        connection.close()
+
+
+def schedule_import(spec_class, report, format):
+    """
+    Import the upload saved for ``report`` in the background, or inline
+    when IMPORT_ASYNC is off.
+    """
+    write_status(report, status='pending')
+    if not settings.IMPORT_ASYNC:
+        run_import_job(spec_class, report, format)
+        return
+    from tenants.schema import current_schema
+    get_import_executor().submit(_import_in_worker, spec_class, report, format, current_schema())
+
+
+class ImportAPIView(APIView):
+    """
+    API endpoint importing an uploaded file through ``spec_class``
+    """
+    permission_classes = [permissions.IsAdminUser]
+    parser_classes = [MultiPartParser, FormParser]
+    spec_class = None
+
+    def post(self, request):
+        """
+        POST a multipart ``file`` (CSV with a header row, or NDJSON), in the
+        ``format`` given or told by its extension. Returns the row counts
+        and, when rows were rejected, the URL of their report; or, for files
+        over settings.IMPORT_BACKGROUND_SIZE, 202 and the URL of the status
+        of the import.
+        """
+        upload = request.FILES.get('file')
+        if upload is None:
+            raise InvalidImportException('A file is required.')
+        format = request.data.get('format') or detect_format(upload.name)
+        if format not in FORMATS.values():
+            raise InvalidImportException('Unknown format, expected csv or ndjson.')
+        check_encoding(upload.file)
+
+        expire_reports()
+        report = uuid.uuid4()
+        path = report_path(report)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if upload.size > settings.IMPORT_BACKGROUND_SIZE:
+            with open(upload_path(report), 'wb') as saved:
+                shutil.copyfileobj(upload.file, saved)
+            if not settings.IMPORT_ASYNC:
+                exempt_from_budget(request)
+            schedule_import(self.spec_class, report, format)
+            url = request.build_absolute_uri(reverse('import-status', args=[report]))
+            return Response(
+                {'status': 'pending', 'status_url': url},
+                status=status.HTTP_202_ACCEPTED, headers={'Location': url},
+            )
+
+        # Large uploads are spooled to disk by Django; both files are streamed.
+        # The queries grow with the file, up to IMPORT_BACKGROUND_SIZE
+        exempt_from_budget(request)
+        stream = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+        with open(path, 'w', encoding='utf-8') as rejected:
+            result = run_import(self.spec_class(), stream, format, rejected)
+        data = asdict(result)
+        if result.rejected:
+            data['report'] = request.build_absolute_uri(reverse('import-report', args=[report]))
+        else:
+            path.unlink()
+            data['report'] = None
+        return Response(data, status=status.HTTP_200_OK)
+
+
+class ImportReportAPIView(APIView):
+    """
+    API endpoint serving the rejected rows of an import
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, report):
+        """
+        GET /api/imports/<report>/
+        """
+        path = report_path(report)
+        if not path.is_file():
+            raise Http404
+        return FileResponse(open(path, 'rb'), content_type='application/x-ndjson')
+
+
+class ImportStatusAPIView(APIView):
+    """
+    API endpoint polled for the outcome of a background import
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, report):
+        """
+        GET /api/imports/<report>/status/
+        ``status`` is pending, running, done (with the row counts and the
+        report URL, like a synchronous import) or failed (with the ``error``).
+        """
+        try:
+            data = json.loads(status_path(report).read_text())
+        except FileNotFoundError:
+            raise Http404
+        if data['status'] == 'done':
+            data['report'] = (
+                request.build_absolute_uri(reverse('import-report', args=[report]))
+                if data['rejected'] else None
+            )
+        return Response(data)
@@ -0,0 +1,357 @@
+"""
+Request metrics in the Prometheus text exposition format.
+
+MetricsMiddleware records, per route (the URL name, e.g. ``user-list`` or
+``tenants:tenant-detail``), the number of requests by method and status
+class, a latency histogram, and the queries and time spent in the database
+(counted by QueryBudgetMiddleware). Apps report the hits and misses of
+their caches with ``register_cache``, giving a hit ratio per cache, and the
+pooled database backend its pools with ``register_pool``.
+
+Recording only touches dicts of this process under an uncontended lock, a
+couple of microseconds per request. A background thread of each process
+writes its totals to its own file in settings.METRICS_DIR every
+settings.METRICS_FLUSH_INTERVAL seconds (atomically, through a rename).
+``/metrics`` sums the files of every process, so gunicorn workers add up
+without sharing memory.
+
+The counters of exited processes are folded into one archive file, so they
+never go backwards, and their files are deleted with their gauges: the
+directory holds a file per live process. Empty it when deploying.
+"""
+import atexit
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from pathlib import Path
+
+from django.conf import settings
+from django.http import HttpResponse
+
+# Upper bounds, in seconds, of the request latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Name -> (type, help, label names)
+FAMILIES = {
+    'http_requests_total': (
+        'counter', 'Requests served, by route, method and status class.',
+        ('route', 'method', 'status'),
+    ),
+    'http_request_duration_seconds': (
+        'histogram', 'Time to respond to a request, by route and method.',
+        ('route', 'method'),
+    ),
+    'db_queries_total': (
+        'counter', 'SQL queries run while serving requests, by route.',
+        ('route',),
+    ),
+    'db_query_duration_seconds_total': (
+        'counter', 'Time spent in SQL queries while serving requests, by route.',
+        ('route',),
+    ),
+    'cache_requests_total': (
+        'counter', 'Cache lookups, by cache and result (hit or miss).',
+        ('cache', 'result'),
+    ),
+    'cache_hit_ratio': (
+        'gauge', 'Share of cache lookups answered from the cache, by cache.',
+        ('cache',),
+    ),
+    'db_pool_connections': (
+        'gauge', 'Open connections of a database pool, by state (idle or in_use).',
+        ('pool', 'state'),
+    ),
+    'db_pool_checkouts_total': (
+        'counter', 'Connections taken from a database pool.',
+        ('pool',),
+    ),
+    'db_pool_waits_total': (
+        'counter', 'Checkouts that had to wait for a connection to be released.',
+        ('pool',),
+    ),
+    'db_pool_wait_seconds_total': (
+        'counter', 'Time spent waiting for a connection of a database pool.',
+        ('pool',),
+    ),
+    'db_pool_timeouts_total': (
+        'counter', 'Checkouts that gave up waiting for a connection.',
+        ('pool',),
+    ),
+    'db_pool_connections_opened_total': (
+        'counter', 'Connections opened by a database pool.',
+        ('pool',),
+    ),
+    'db_pool_connections_closed_total': (
+        'counter', 'Connections closed by a database pool (errors, lifetime, idle time).',
+        ('pool',),
+    ),
+}
+
+# db_pool_*_total family -> key of ConnectionPool.stats()
+POOL_COUNTERS = {
+    'db_pool_checkouts_total': 'checkouts',
+    'db_pool_waits_total': 'waits',
+    'db_pool_wait_seconds_total': 'wait_seconds',
+    'db_pool_timeouts_total': 'timeouts',
+    'db_pool_connections_opened_total': 'opened',
+    'db_pool_connections_closed_total': 'closed',
+}
+
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+# Counters of the processes that have exited, in METRICS_DIR
+ARCHIVE = 'exited.json'
+
+logger = logging.getLogger(__name__)
+
+_caches = {}
+_pools = {}
+
+
+def register_cache(name, stats):
+    """
+    Report the cache ``name``: ``stats()`` returns the hits and misses of
+    this process so far.
+    """
+    _caches[name] = stats
+
+
+def register_pool(name, stats):
+    """
+    Report the connection pool ``name``: ``stats()`` returns a dict like
+    config.db.pool.ConnectionPool.stats().
+    """
+    _pools[name] = stats
+
+
+class Registry:
+    """
+    The metrics of this process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flusher = None
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = {}
+            self.latency = {}
+            self.db_queries = {}
+            self.db_time = {}
+            self._file = None
+
+    def _after_fork(self):
+        # The parent's totals are in the parent's file, and its flusher
+        # thread did not come along
+        self._lock = threading.Lock()
+        self._flusher = None
+        self.reset()
+
+    def observe(self, route, method, status, duration, queries=0, query_time=0.0):
+        if method not in METHODS:
+            method = 'other'
+        key = (route, method)
+        status_key = (route, method, f'{status // 100}xx')
+        bucket = bisect_left(LATENCY_BUCKETS, duration)
+        with self._lock:
+            self.requests[status_key] = self.requests.get(status_key, 0) + 1
+            histogram = self.latency.get(key)
+            if histogram is None:
+                histogram = self.latency[key] = [0] * (len(LATENCY_BUCKETS) + 2)
+            histogram[bucket] += 1
+            histogram[-1] += duration
+            if queries:
+                self.db_queries[route] = self.db_queries.get(route, 0) + queries
+                self.db_time[route] = self.db_time.get(route, 0.0) + query_time
+            if self._flusher is None:
+                self._flusher = threading.Thread(
+                    target=self._flush_periodically, name='metrics-flush', daemon=True
+                )
+                self._flusher.start()
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(settings.METRICS_FLUSH_INTERVAL)
+            try:
+                self.flush()
+            except OSError:
+                logger.warning('Could not write the metrics of this process', exc_info=True)
+
+    def snapshot(self):
+        with self._lock:
+            data = {
+                'http_requests_total': [[list(k), v] for k, v in self.requests.items()],
+                'http_request_duration_seconds': [[list(k), list(v)] for k, v in self.latency.items()],
+                'db_queries_total': [[[k], v] for k, v in self.db_queries.items()],
+                'db_query_duration_seconds_total': [[[k], v] for k, v in self.db_time.items()],
+            }
+        data['cache_requests_total'] = []
+        for name, stats in _caches.items():
+            hits, misses = stats()
+            data['cache_requests_total'] += [[[name, 'hit'], hits], [[name, 'miss'], misses]]
+        data['db_pool_connections'] = []
+        for family in POOL_COUNTERS:
+            data[family] = []
+        for name, stats in _pools.items():
+            pool = stats()
+            data['db_pool_connections'] += [[[name, 'idle'], pool['idle']], [[name, 'in_use'], pool['in_use']]]
+            for family, key in POOL_COUNTERS.items():
+                data[family].append([[name], pool[key]])
+        return data
+
+    def flush(self):
+        """
+        Write the totals of this process to its file in settings.METRICS_DIR.
+        """
+        directory = Path(settings.METRICS_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        if self._file is None or self._file.parent != directory:
+            self._file = directory / f'{os.getpid()}-{uuid.uuid4().hex[:8]}.json'
+        temporary = self._file.with_suffix(f'.{threading.get_ident()}.tmp')
+        temporary.write_text(json.dumps(self.snapshot()))
+        os.replace(temporary, self._file)
+
+
+registry = Registry()
+atexit.register(lambda: registry._file is not None and registry.flush())
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=registry._after_fork)
+
+
+def _read(path):
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def _add(totals, data, gauges=True):
+    for name, samples in data.items():
+        if not gauges and FAMILIES.get(name, ('gauge',))[0] == 'gauge':
+            continue
+        family = totals.setdefault(name, {})
+        for labels, value in samples:
+            key = tuple(labels)
+            if isinstance(value, list):
+                current = family.get(key) or [0] * len(value)
+                family[key] = [a + b for a, b in zip(current, value)]
+            else:
+                family[key] = family.get(key, 0) + value
+    return totals
+
+
+def _exited(path):
+    """
+    Whether ``path`` is the file of a process that is gone. Files are named
+    after the writer's pid.
+    """
+    try:
+        os.kill(int(path.stem.split('-', 1)[0]), 0)
+    except (ValueError, OverflowError):
+        return False
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    return False
+
+
+def archive_exited(directory):
+    """
+    Fold the counters of the exited processes into ARCHIVE and delete their
+    files, with their gauges.
+    """
+    if not any(_exited(path) for path in directory.glob('*-*.json')):
+        return
+    with open(directory / '.lock', 'a') as lock:
+        # Another /metrics request may be archiving the same files
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        exited = [path for path in directory.glob('*-*.json') if _exited(path)]
+        archive = _add({}, _read(directory / ARCHIVE) or {})
+        for path in exited:
+            _add(archive, _read(path) or {}, gauges=False)
+        temporary = directory / f'{ARCHIVE}.{os.getpid()}.tmp'
+        temporary.write_text(json.dumps({
+            name: [[list(key), value] for key, value in family.items()]
+            for name, family in archive.items()
+        }))
+        os.replace(temporary, directory / ARCHIVE)
+        for path in exited:
+            path.unlink(missing_ok=True)
+
+
+def collect():
+    """
+    Sum the files of every process: metric name -> label values -> total.
+    """
+    registry.flush()
+    directory = Path(settings.METRICS_DIR)
+    archive_exited(directory)
+    totals = {}
+    for path in directory.glob('*.json'):
+        data = _read(path)
+        if data is not None:
+            _add(totals, data)
+    return totals
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _hit_ratios(lookups):
+    ratios = {}
+    for (cache, result), count in lookups.items():
+        hits, total = ratios.get((cache,), (0, 0))
+        ratios[(cache,)] = (hits + (count if result == 'hit' else 0), total + count)
+    return {key: hits / total if total else 0.0 for key, (hits, total) in ratios.items()}
+
+
+def exposition(totals):
+    """
+    Render ``collect()`` totals in the text exposition format.
+    """
+    totals = {**totals, 'cache_hit_ratio': _hit_ratios(totals.get('cache_requests_total', {}))}
+    lines = []
+    for name, (kind, help_text, labels) in FAMILIES.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for key, value in sorted(totals.get(name, {}).items()):
+            if kind != 'histogram':
+                lines.append(f'{name}{_labels(labels, key)} {_number(value)}')
+                continue
+            cumulative = 0
+            bounds = [*map(repr, LATENCY_BUCKETS), '+Inf']
+            for bound, count in zip(bounds, value[:-1]):
+                cumulative += count
+                lines.append(f'{name}_bucket{_labels(labels, key, [("le", bound)])} {cumulative}')
+            lines.append(f'{name}_sum{_labels(labels, key)} {_number(value[-1])}')
+            lines.append(f'{name}_count{_labels(labels, key)} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """
+    GET /metrics
+    """
+    return HttpResponse(exposition(collect()), content_type=CONTENT_TYPE)
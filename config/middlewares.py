@@ -1,15 +1,350 @@
 import json
+import logging
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.handlers.asgi import ASGIRequest
+from django.db import DatabaseError, connections
 from django.http import JsonResponse
 from django.utils.deprecation import MiddlewareMixin
 
+from .metrics import registry
+from .query_budget import QueryBudgetExceeded, QueryCounter, budget_for
+from .replicas import read_from, replica_for, route_reads, stick_to_primary
+
+logger = logging.getLogger(__name__)
+
+_missing = object()
+
+DEFERRED_TO_THREAD_MIDDLEWARE = 'config.middlewares.DeferredToThreadMiddleware'
+
+
+def defer_to_thread(request, func):
+    """
+    Have ``func``, synchronous database work the async stack needs before the
+    view, run in the one thread hop DeferredToThreadMiddleware makes per
+    request rather than in a hop of its own. Deferred functions run in order,
+    on the connections of the thread-sensitive executor the async ORM uses.
+    """
+    request.__dict__.setdefault('deferred_to_thread', []).append(func)
+
+
+def check_defers_to_thread(middleware):
+    """
+    Raise ImproperlyConfigured unless DeferredToThreadMiddleware comes after
+    ``middleware`` in settings.MIDDLEWARE: the work it defers would never
+    run, and async requests would query whatever schema the executor's
+    connection was left on.
+    """
+    path = f'{type(middleware).__module__}.{type(middleware).__qualname__}'
+    if path not in settings.MIDDLEWARE:
+        return
+    if DEFERRED_TO_THREAD_MIDDLEWARE not in settings.MIDDLEWARE[settings.MIDDLEWARE.index(path) + 1:]:
+        raise ImproperlyConfigured(f'{path} must come before {DEFERRED_TO_THREAD_MIDDLEWARE} in MIDDLEWARE')
+
+
+def exception_response(exception):
+    response_data = {
+        'error5': str(exception),
+        'type': exception.__class__.__name__
+    }
+    # Use the exception's status if available, otherwise default to 404
+    status = getattr(exception, 'status', 404)
+    return JsonResponse(response_data, status=status)
+
+
 class JsonExceptionMiddleware(MiddlewareMixin):
     """Middleware to format exceptions as JSON responses."""
 
     def process_exception(self, request, exception):
-        response_data = {
-            'error5': str(exception),
-            'type': exception.__class__.__name__
-        }
-        # Use the exception's status if available, otherwise default to 404
-        status = getattr(exception, 'status', 404)
-        return JsonResponse(response_data, status=status)
+        return exception_response(exception)
+
+
+class MetricsMiddleware:
+    """
+    Record the status, latency and database time of every request in
+    config.metrics, labelled by URL name. Goes first in MIDDLEWARE so the
+    latency covers the whole stack.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start = time.perf_counter()
+        response = self.get_response(request)
+        self._record(request, response, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        self._record(request, response, time.perf_counter() - start)
+        return response
+
+    def _record(self, request, response, duration):
+        match = request.resolver_match
+        counter = getattr(request, 'query_counter', None)
+        registry.observe(
+            match.view_name if match is not None else 'unmatched',
+            request.method,
+            response.status_code,
+            duration,
+            counter.count if counter is not None else 0,
+            counter.duration if counter is not None else 0.0,
+        )
+
+
+class TenantMiddleware:
+    """
+    Set ``request.tenant`` to the active Tenant whose domain matches the Host
+    header, or None. See tenants.resolver for the caching. Requests to a
+    tenant whose schema is not provisioned (yet) get a 503.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        from tenants.resolver import resolve_tenant
+        request.tenant = resolve_tenant(request.get_host())
+        return self._not_ready(request) or self.get_response(request)
+
+    async def __acall__(self, request):
+        from tenants.resolver import local_cache, normalize_host, resolve_tenant
+        host = request.get_host()
+        tenant = local_cache.get(normalize_host(host), _missing)
+        if tenant is _missing:
+            tenant = await sync_to_async(resolve_tenant)(host)
+        request.tenant = tenant
+        return self._not_ready(request) or await self.get_response(request)
+
+    def _not_ready(self, request):
+        if request.tenant is None or request.tenant.is_ready:
+            return None
+        from tenants.exceptions import TenantNotReadyException
+        response = exception_response(TenantNotReadyException())
+        response['Retry-After'] = '5'
+        return response
+
+
+class TenantSchemaMiddleware:
+    """
+    Route the request's queries to ``request.tenant.schema_name``, or to the
+    public schema when there is no tenant. Must run after TenantMiddleware.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        check_defers_to_thread(self)
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def _schema_name(self, request):
+        tenant = getattr(request, 'tenant', None)
+        return tenant.schema_name if tenant is not None else None
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        from tenants.schema import activate_schema
+        activate_schema(self._schema_name(request))
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        from tenants.schema import activate_schema
+        schema_name = self._schema_name(request)
+        defer_to_thread(request, lambda: activate_schema(schema_name))
+        return await self.get_response(request)
+
+
+class AsyncUrlconfMiddleware:
+    """
+    Route requests served by config.asgi to settings.ASYNC_ROOT_URLCONF,
+    so they reach the async views. WSGI requests keep ROOT_URLCONF.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        if isinstance(request, ASGIRequest):
+            request.urlconf = settings.ASYNC_ROOT_URLCONF
+        return await self.get_response(request)
+
+
+class ReplicaMiddleware:
+    """
+    Send the reads of safe requests to views marked with
+    config.replicas.replica_reads to a replica, and keep a client's reads on
+    the primary for a while after it writes. Goes after TenantSchemaMiddleware
+    and AsyncUrlconfMiddleware, and before QueryBudgetMiddleware so that the
+    replica lag checks are not charged to the view. Streamed rows are read
+    from the primary, after the view returns.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        check_defers_to_thread(self)
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def _replica(self, request):
+        alias = replica_for(request)
+        if alias is None:
+            return None
+        from tenants.schema import activate_schema, current_schema
+        try:
+            # The replica serves the tenant the request is on
+            activate_schema(current_schema(), alias)
+        except DatabaseError:
+            logger.warning('Could not use replica %s', alias, exc_info=True)
+            return None
+        return alias
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with read_from(self._replica(request)):
+            response = self.get_response(request)
+        stick_to_primary(request, response)
+        return response
+
+    async def __acall__(self, request):
+        with read_from(None):
+            if settings.DATABASE_REPLICAS:
+                defer_to_thread(request, lambda: route_reads(self._replica(request)))
+            response = await self.get_response(request)
+        stick_to_primary(request, response)
+        return response
+
+
+class QueryBudgetMiddleware:
+    """
+    Count the SQL queries of each request and hold views to the budget they
+    declare with config.query_budget.query_budget. Goes right before
+    DeferredToThreadMiddleware, after the others, so that tenant resolution
+    is not charged to the view.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        check_defers_to_thread(self)
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        counter = request.query_counter = QueryCounter()
+        counter.install(connections.all())
+        try:
+            response = self.get_response(request)
+        finally:
+            counter.uninstall(connections.all())
+        return self._check(request, response, counter)
+
+    async def __acall__(self, request):
+        # Connections are per thread: install on the ones of the thread-sensitive
+        # executor the async ORM runs its queries on, in the same hop as the
+        # work the middlewares above deferred
+        counter = request.query_counter = QueryCounter()
+        installed = []
+
+        def install():
+            installed.extend(connections.all())
+            counter.install(installed)
+
+        defer_to_thread(request, install)
+        try:
+            response = await self.get_response(request)
+        finally:
+            # The executor thread is idle once the view has returned
+            counter.uninstall(installed)
+        return self._check(request, response, counter)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget_view = view_func
+
+    def _check(self, request, response, counter):
+        if response.streaming:
+            return response
+        view = getattr(request, 'query_budget_view', None)
+        budget = budget_for(view, request.method) if view is not None else None
+        if settings.QUERY_BUDGET_HEADERS:
+            response['X-Query-Count'] = str(counter.count)
+            response['X-Query-Time'] = f'{counter.duration * 1000:.2f}'
+            if budget is not None:
+                response['X-Query-Budget'] = str(budget)
+        exempt = getattr(request, 'query_budget_exempt', False)
+        if budget is not None and counter.count > budget and not exempt:
+            view_class = getattr(view, 'view_class', view)
+            exception = QueryBudgetExceeded(
+                f'{view_class.__module__}.{view_class.__qualname__}',
+                request.method, counter.count, budget, counter.queries,
+            )
+            if settings.QUERY_BUDGET_ENFORCE:
+                raise exception
+            logger.warning('%s', exception)
+        return response
+
+
+class DeferredToThreadMiddleware:
+    """
+    Run the work the middlewares above deferred with defer_to_thread, in one
+    thread hop before the view. Goes last in MIDDLEWARE; the middlewares that
+    defer work refuse to start without it.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        deferred = request.__dict__.pop('deferred_to_thread', [])
+
+        def run():
+            for func in deferred:
+                func()
+
+        if deferred:
+            # sync_to_async copies the context variables the functions set
+            # (config.replicas.route_reads) back to this context
+            await sync_to_async(run)()
+        return await self.get_response(request)
@@ -0,0 +1,50 @@
+"""
+Migration operations shared by the apps.
+"""
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db.migrations.operations import AddIndex, RunSQL
+
+
+class AddIndexConcurrentlyIfPostgres(AddIndexConcurrently):
+    """
+    CREATE INDEX CONCURRENTLY on PostgreSQL, so large tables are not locked
+    while the index builds; a plain AddIndex elsewhere (SQLite in tests).
+    Postgres-only index types are left out of other databases.
+    Migrations using it must set ``atomic = False``.
+    """
+
+    def _is_postgres(self, schema_editor):
+        return schema_editor.connection.vendor == 'postgresql'
+
+    def _is_portable(self):
+        return not type(self.index).__module__.startswith('django.contrib.postgres')
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if self._is_postgres(schema_editor):
+            return super().database_forwards(app_label, schema_editor, from_state, to_state)
+        if self._is_portable():
+            AddIndex.database_forwards(self, app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if self._is_postgres(schema_editor):
+            return super().database_backwards(app_label, schema_editor, from_state, to_state)
+        if self._is_portable():
+            AddIndex.database_backwards(self, app_label, schema_editor, from_state, to_state)
+
+
+class RunSQLConcurrentlyIfPostgres(RunSQL):
+    """
+    RunSQL whose statements may use a ``{concurrently}`` placeholder, filled
+    with CONCURRENTLY on PostgreSQL and left empty elsewhere. For indexes
+    that AddIndexConcurrentlyIfPostgres cannot express, such as unique
+    expression indexes or indexes on another app's tables (auth_user).
+    Migrations using it must set ``atomic = False``.
+    """
+
+    def _run_sql(self, schema_editor, sqls):
+        keyword = 'CONCURRENTLY' if schema_editor.connection.vendor == 'postgresql' else ''
+        if isinstance(sqls, str):
+            sqls = sqls.format(concurrently=keyword)
+        else:
+            sqls = [sql.format(concurrently=keyword) for sql in sqls]
+        super()._run_sql(schema_editor, sqls)
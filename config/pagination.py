@@ -0,0 +1,151 @@
+import base64
+import json
+from functools import reduce
+from operator import or_
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Opaque-cursor pagination keyed on the values of ``ordering``.
+
+    Every page is fetched with a ``WHERE (a, b) > (x, y) ORDER BY a, b LIMIT n``
+    style query, so its cost only depends on the page size and not on how
+    deep the client is. The response body is left as a plain list and the
+    next/previous cursors are sent in the ``Link`` header.
+
+    ``ordering`` must be unique and backed by an index, e.g. ``('id',)`` or
+    ``('name', 'id')``. Fields prefixed with ``-`` are walked descending.
+    """
+    ordering = ('id',)
+    page_size = 100
+    max_page_size = 1000
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self._page_queryset(queryset, request)
+        return self._set_page(list(queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        Same as ``paginate_queryset`` for async views, fetching with async iteration.
+        """
+        queryset = self._page_queryset(queryset, request)
+        return self._set_page([item async for item in queryset])
+
+    def get_paginated_response(self, data):
+        return Response(data, headers=self.get_headers())
+
+    def get_headers(self):
+        links = []
+        next_link, previous_link = self.get_next_link(), self.get_previous_link()
+        if next_link:
+            links.append(f'<{next_link}>; rel="next"')
+        if previous_link:
+            links.append(f'<{previous_link}>; rel="prev"')
+        return {'Link': ', '.join(links)} if links else None
+
+    def _page_queryset(self, queryset, request):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.position, self.reverse = self.decode_cursor(request)
+
+        if self.position is not None:
+            queryset = queryset.filter(self._keyset_filter(self.position, self.reverse))
+        ordering = self._reversed_ordering() if self.reverse else self.ordering
+        return queryset.order_by(*ordering)[:self.page_size + 1]
+
+    def _set_page(self, results):
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if self.reverse:
+            results.reverse()
+            self.has_next, self.has_previous = self.position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.position is not None
+
+        self.page = results
+        return results
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(self._query_params(request)[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self._position(self.page[-1]), reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self._position(self.page[0]), reverse=True)
+
+    def decode_cursor(self, request):
+        encoded = self._query_params(request).get(self.cursor_query_param)
+        if encoded is None:
+            return None, False
+        try:
+            padding = '=' * (-len(encoded) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(encoded + padding))
+            position, reverse = payload['p'], bool(payload['r'])
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def encode_cursor(self, position, reverse):
+        payload = json.dumps(
+            {'p': position, 'r': int(reverse)},
+            cls=DjangoJSONEncoder, separators=(',', ':')
+        )
+        encoded = base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.cursor_query_param)
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    def _query_params(self, request):
+        # DRF requests expose query_params, plain Django (async) requests GET
+        return getattr(request, 'query_params', request.GET)
+
+    def _position(self, item):
+        fields = [field.lstrip('-') for field in self.ordering]
+        if isinstance(item, dict):
+            return [item[field] for field in fields]
+        return [getattr(item, field) for field in fields]
+
+    def _reversed_ordering(self):
+        return tuple(
+            field[1:] if field.startswith('-') else f'-{field}'
+            for field in self.ordering
+        )
+
+    def _keyset_filter(self, position, reverse):
+        """
+        Build ``(a > x) OR (a = x AND b > y) OR ...`` for the cursor position,
+        flipping each comparison for descending fields and backward pages.
+        """
+        clauses = []
+        for index, field in enumerate(self.ordering):
+            name = field.lstrip('-')
+            descending = field.startswith('-') != reverse
+            lookup = 'lt' if descending else 'gt'
+            equal = {
+                self.ordering[i].lstrip('-'): position[i] for i in range(index)
+            }
+            clauses.append(Q(**equal, **{f'{name}__{lookup}': position[index]}))
+        return reduce(or_, clauses)
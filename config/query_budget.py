@@ -0,0 +1,92 @@
+"""
+SQL query budgets per view.
+
+Views declare how many queries a request may run, in the url confs:
+
+    path('users/<int:user_id>/', query_budget(1, put=3)(UserDetailAPIView.as_view())),
+
+QueryBudgetMiddleware counts the queries and the time spent in them through
+``connection.execute_wrapper``. With settings.QUERY_BUDGET_HEADERS (on in
+DEBUG) they are sent back as ``X-Query-Count``, ``X-Query-Time`` (ms) and
+``X-Query-Budget`` headers. A request over its budget is logged, or raises
+QueryBudgetExceeded with settings.QUERY_BUDGET_ENFORCE (turned on by
+config.test_runner), failing the test that made it.
+
+Budgets cover everything the view does, authentication included: views
+restricted to logged in users allow for the session and user lookups.
+Streaming responses are not checked, their rows are read after the view returns.
+A view whose queries grow with its input can lift the budget of a request
+with ``exempt_from_budget``; the queries are still counted and reported.
+"""
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(Exception):
+    status = 500
+
+    def __init__(self, view, method, count, budget, queries):
+        self.view, self.method, self.count, self.budget = view, method, count, budget
+        detail = '\n'.join(f'  {sql}' for sql in queries)
+        super().__init__(f'{view} {method} ran {count} queries, over its budget of {budget}:\n{detail}')
+
+
+def query_budget(default=None, **methods):
+    """
+    Declare the query budget of a view: ``default`` for every HTTP method,
+    overridden per method by keyword, e.g. ``query_budget(1, post=4)``.
+    """
+    budgets = {method.upper(): budget for method, budget in methods.items()}
+
+    def decorator(view):
+        view.query_budget = (default, budgets)
+        return view
+
+    return decorator
+
+
+def exempt_from_budget(request):
+    """
+    Lift the budget of the view for ``request`` (a Django or DRF request).
+    """
+    request = getattr(request, '_request', request)
+    request.query_budget_exempt = True
+
+
+def budget_for(view, method):
+    """
+    The budget ``view`` declares for ``method``, or None.
+    """
+    default, budgets = getattr(view, 'query_budget', (None, {}))
+    return budgets.get(method, default)
+
+
+class QueryCounter:
+    """
+    Execute wrapper counting the queries run through it and their total time.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.queries.append(sql)
+
+    def install(self, connections):
+        for connection in connections:
+            connection.execute_wrappers.append(self)
+
+    def uninstall(self, connections):
+        for connection in connections:
+            if self in connection.execute_wrappers:
+                connection.execute_wrappers.remove(self)
@@ -0,0 +1,201 @@
+"""
+Read replicas of the primary ('default') database.
+
+Views opt in in the url confs, like query budgets:
+
+    path('users/', query_budget(1, post=5)(replica_reads(UserAPIView.as_view())), name='user-list'),
+
+For a GET (or HEAD, OPTIONS) to such a view ReplicaMiddleware picks one of
+settings.DATABASE_REPLICAS and ReplicaRouter sends the request's reads to
+it; writes, reads inside a transaction and everything else stay on the
+primary. A replica is skipped while it is more than REPLICA_MAX_LAG seconds
+behind, measured at most every REPLICA_LAG_CHECK_INTERVAL seconds per
+process, or when it cannot be reached: reads then go to the primary.
+
+Read-your-writes: a successful POST/PUT/PATCH/DELETE sets a cookie holding
+the time until which the client's reads stay on the primary,
+REPLICA_STICKY_SECONDS later. A replica serving reads is at most
+REPLICA_MAX_LAG behind as of its last check, so the window covers the lag
+when it is longer than REPLICA_MAX_LAG + REPLICA_LAG_CHECK_INTERVAL.
+
+Code reading data it will cache for other requests reads it from the
+primary through ``primary_reads()``, so a lagging replica cannot fill a
+cache entry the primary has already made obsolete.
+"""
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Apps whose reads never go to a replica: a session written by the previous
+# request must be found by the next one
+PRIMARY_APPS = {'sessions'}
+
+# How far a PostgreSQL standby is behind, in seconds: 0 when it has replayed
+# all the WAL it received, NULL on a primary
+LAG_SQL = (
+    'SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+    'ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END'
+)
+
+# Replica alias the reads of the current request go to, None for the primary
+_read_alias = ContextVar('replica_read_alias', default=None)
+
+# alias -> (time of the last check, whether the replica may serve reads)
+_health = {}
+
+
+def replica_reads(view):
+    """
+    Let the safe requests of ``view`` read from a replica.
+    """
+    view.replica_reads = True
+    return view
+
+
+@contextmanager
+def read_from(alias):
+    """
+    Send the reads of a block to the replica ``alias``, or to the primary for None.
+    """
+    token = _read_alias.set(alias)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def primary_reads():
+    return read_from(None)
+
+
+def route_reads(alias):
+    """
+    Send the reads of the rest of the current context to ``alias``, for code
+    that cannot wrap them in ``read_from``. Call it inside a ``read_from``
+    block, which undoes it on exit.
+    """
+    _read_alias.set(alias)
+
+
+def replica_lag(alias):
+    """
+    Seconds the replica ``alias`` is behind the primary. Replicas on other
+    vendors than PostgreSQL are taken to be up to date.
+    """
+    connection = connections[alias]
+    if connection.vendor != 'postgresql':
+        return 0.0
+    with connection.cursor() as cursor:
+        cursor.execute(LAG_SQL)
+        lag = cursor.fetchone()[0]
+    return float(lag or 0)
+
+
+def is_healthy(alias):
+    """
+    Whether the replica ``alias`` may serve reads, checking its lag once per
+    REPLICA_LAG_CHECK_INTERVAL.
+    """
+    now = time.monotonic()
+    checked_at, healthy = _health.get(alias, (None, False))
+    if checked_at is not None and now - checked_at < settings.REPLICA_LAG_CHECK_INTERVAL:
+        return healthy
+    try:
+        lag = replica_lag(alias)
+    except DatabaseError:
+        logger.warning('Could not check the lag of replica %s', alias, exc_info=True)
+        healthy = False
+    else:
+        healthy = lag <= settings.REPLICA_MAX_LAG
+        if not healthy:
+            logger.warning('Replica %s is %.1fs behind, reading from the primary', alias, lag)
+    _health[alias] = (now, healthy)
+    return healthy
+
+
+def choose_replica():
+    """
+    A replica able to serve reads, or None.
+    """
+    replicas = [alias for alias in settings.DATABASE_REPLICAS if is_healthy(alias)]
+    return random.choice(replicas) if replicas else None
+
+
+def sticky_until(request):
+    """
+    Time until which the reads of the client of ``request`` stay on the
+    primary, from its cookie; 0 when they don't.
+    """
+    try:
+        return float(request.COOKIES.get(settings.REPLICA_STICKY_COOKIE, 0))
+    except ValueError:
+        return 0.0
+
+
+def replica_for(request):
+    """
+    The replica the reads of ``request`` go to, or None for the primary.
+    """
+    if not settings.DATABASE_REPLICAS or request.method not in SAFE_METHODS:
+        return None
+    if sticky_until(request) > time.time():
+        return None
+    from django.urls import Resolver404, resolve
+    try:
+        match = resolve(request.path_info, getattr(request, 'urlconf', None))
+    except Resolver404:
+        return None
+    if not getattr(match.func, 'replica_reads', False):
+        return None
+    return choose_replica()
+
+
+def stick_to_primary(request, response):
+    """
+    After a successful write, keep the client's reads on the primary for
+    REPLICA_STICKY_SECONDS.
+    """
+    if not settings.DATABASE_REPLICAS or request.method in SAFE_METHODS or response.status_code >= 400:
+        return
+    response.set_cookie(
+        settings.REPLICA_STICKY_COOKIE,
+        f'{time.time() + settings.REPLICA_STICKY_SECONDS:.3f}',
+        max_age=settings.REPLICA_STICKY_SECONDS,
+        httponly=True,
+        samesite='Lax',
+    )
+
+
+class ReplicaRouter:
+    """
+    Route reads to the replica ReplicaMiddleware picked for the request.
+    """
+
+    def db_for_read(self, model, **hints):
+        alias = _read_alias.get()
+        if alias is None or model._meta.app_label in PRIMARY_APPS:
+            return DEFAULT_DB_ALIAS
+        # Inside a transaction, read what it wrote
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get the schema through replication
+        return False if db in settings.DATABASE_REPLICAS else None
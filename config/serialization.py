@@ -0,0 +1,118 @@
+"""
+Fast read path for list endpoints.
+
+A ModelSerializer spends most of its time in per-row, per-field machinery
+that, for plain columns, hands the database value back unchanged.
+ValuesSerializer skips it: rows come straight from ``QuerySet.values()``
+and FastJSONRenderer (config.renderers) encodes them with orjson when it is
+installed (the ``fast-json`` extra). The bytes are the same as the
+ModelSerializer and JSONRenderer pair would produce, including
+DateTimeField's ISO 8601 with ``Z``.
+
+Only serializers made of plain column fields are supported (see
+``ValuesSerializer.supports``); others raise TypeError.
+"""
+from django.utils import timezone
+from rest_framework import ISO_8601, fields as drf_fields, serializers
+from rest_framework.settings import api_settings
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+# Fields whose to_representation() is the identity for the values a
+# database returns for them (or, for datetimes, what the encoder produces)
+PASSTHROUGH_FIELDS = (
+    drf_fields.CharField,
+    drf_fields.IntegerField,
+    drf_fields.BooleanField,
+    drf_fields.ReadOnlyField,
+)
+
+_PASSTHROUGH_METHODS = {field.to_representation for field in PASSTHROUGH_FIELDS}
+
+
+def _passthrough_datetimes():
+    # orjson writes aware UTC datetimes exactly like DateTimeField does; in
+    # any other case the values go through DateTimeField.to_representation
+    return (
+        orjson is not None
+        and api_settings.DATETIME_FORMAT == ISO_8601
+        and timezone.get_current_timezone_name() == 'UTC'
+    )
+
+
+class ValuesSerializer:
+    """
+    Serialize querysets with ``.values()`` the same way as ``serializer``,
+    a ModelSerializer instance (possibly narrowed by a sparse fieldset).
+    """
+
+    def __init__(self, serializer):
+        if not self.supports(serializer):
+            raise TypeError(f'{type(serializer).__name__} has fields that are not plain columns')
+        self.serializer = serializer
+        self.fields = [
+            name for name, field in serializer.fields.items() if not field.write_only
+        ]
+        self.extra = []
+
+    @classmethod
+    def supports(cls, serializer):
+        """
+        Whether every output field of ``serializer`` reads a column as is.
+        """
+        if type(serializer).to_representation is not serializers.Serializer.to_representation:
+            return False
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            if field.source != name:
+                return False
+            if type(field).to_representation is drf_fields.DateTimeField.to_representation:
+                if hasattr(field, 'format'):
+                    return False
+            elif type(field).to_representation not in _PASSTHROUGH_METHODS:
+                return False
+        return True
+
+    def values(self, queryset, *extra):
+        """
+        ``queryset.values()`` for the serializer fields plus ``extra`` ones
+        (e.g. the pagination ordering), which ``to_representation`` drops.
+        """
+        self.extra = [name.lstrip('-') for name in extra if name.lstrip('-') not in self.fields]
+        return queryset.values(*self.fields, *self.extra)
+
+    def to_representation(self, rows):
+        """
+        Turn a page of value rows into the serializer's output. Rows holding
+        extra fields are copied, so they can still be read afterwards.
+        """
+        if not self.extra and not self._datetimes():
+            return rows
+        return list(self.iter_representation(rows))
+
+    def iter_representation(self, rows):
+        """
+        Lazy ``to_representation`` for streamed rows.
+        """
+        datetimes = self._datetimes()
+        if not self.extra and not datetimes:
+            yield from rows
+            return
+        for row in rows:
+            row = {name: row[name] for name in self.fields}
+            for name, field in datetimes:
+                if row[name] is not None:
+                    row[name] = field.to_representation(row[name])
+            yield row
+
+    def _datetimes(self):
+        if _passthrough_datetimes():
+            return []
+        return [
+            (name, self.serializer.fields[name]) for name in self.fields
+            if isinstance(self.serializer.fields[name], drf_fields.DateTimeField)
+        ]
@@ -37,12 +37,14 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',  # Django REST Framework
     'cdt',
     'tenants',
 ]
 
 MIDDLEWARE = [
+    'config.middlewares.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -51,10 +53,47 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'config.middlewares.JsonExceptionMiddleware',
+    'config.middlewares.TenantMiddleware',
+    'config.middlewares.TenantSchemaMiddleware',
+    'config.middlewares.AsyncUrlconfMiddleware',
+    'config.middlewares.ReplicaMiddleware',
+    'config.middlewares.QueryBudgetMiddleware',
+    # Runs the database work of the middlewares above in one thread hop
+    # under ASGI: keep it last
+    'config.middlewares.DeferredToThreadMiddleware',
 ]
 
+# SQL query budgets declared by the views (see config.query_budget): counts
+# are sent as X-Query-* headers in DEBUG, and going over a budget fails
+# the request under config.test_runner (it is only logged otherwise)
+QUERY_BUDGET_HEADERS = DEBUG
+QUERY_BUDGET_ENFORCE = False
+
+# Enforces the query budgets and adds the test 'replica' database
+TEST_RUNNER = 'config.test_runner.TestRunner'
+
+# Request metrics served on /metrics (see config.metrics). Each process
+# writes its totals to its own file in this directory, from a background
+# thread every interval in seconds; /metrics adds the files up.
+METRICS_DIR = '/tmp/nisman-metrics'
+METRICS_FLUSH_INTERVAL = 1.0
+
+# Rows rejected by file imports through the API (see config.imports), one
+# NDJSON report per import, served on /api/imports/<id>/ and deleted after
+# the TTL in seconds. Uploads larger than IMPORT_BACKGROUND_SIZE bytes are
+# imported by a pool of IMPORT_WORKERS threads (inline when IMPORT_ASYNC is
+# off) and polled on /api/imports/<id>/status/.
+IMPORT_REPORT_DIR = '/tmp/nisman-imports'
+IMPORT_REPORT_TTL = 24 * 60 * 60
+IMPORT_BACKGROUND_SIZE = 5 * 1024 * 1024
+IMPORT_WORKERS = 2
+IMPORT_ASYNC = True
+
 ROOT_URLCONF = 'config.urls'
 
+# URLconf for requests served by config.asgi, routing the API to async views
+ASYNC_ROOT_URLCONF = 'config.urls_async'
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -79,15 +118,112 @@ WSGI_APPLICATION = 'config.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        # PostgreSQL with a connection pool per process (see config.db.pool)
+        'ENGINE': 'config.db.postgresql',
         'NAME': 'nisman_db',
         'USER': 'nisman_user',
         'PASSWORD': 'nisman_password',
         'HOST': 'localhost',
         'PORT': '5432',
+        # Give connections back to the pool at the end of every request; the
+        # pool keeps them open, and their tenant search_path, between requests
+        'CONN_MAX_AGE': 0,
+        # Connections kept open (warmed up at worker boot) and at most open;
+        # seconds to wait for a free one, before closing one (MAX_LIFETIME,
+        # or MAX_IDLE above MIN_SIZE) and before checking an idle one
+        'POOL': {
+            'MIN_SIZE': 2,
+            'MAX_SIZE': 10,
+            'TIMEOUT': 10,
+            'MAX_LIFETIME': 1800,
+            'MAX_IDLE': 300,
+            'CHECK_INTERVAL': 30,
+        },
     }
 }
 
+# Read replicas of 'default', by alias in DATABASES (see config.replicas).
+# Safe requests to views marked with replica_reads read from one of them;
+# after a write a client reads from the primary for REPLICA_STICKY_SECONDS
+# (kept in a cookie), which should exceed REPLICA_MAX_LAG plus
+# REPLICA_LAG_CHECK_INTERVAL. Replicas further behind than REPLICA_MAX_LAG
+# seconds, checked at most once per interval, are skipped for the primary.
+# TenantMigrationRouter only acts while tenant schemas are migrated.
+DATABASE_ROUTERS = ['tenants.schema.TenantMigrationRouter', 'config.replicas.ReplicaRouter']
+DATABASE_REPLICAS = []
+REPLICA_STICKY_SECONDS = 10
+REPLICA_MAX_LAG = 5
+REPLICA_LAG_CHECK_INTERVAL = 2
+REPLICA_STICKY_COOKIE = 'primary_reads_until'
+
+# Schema holding shared tables (tenant registry); tenants get their own
+# schema named by Tenant.schema_name (see tenants.schema)
+TENANT_PUBLIC_SCHEMA = 'public'
+
+# New tenant schemas are cloned from this pre-migrated schema on a thread
+# pool (see tenants.provisioning and the prepare_tenant_template command)
+TENANT_TEMPLATE_SCHEMA = 'tenant_template'
+# Apps whose tables each tenant schema gets a copy of, except the shared
+# models; every other table only lives in the public schema
+TENANT_APPS = ['auth', 'cdt']
+TENANT_SHARED_MODELS = ['auth.Permission']
+TENANT_PROVISIONING_ASYNC = True
+TENANT_PROVISIONING_WORKERS = 4
+# Seconds after which a tenant still PROVISIONING is taken for the job of a
+# worker that died, and provision_pending_tenants starts it over
+TENANT_PROVISIONING_TIMEOUT = 10 * 60
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': 'redis://localhost:6379/0',
+    }
+}
+
+# Seconds a serialized Preferencias stays in the cache (see cdt.cache)
+PREFERENCIAS_CACHE_TIMEOUT = 300
+
+# Seconds a version token (see cdt.cache) lives without a write. Longer than
+# PREFERENCIAS_CACHE_TIMEOUT: a lost token orphans the cached copy and changes
+# the ETag clients revalidate against.
+PREFERENCIAS_VERSION_TIMEOUT = 7 * 24 * 60 * 60
+
+# Host -> Tenant resolution (see tenants.resolver): in-process LRU in front of
+# the shared cache. Unknown hosts are cached for the negative timeout.
+TENANT_LOCAL_CACHE_SIZE = 1024
+TENANT_LOCAL_CACHE_TIMEOUT = 5
+TENANT_CACHE_TIMEOUT = 300
+TENANT_NEGATIVE_CACHE_TIMEOUT = 30
+
+
+# In-process bitmap index answering Preferencias segment counts (see
+# cdt.bitmaps), one per tenant schema up to MAX_INDEXES per process.
+# Reloaded once older than the max age, in seconds, so writes made by
+# other processes show up.
+PREFERENCIAS_BITMAP_INDEX = True
+PREFERENCIAS_BITMAP_MAX_AGE = 60
+PREFERENCIAS_BITMAP_MAX_INDEXES = 32
+PREFERENCIAS_BITMAP_CHUNK_SIZE = 10000
+
+
+# Campaign fan-out to Pub/Sub (see cdt.fanout). The emulator host matches
+# the pubsub service of docker-compose.yml; set it to None against GCP.
+PUBSUB_PROJECT_ID = 'nisman'
+PUBSUB_EMULATOR_HOST = 'localhost:8085'
+PUBSUB_FANOUT_TOPIC = 'notificaciones'
+FANOUT_BATCH_MAX_MESSAGES = 1000
+FANOUT_BATCH_MAX_BYTES = 1024 * 1024
+FANOUT_BATCH_MAX_LATENCY = 0.05
+FANOUT_FLOW_CONTROL_MAX_MESSAGES = 20000
+FANOUT_FLOW_CONTROL_MAX_BYTES = 32 * 1024 * 1024
+FANOUT_MAX_IN_FLIGHT = 20000
+FANOUT_CHECKPOINT_EVERY = 10000
+FANOUT_CHUNK_SIZE = 5000
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -107,6 +243,11 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Process pool used by cdt.hashing for batch user provisioning.
+# None uses one worker per CPU; batches smaller than the minimum are hashed inline.
+PASSWORD_HASHING_WORKERS = None
+PASSWORD_HASHING_MIN_BATCH = 16
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/4.2/topics/i18n/
@@ -0,0 +1,31 @@
+"""
+Test runner of ``manage.py test`` (settings.TEST_RUNNER).
+
+Turns on settings.QUERY_BUDGET_ENFORCE, so a request over its query budget
+fails the test that made it, and adds the 'replica' database
+cdt.test_replicas reads from: a test mirror of 'default', unless the
+settings already declare one.
+"""
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+REPLICA = 'replica'
+
+
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._enforce_budgets = override_settings(QUERY_BUDGET_ENFORCE=True)
+        self._enforce_budgets.enable()
+        # Before the aliases the tests use are collected and set up
+        if REPLICA not in settings.DATABASES:
+            default = connections.settings[DEFAULT_DB_ALIAS]
+            connections.settings[REPLICA] = {
+                **default, 'TEST': {**default['TEST'], 'MIRROR': DEFAULT_DB_ALIAS},
+            }
+
+    def teardown_test_environment(self, **kwargs):
+        self._enforce_budgets.disable()
+        super().teardown_test_environment(**kwargs)
@@ -4,9 +4,20 @@ Main URL configuration for the project.
 from django.contrib import admin
 from django.urls import path, include
 
+from .imports import ImportReportAPIView, ImportStatusAPIView
+from .metrics import metrics_view
+from .query_budget import query_budget
+
 urlpatterns = [
     # Admin interface
     path('admin/', admin.site.urls),
+
+    # Prometheus scrape target
+    path('metrics', metrics_view, name='metrics'),
+
+    # Rejected rows of file imports
+    path('api/imports/<uuid:report>/', query_budget(2)(ImportReportAPIView.as_view()), name='import-report'),
+    path('api/imports/<uuid:report>/status/', query_budget(2)(ImportStatusAPIView.as_view()), name='import-status'),
     
     # Include URLs from tenants app
     path('api/', include('tenants.urls')),
@@ -1,9 +1,30 @@
 from django.contrib import admin
+from django.contrib.admin.views.main import ORDER_VAR, ChangeList
 from .models import Tenant
 
+
+class TenantChangeList(ChangeList):
+    def get_ordering(self, request, queryset):
+        # Best matches first while searching, unless a column was clicked
+        if self.query.strip() and ORDER_VAR not in self.params:
+            return ['-score', 'id']
+        return super().get_ordering(request, queryset)
+
+
 @admin.register(Tenant)
 class TenantAdmin(admin.ModelAdmin):
-    list_display = ('name', 'schema_name', 'domain', 'is_active', 'created_at')
-    list_filter = ('is_active',)
+    list_display = ('name', 'schema_name', 'domain', 'is_active', 'provisioning_status', 'created_at')
+    list_filter = ('is_active', 'provisioning_status')
     search_fields = ('name', 'schema_name', 'domain')
     ordering = ('name',)
+
+    def get_changelist(self, request, **kwargs):
+        return TenantChangeList
+
+    def get_search_results(self, request, queryset, search_term):
+        # Trigram search (TenantQuerySet.search) instead of one icontains per
+        # word and field; TenantChangeList ranks the results
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        return queryset.search(search_term), False
@@ -0,0 +1,31 @@
+"""
+URL configuration for the tenants app under ASGI.
+Same routes and names as tenants.urls, served by the async views.
+"""
+from django.urls import path
+from . import async_views
+from .imports import TenantImport
+from config.imports import ImportAPIView
+from config.query_budget import query_budget
+from config.replicas import replica_reads
+
+app_name = 'tenants'
+
+urlpatterns = [
+    # Tenants endpoint
+    path('tenants/', query_budget(1, post=3)(replica_reads(async_views.TenantsAPIView.as_view())), name='user-list'),
+    path('tenants/search/', query_budget(3)(async_views.TenantSearchAPIView.as_view()), name='tenant-search'),
+    # File imports: the budget covers the session and user lookups and handing
+    # a large file to the background job; files imported inline run queries
+    # growing with them and are exempt (see config.imports)
+    path('tenants/import/', query_budget(post=2)(ImportAPIView.as_view(spec_class=TenantImport)), name='tenant-import'),
+    path('tenants/<int:tenant_id>/', query_budget(4, put=6)(async_views.TenantDetailAPIView.as_view()), name='tenant-detail'),
+    path(
+        'tenants/<int:tenant_id>/provisioning/',
+        query_budget(1)(async_views.TenantProvisioningAPIView.as_view()),
+        name='tenant-provisioning'
+    ),
+
+    # Nisman endpoint
+    path('tenants/nisman/', query_budget(post=4)(async_views.NismanAPIView.as_view()), name='nisman'),
+]
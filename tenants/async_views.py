@@ -0,0 +1,230 @@
+"""
+Async versions of the tenants API views, routed by config.urls_async under ASGI.
+"""
+from asgiref.sync import sync_to_async
+from django.http import Http404
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from .models import Tenant
+from .serializers import TenantSerializer, TenantProvisioningSerializer, TenantSearchSerializer
+from .provisioning import schedule_provisioning
+from .pagination import TenantPagination, TenantSearchPagination
+from .exceptions import InvalidSearchException, InvalidUsernameException, UserAlreadyExistsException
+from config.async_views import AsyncAPIView, authenticate, json_response, request_data, wants_ndjson
+from config.conditional import not_modified, set_validators, timestamp_validators
+from config.renderers import FastJSONRenderer, andjson_response
+from config.serialization import ValuesSerializer
+
+
+async def _save_tenant(serializer):
+    """
+    Validate and save ``serializer`` off the event loop: the unique
+    validators on schema_name/domain query the database synchronously.
+    """
+    if not await sync_to_async(serializer.is_valid)():
+        return None
+    return await sync_to_async(serializer.save)()
+
+
+async def _create_tenant(serializer):
+    """
+    Save a new tenant and schedule the provisioning of its schema.
+    """
+    tenant = await _save_tenant(serializer)
+    if tenant is not None:
+        await sync_to_async(schedule_provisioning)(tenant)
+    return tenant
+
+
+async def _get_user(request):
+    """
+    The DRF-authenticated user of ``request`` and None, or None and the 403
+    response the sync views answer with.
+    """
+    try:
+        user = await authenticate(request)
+    except APIException as exc:
+        # As in the sync view: session authentication comes first and sends
+        # no WWW-Authenticate challenge, so DRF answers 403 rather than 401
+        return None, json_response({'detail': exc.detail}, status=status.HTTP_403_FORBIDDEN)
+    if user is None:
+        return None, json_response(
+            {'detail': 'Authentication credentials were not provided.'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    return user, None
+
+
+class TenantsAPIView(AsyncAPIView):
+    """
+    API endpoint for tenants operations
+    """
+
+    async def get(self, request):
+        """
+        GET /api/tenants/
+        List tenants, one page at a time (?cursor=&page_size=)
+        With Accept: application/x-ndjson, stream every tenant instead
+        """
+        if wants_ndjson(request):
+            return andjson_response(Tenant.objects.order_by('name', 'id'), TenantSerializer)
+
+        paginator = TenantPagination()
+        fast = ValuesSerializer(TenantSerializer())
+        queryset = fast.values(Tenant.objects.all(), *paginator.ordering)
+        tenants = await paginator.apaginate_queryset(queryset, request)
+        return json_response(
+            fast.to_representation(tenants),
+            headers=paginator.get_headers(),
+            renderer_class=FastJSONRenderer,
+        )
+
+    async def post(self, request):
+        """
+        POST /api/tenants/
+        Create a new tenant; its schema is provisioned in the background,
+        poll GET /api/tenants/{tenant_id}/provisioning/ for the outcome
+        """
+        serializer = TenantSerializer(data=request_data(request))
+        tenant = await _create_tenant(serializer)
+        if tenant is None:
+            return json_response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        return json_response(
+            {**TenantSerializer(tenant).data, 'provisioning_status': tenant.provisioning_status},
+            status=status.HTTP_201_CREATED
+        )
+
+
+class TenantSearchAPIView(AsyncAPIView):
+    """
+    API endpoint for support staff to find tenants
+    """
+
+    async def get(self, request):
+        """
+        GET /api/tenants/search/?q=
+        Tenants whose name, schema or domain resemble q, best match first,
+        one page at a time (?limit=&cursor=)
+        """
+        user, denied = await _get_user(request)
+        if denied:
+            return denied
+        if not user.is_staff:
+            return json_response(
+                {'detail': 'You do not have permission to perform this action.'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        term = request.GET.get('q', '').strip()
+        if not term:
+            raise InvalidSearchException()
+
+        paginator = TenantSearchPagination()
+        tenants = await paginator.apaginate_queryset(Tenant.objects.all().search(term), request)
+        serializer = TenantSearchSerializer(tenants, many=True)
+        return json_response(serializer.data, headers=paginator.get_headers())
+
+
+class TenantDetailAPIView(AsyncAPIView):
+    """
+    API endpoint for specific tenant operations
+    """
+
+    async def _get_tenant(self, tenant_id):
+        try:
+            return await Tenant.objects.aget(id=tenant_id)
+        except Tenant.DoesNotExist:
+            raise Http404('No Tenant matches the given query.')
+
+    async def get(self, request, tenant_id):
+        """
+        GET /api/tenants/{tenant_id}/
+        Get specific tenant details
+        Conditional on If-None-Match / If-Modified-Since against updated_at
+        """
+        user, denied = await _get_user(request)
+        if denied:
+            return denied
+        updated_at = await (
+            Tenant.objects.filter(id=tenant_id).values_list('updated_at', flat=True).afirst()
+        )
+        if updated_at is None:
+            raise Http404('No Tenant matches the given query.')
+        validators = timestamp_validators(updated_at)
+        response = not_modified(request, *validators)
+        if response is None:
+            tenant = await self._get_tenant(tenant_id)
+            response = json_response(TenantSerializer(tenant).data)
+        return set_validators(response, *validators)
+
+    async def put(self, request, tenant_id):
+        """
+        PUT /api/tenants/{tenant_id}/
+        Update specific tenant
+        """
+        user, denied = await _get_user(request)
+        if denied:
+            return denied
+        tenant = await self._get_tenant(tenant_id)
+        if not user.is_staff:
+            return json_response(
+                {'error': 'Not authorized'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        serializer = TenantSerializer(tenant, data=request_data(request), partial=True)
+        tenant = await _save_tenant(serializer)
+        if tenant is None:
+            return json_response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        return json_response(TenantSerializer(tenant).data)
+
+
+class TenantProvisioningAPIView(AsyncAPIView):
+    """
+    API endpoint for a tenant's provisioning status
+    """
+
+    async def get(self, request, tenant_id):
+        """
+        GET /api/tenants/{tenant_id}/provisioning/
+        Poll the schema provisioning status of a tenant
+        """
+        try:
+            tenant = await Tenant.objects.aget(id=tenant_id)
+        except Tenant.DoesNotExist:
+            raise Http404('No Tenant matches the given query.')
+        return json_response(TenantProvisioningSerializer(tenant).data)
+
+
+class NismanAPIView(AsyncAPIView):
+    """
+    API endpoint for /tenants/nisman POST
+    """
+
+    async def post(self, request):
+        username = request_data(request).get('username', '')
+
+        if not username.strip():
+            raise InvalidUsernameException()
+
+        if await Tenant.objects.filter(name=username).aexists():
+            raise UserAlreadyExistsException()
+
+        data = {
+            'name': username,
+            'schema_name': username,
+            'domain': f'{username}.example.com',
+            'is_active': True
+        }
+        serializer = TenantSerializer(data=data)
+        tenant = await _create_tenant(serializer)
+        if tenant is None:
+            return json_response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        return json_response(
+            {
+                'message': f'Tenant "{username}" created successfully',
+                'tenant_id': tenant.id,
+                'provisioning_status': tenant.provisioning_status,
+            },
+            status=status.HTTP_201_CREATED
+        )
@@ -16,4 +16,22 @@ class UserAlreadyExistsException(Exception):
 
     def __init__(self, message="User already exists"):
         self.message = message
-        super().__init__(self.message) 
\ No newline at end of file
+        super().__init__(self.message)
+
+
+class InvalidSearchException(Exception):
+    """Exception raised for an empty search term."""
+    status = status.HTTP_400_BAD_REQUEST
+
+    def __init__(self, message="Search term cannot be empty"):
+        self.message = message
+        super().__init__(self.message)
+
+
+class TenantNotReadyException(Exception):
+    """Exception raised for requests to a tenant whose schema is not provisioned."""
+    status = status.HTTP_503_SERVICE_UNAVAILABLE
+
+    def __init__(self, message="Tenant is not ready yet"):
+        self.message = message
+        super().__init__(self.message)
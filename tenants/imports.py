@@ -0,0 +1,45 @@
+"""
+Import spec for tenants (see config.imports).
+"""
+from config.imports import ImportSpec
+from .models import Tenant
+from .provisioning import schedule_provisioning
+from .resolver import invalidate_tenant_hosts
+from .serializers import TenantSerializer
+
+DOMAIN_TAKEN = 'Tenant with this Domain already exists.'
+
+
+class TenantImport(ImportSpec):
+    """
+    Tenants matched on schema_name. New tenants are provisioned once the
+    chunk commits.
+    """
+    model = Tenant
+    serializer_class = TenantSerializer
+    key = 'schema_name'
+    fields = ('schema_name', 'name', 'domain', 'is_active')
+
+    def check(self, rows):
+        # Domains must be unique, within the chunk and against the tenants
+        # with another schema_name
+        domains = {values['domain'] for values in rows.values()}
+        owners = dict(Tenant.objects.filter(domain__in=domains).values_list('domain', 'schema_name'))
+        errors = {}
+        for line, values in rows.items():
+            owner = owners.setdefault(values['domain'], values['schema_name'])
+            if owner != values['schema_name']:
+                errors[line] = {'domain': [DOMAIN_TAKEN]}
+        return errors
+
+    def before_merge(self, keys):
+        return list(Tenant.objects.filter(schema_name__in=keys).values_list('domain', flat=True))
+
+    def after_merge(self, keys, created, state):
+        # No save signals: forget the old and new hosts, provision the new tenants
+        tenants = list(Tenant.objects.filter(schema_name__in=keys).only('pk', 'schema_name', 'domain'))
+        invalidate_tenant_hosts(*state, *(tenant.domain for tenant in tenants))
+        created = set(created)
+        for tenant in tenants:
+            if tenant.schema_name in created:
+                schedule_provisioning(tenant)
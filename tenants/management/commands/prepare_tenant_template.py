@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from tenants.provisioning import migrate_tenant_schemas, prepare_template_schema, provision_pending_tenants
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the template schema new tenant schemas are cloned from, '
+        'migrate the schemas of the existing tenants, then provision the '
+        'tenants still pending or stuck provisioning. Run it after every '
+        'deploy that adds migrations, once public is migrated.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retry-failed', action='store_true',
+                            help='Provision the tenants whose provisioning failed again.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Tenant schemas require PostgreSQL.')
+        prepare_template_schema(verbosity=options['verbosity'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Template schema "{settings.TENANT_TEMPLATE_SCHEMA}" is ready.'
+        ))
+        migrated = migrate_tenant_schemas(verbosity=options['verbosity'])
+        self.stdout.write(self.style.SUCCESS(f'Migrated {migrated} tenant schemas.'))
+        ready = provision_pending_tenants(retry_failed=options['retry_failed'])
+        if ready:
+            self.stdout.write(self.style.SUCCESS(f'Provisioned {ready} pending tenants.'))
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.21 on 2026-10-18 09:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tenants', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='tenant',
+            index=models.Index(fields=['name', 'id'], name='tenant_name_id_idx'),
+        ),
+    ]
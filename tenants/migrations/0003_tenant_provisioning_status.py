@@ -0,0 +1,29 @@
+# Generated by Django 4.2.21 on 2026-10-18 09:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tenants', '0002_tenant_name_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tenant',
+            name='provisioning_error',
+            field=models.TextField(blank=True, verbose_name='Provisioning Error'),
+        ),
+        # Existing tenants start READY; 0005 resets those without a schema
+        migrations.AddField(
+            model_name='tenant',
+            name='provisioning_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('provisioning', 'Provisioning'), ('ready', 'Ready'), ('failed', 'Failed')], default='ready', max_length=20, verbose_name='Provisioning Status'),
+        ),
+        migrations.AlterField(
+            model_name='tenant',
+            name='provisioning_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('provisioning', 'Provisioning'), ('ready', 'Ready'), ('failed', 'Failed')], default='pending', max_length=20, verbose_name='Provisioning Status'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.21 on 2026-10-18 09:30
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+import django.db.models.functions.text
+
+from config.migration_operations import AddIndexConcurrentlyIfPostgres
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('tenants', '0003_tenant_provisioning_status'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        AddIndexConcurrentlyIfPostgres(
+            model_name='tenant',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('name'), name='public.gin_trgm_ops'), name='tenant_name_trgm_idx'),
+        ),
+        AddIndexConcurrentlyIfPostgres(
+            model_name='tenant',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('schema_name'), name='public.gin_trgm_ops'), name='tenant_schema_trgm_idx'),
+        ),
+        AddIndexConcurrentlyIfPostgres(
+            model_name='tenant',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('domain'), name='public.gin_trgm_ops'), name='tenant_domain_trgm_idx'),
+        ),
+    ]
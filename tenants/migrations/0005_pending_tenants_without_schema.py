@@ -0,0 +1,33 @@
+from django.db import migrations
+
+
+def reset_tenants_without_schema(apps, schema_editor):
+    """
+    0003 marked every existing tenant READY, but tenants created before
+    template provisioning have no schema: put those back to PENDING so that
+    prepare_tenant_template provisions them.
+    """
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+    Tenant = apps.get_model('tenants', 'Tenant')
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT nspname FROM pg_namespace')
+        schemas = {row[0] for row in cursor.fetchall()}
+    (
+        Tenant.objects.using(connection.alias)
+        .filter(provisioning_status='ready')
+        .exclude(schema_name__in=schemas)
+        .update(provisioning_status='pending')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tenants', '0004_tenant_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(reset_tenants_without_schema, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,15 @@
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import connections, models
+from django.db.models.functions import Cast, Greatest, Upper
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
+SEARCH_FIELDS = ('name', 'schema_name', 'domain')
+
+# pg_trgm is installed in the public schema
+TRGM_OPCLASS = 'public.gin_trgm_ops'
+
 
 class TenantQuerySet(models.QuerySet):
     # Aquí puedes agregar métodos custom, por ejemplo:
@@ -10,6 +19,49 @@ class TenantQuerySet(models.QuerySet):
     def with_name(self, name):
         return self.filter(name__icontains=name)
 
+    def search(self, term):
+        """
+        Tenants whose name, schema_name or domain resemble ``term``, annotated
+        with a ``score`` in [0, 1]. On PostgreSQL this is a pg_trgm similarity
+        or substring match served by the trigram indexes on UPPER(field);
+        elsewhere a plain substring match with a constant score.
+        """
+        if connections[self.db].vendor != 'postgresql':
+            matches = models.Q()
+            for field in SEARCH_FIELDS:
+                matches |= models.Q(**{f'{field}__icontains': term})
+            return self.filter(matches).annotate(
+                score=models.Value(1.0, output_field=models.FloatField())
+            )
+
+        matches = models.Q()
+        for field in SEARCH_FIELDS:
+            # Same expressions as the indexes, so both lookups can use them
+            matches |= models.Q(**{f'search_{field}__trigram_similar': term.upper()})
+            matches |= models.Q(**{f'{field}__icontains': term})
+        score = Greatest(*(TrigramSimilarity(field, term) for field in SEARCH_FIELDS))
+        return (
+            self.alias(**{f'search_{field}': Upper(field) for field in SEARCH_FIELDS})
+            .filter(matches)
+            # real -> double precision, so cursor values round-trip exactly
+            .annotate(score=Cast(score, output_field=models.FloatField()))
+        )
+
+    def deactivate(self):
+        return self.update(is_active=False)
+
+    def update(self, **kwargs):
+        # Bulk updates skip save signals, so drop the cached host resolution here
+        from .resolver import invalidate_tenant_hosts
+        hosts = list(self.values_list('domain', flat=True))
+        # auto_now only applies to save(); keep the detail view's validators honest
+        kwargs.setdefault('updated_at', timezone.now())
+        rows = super().update(**kwargs)
+        if isinstance(kwargs.get('domain'), str):
+            hosts.append(kwargs['domain'])
+        invalidate_tenant_hosts(*hosts)
+        return rows
+
 
 class TenantManager(models.Manager):
     def get_queryset(self):
@@ -17,12 +69,23 @@ class TenantManager(models.Manager):
 
 
 class Tenant(models.Model):
+    class ProvisioningStatus(models.TextChoices):
+        PENDING = 'pending', _('Pending')
+        PROVISIONING = 'provisioning', _('Provisioning')
+        READY = 'ready', _('Ready')
+        FAILED = 'failed', _('Failed')
+
     name = models.CharField(_('Name'), max_length=100)
     schema_name = models.CharField(
         _('Schema Name'), max_length=63, unique=True
     )
     domain = models.CharField(_('Domain'), max_length=253, unique=True)
     is_active = models.BooleanField(_('Active'), default=True)
+    provisioning_status = models.CharField(
+        _('Provisioning Status'), max_length=20,
+        choices=ProvisioningStatus.choices, default=ProvisioningStatus.PENDING
+    )
+    provisioning_error = models.TextField(_('Provisioning Error'), blank=True)
     created_at = models.DateTimeField(_('Created At'), auto_now_add=True)
     updated_at = models.DateTimeField(_('Updated At'), auto_now=True)
 
@@ -32,6 +95,24 @@ class Tenant(models.Model):
         verbose_name = _('Tenant')
         verbose_name_plural = _('Tenants')
         ordering = ['name']
+        indexes = [
+            # Backs the (name, id) keyset used to paginate the tenants list
+            models.Index(fields=['name', 'id'], name='tenant_name_id_idx'),
+            # Trigram indexes for TenantQuerySet.search and icontains lookups,
+            # which Django compiles to UPPER(field) LIKE UPPER(...). The opclass
+            # is qualified: the template schema is migrated without public
+            # on the search_path (see tenants.provisioning)
+            GinIndex(OpClass(Upper('name'), name=TRGM_OPCLASS), name='tenant_name_trgm_idx'),
+            GinIndex(
+                OpClass(Upper('schema_name'), name=TRGM_OPCLASS), name='tenant_schema_trgm_idx'
+            ),
+            GinIndex(OpClass(Upper('domain'), name=TRGM_OPCLASS), name='tenant_domain_trgm_idx'),
+        ]
 
     def __str__(self):
         return self.name
+
+    @property
+    def is_ready(self):
+        # Without its schema the tenant's queries would reach public's tables
+        return self.provisioning_status == self.ProvisioningStatus.READY
@@ -0,0 +1,18 @@
+from config.pagination import KeysetPagination
+
+
+class TenantPagination(KeysetPagination):
+    """
+    Keyset pagination for tenants, matching Tenant.Meta.ordering with id as tie-breaker
+    """
+    ordering = ('name', 'id')
+
+
+class TenantSearchPagination(KeysetPagination):
+    """
+    Keyset pagination for search results, best match first (?limit=&cursor=)
+    """
+    ordering = ('-score', 'id')
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = 'limit'
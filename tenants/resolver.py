@@ -0,0 +1,157 @@
+"""
+Host -> Tenant resolution with a two-level cache.
+
+L1 is a small LRU in process memory with a short TTL, so a warm lookup is a
+dict access and no I/O. L2 is the shared Redis cache. Hosts that match no
+active tenant are cached too (negative caching) so unknown or probing hosts
+do not reach the database on every request.
+
+Saves, deletes and deactivations (``TenantQuerySet.update``/``deactivate``)
+drop the affected hosts from both levels. Other processes only see the
+change once their L1 entry expires, which TENANT_LOCAL_CACHE_TIMEOUT bounds.
+
+L2 is an optimisation only: while Redis cannot be reached lookups go from
+L1 to the database.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'tenants:host'
+
+# Stored in L2 for hosts without an active tenant
+_NOT_FOUND = 0
+
+
+class LocalLRUCache:
+    """
+    Thread-safe LRU with a per-entry TTL.
+    """
+
+    def __init__(self, maxsize, timeout):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            value, expires = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.timeout)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_missing = object()
+local_cache = LocalLRUCache(
+    settings.TENANT_LOCAL_CACHE_SIZE, settings.TENANT_LOCAL_CACHE_TIMEOUT
+)
+
+
+def normalize_host(host):
+    """
+    Lower-case ``host`` and strip the port.
+    """
+    host = host.lower()
+    if host.endswith(']'):  # IPv6 literal without port
+        return host
+    return host.rsplit(':', 1)[0] if ':' in host else host
+
+
+def _key(host):
+    return f'{KEY_PREFIX}:{host}'
+
+
+# Backends raise their client's own errors (redis.exceptions.ConnectionError,
+# ...), with no common base class
+def _cache_get(host):
+    try:
+        return cache.get(_key(host))
+    except Exception:
+        logger.warning('Cache unavailable, resolving %s from the database', host, exc_info=True)
+        return None
+
+
+def _cache_set(host, value, timeout):
+    try:
+        cache.set(_key(host), value, timeout)
+    except Exception:
+        logger.warning('Cache unavailable, not caching %s', host, exc_info=True)
+
+
+def resolve_tenant(host):
+    """
+    Return the active Tenant whose domain is ``host``, or None.
+    """
+    host = normalize_host(host)
+    tenant = local_cache.get(host, _missing)
+    if tenant is not _missing:
+        return tenant
+
+    tenant = _cache_get(host)
+    if tenant is None:
+        from .models import Tenant
+        from .schema import activate_public
+        # The tenant registry lives in the public schema, whatever the
+        # connection was left on by the previous request
+        activate_public()
+        tenant = Tenant.objects.all().activos().filter(domain=host).first()
+        if tenant is None:
+            _cache_set(host, _NOT_FOUND, settings.TENANT_NEGATIVE_CACHE_TIMEOUT)
+        else:
+            _cache_set(host, tenant, settings.TENANT_CACHE_TIMEOUT)
+    elif tenant == _NOT_FOUND:
+        tenant = None
+
+    local_cache.set(host, tenant)
+    return tenant
+
+
+def invalidate_tenant_hosts(*hosts):
+    """
+    Forget the cached resolution of ``hosts``, now and again on commit
+    so a concurrent request cannot re-cache the pre-commit row.
+    """
+    hosts = {normalize_host(host) for host in hosts if host}
+    if not hosts:
+        return
+
+    def drop():
+        for host in hosts:
+            local_cache.delete(host)
+        try:
+            cache.delete_many([_key(host) for host in hosts])
+        except Exception:
+            # May run on commit: the write succeeded, the cached resolution
+            # expires with TENANT_CACHE_TIMEOUT
+            logger.error('Could not invalidate the hosts %s', ', '.join(sorted(hosts)), exc_info=True)
+
+    drop()
+    transaction.on_commit(drop)
@@ -0,0 +1,109 @@
+"""
+Per-connection Postgres schema routing for tenants.
+
+The active schema is tracked on the connection wrapper so the ``SET
+search_path`` is skipped when a persistent or pooled connection is already
+on the requested schema. Queries stay unqualified, so managers and querysets are
+unaware of the routing. Other database vendors ignore it.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+# Whether migrate runs against a tenant schema (see TenantMigrationRouter)
+_migrating_tenant = ContextVar('migrating_tenant', default=False)
+
+
+def quote_schema(schema_name):
+    return '"%s"' % schema_name.replace('"', '""')
+
+
+def current_schema(using=DEFAULT_DB_ALIAS):
+    return getattr(connections[using], 'tenant_schema', settings.TENANT_PUBLIC_SCHEMA)
+
+
+def activate_schema(schema_name, using=DEFAULT_DB_ALIAS):
+    """
+    Point the connection's search_path at ``schema_name`` (then public).
+    Returns True when a SET was issued.
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return False
+    schema_name = schema_name or settings.TENANT_PUBLIC_SCHEMA
+    # Connect first: a pooled connection (config.db.postgresql) comes with
+    # the schema it was left on
+    connection.ensure_connection()
+    if current_schema(using) == schema_name:
+        return False
+
+    public = settings.TENANT_PUBLIC_SCHEMA
+    path = quote_schema(public)
+    if schema_name != public:
+        path = f'{quote_schema(schema_name)}, {path}'
+    with connection.cursor() as cursor:
+        cursor.execute(f'SET search_path TO {path}')
+    connection.tenant_schema = schema_name
+    if not connection.get_autocommit():
+        # Undone if the transaction rolls back: config.db.postgresql then
+        # forgets tenant_schema, so the next activation sets it again
+        connection.tenant_schema_uncommitted = True
+    return True
+
+
+def activate_public(using=DEFAULT_DB_ALIAS):
+    return activate_schema(settings.TENANT_PUBLIC_SCHEMA, using)
+
+
+@contextmanager
+def schema_context(schema_name, using=DEFAULT_DB_ALIAS):
+    """
+    Run a block on ``schema_name`` and restore the previous schema afterwards.
+    """
+    previous = current_schema(using)
+    activate_schema(schema_name, using)
+    try:
+        yield
+    finally:
+        activate_schema(previous, using)
+
+
+@receiver(connection_created)
+def reset_schema(sender, connection, **kwargs):
+    # A fresh connection starts on the server's default search_path
+    connection.tenant_schema = settings.TENANT_PUBLIC_SCHEMA
+    connection.tenant_schema_uncommitted = False
+
+
+@contextmanager
+def tenant_migrations():
+    """
+    Limit the migrations run in a block to the tables tenant schemas have.
+    """
+    token = _migrating_tenant.set(True)
+    try:
+        yield
+    finally:
+        _migrating_tenant.reset(token)
+
+
+class TenantMigrationRouter:
+    """
+    Inside ``tenant_migrations()``, apply only the operations on the models
+    of settings.TENANT_APPS that are not TENANT_SHARED_MODELS: the others
+    are recorded as applied without touching the tenant schema, their tables
+    live in public. No opinion otherwise.
+    """
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if not _migrating_tenant.get():
+            return None
+        if app_label not in settings.TENANT_APPS:
+            return False
+        shared = {label.lower() for label in settings.TENANT_SHARED_MODELS}
+        return model_name is None or f'{app_label}.{model_name}' not in shared
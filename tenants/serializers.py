@@ -17,4 +17,29 @@ class TenantSerializer(serializers.ModelSerializer):
             'created_at',
             'updated_at'
         ]
-        read_only_fields = ['id', 'created_at', 'updated_at'] 
\ No newline at end of file
+        read_only_fields = ['id', 'created_at', 'updated_at']
+
+
+class TenantProvisioningSerializer(serializers.ModelSerializer):
+    """
+    Serializer for a tenant's schema provisioning status
+    """
+    class Meta:
+        model = Tenant
+        fields = [
+            'id',
+            'schema_name',
+            'provisioning_status',
+            'provisioning_error'
+        ]
+        read_only_fields = fields
+
+
+class TenantSearchSerializer(TenantSerializer):
+    """
+    Serializer for tenant search results, with their similarity score
+    """
+    score = serializers.FloatField(read_only=True)
+
+    class Meta(TenantSerializer.Meta):
+        fields = TenantSerializer.Meta.fields + ['score']
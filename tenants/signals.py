@@ -0,0 +1,20 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import Tenant
+from .resolver import invalidate_tenant_hosts
+
+
+@receiver(pre_save, sender=Tenant)
+def remember_previous_domain(sender, instance, **kwargs):
+    instance._previous_domain = None
+    if instance.pk:
+        instance._previous_domain = (
+            Tenant.objects.filter(pk=instance.pk).values_list('domain', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Tenant)
+@receiver(post_delete, sender=Tenant)
+def tenant_changed(sender, instance, **kwargs):
+    invalidate_tenant_hosts(instance.domain, getattr(instance, '_previous_domain', None))
@@ -31,4 +31,11 @@ class TenantAdminTest(TestCase):
         url = reverse('admin:tenants_tenant_add')
         response = self.client.get(url)
         self.assertEqual(response.status_code, 200)
-        self.assertContains(response, 'Tenant') 
\ No newline at end of file
+        self.assertContains(response, 'Tenant') 
+    def test_tenant_admin_search(self):
+        TenantFactory(name='Initech', schema_name='initech', domain='initech.example.com')
+        url = reverse('admin:tenants_tenant_changelist')
+        response = self.client.get(url, {'q': 'initech'})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Initech')
+        self.assertEqual(response.context['cl'].result_count, 1)
@@ -0,0 +1,86 @@
+import base64
+
+from asgiref.sync import sync_to_async
+from django.test import TestCase
+from django.contrib.auth.models import User
+from .models import Tenant
+
+
+class AsyncTenantsAPIViewTest(TestCase):
+    async def test_list_tenants(self):
+        await Tenant.objects.acreate(name='Bravo', schema_name='bravo', domain='bravo.example.com')
+        await Tenant.objects.acreate(name='Alpha', schema_name='alpha', domain='alpha.example.com')
+        response = await self.async_client.get('/api/tenants/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([t['name'] for t in response.json()], ['Alpha', 'Bravo'])
+
+    async def test_create_tenant(self):
+        data = {'name': 'Acme', 'schema_name': 'acme', 'domain': 'acme.example.com'}
+        response = await self.async_client.post('/api/tenants/', data, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(await Tenant.objects.filter(schema_name='acme').aexists())
+
+        response = await self.async_client.post('/api/tenants/', data, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('schema_name', response.json())
+
+    async def test_nisman(self):
+        response = await self.async_client.post(
+            '/api/tenants/nisman/', {'username': 'acme'}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(await Tenant.objects.filter(domain='acme.example.com').aexists())
+
+
+class AsyncTenantDetailAPIViewTest(TestCase):
+    def setUp(self):
+        User.objects.create_user('ana', password='secret')
+        self.tenant = Tenant.objects.create(name='Acme', schema_name='acme', domain='acme.example.com')
+        self.url = f'/api/tenants/{self.tenant.id}/'
+
+    def basic(self, username, password):
+        credentials = base64.b64encode(f'{username}:{password}'.encode()).decode()
+        return {'Authorization': f'Basic {credentials}'}
+
+    async def test_basic_authentication(self):
+        """Test that the async view accepts HTTP Basic credentials like the sync one"""
+        response = await self.async_client.get(self.url, headers=self.basic('ana', 'secret'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['name'], 'Acme')
+
+        response = await self.async_client.get(self.url, headers=self.basic('ana', 'wrong'))
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.json()['detail'], 'Invalid username/password.')
+
+    async def test_session_authentication(self):
+        await sync_to_async(self.client.login)(username='ana', password='secret')
+        self.async_client.cookies = self.client.cookies
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+
+    async def test_anonymous(self):
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response.status_code, 403)
+
+
+class AsyncTenantSearchAPIViewTest(TestCase):
+    def setUp(self):
+        User.objects.create_user('ana', password='secret', is_staff=True)
+        User.objects.create_user('bob', password='secret')
+        Tenant.objects.create(name='Acme', schema_name='acme', domain='acme.example.com')
+        self.url = '/api/tenants/search/?q=acme'
+
+    def basic(self, username, password):
+        credentials = base64.b64encode(f'{username}:{password}'.encode()).decode()
+        return {'Authorization': f'Basic {credentials}'}
+
+    async def test_basic_authentication(self):
+        """Test that the async view authenticates staff like the sync one"""
+        for username, password, expected in (('ana', 'secret', 200), ('bob', 'secret', 403),
+                                             ('ana', 'wrong', 403), (None, None, 403)):
+            headers = self.basic(username, password) if username else {}
+            sync_response = await sync_to_async(self.client.get)(self.url, headers=headers)
+            response = await self.async_client.get(self.url, headers=headers)
+            self.assertEqual(response.status_code, expected, username)
+            self.assertEqual(response.status_code, sync_response.status_code, username)
+            self.assertEqual(response.json(), sync_response.json(), username)
@@ -0,0 +1,60 @@
+import json
+from io import StringIO
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from config.imports import run_import
+from .factories import TenantFactory
+from .imports import DOMAIN_TAKEN, TenantImport
+from .models import Tenant
+from .resolver import local_cache, resolve_tenant
+
+
+@override_settings(TENANT_PROVISIONING_ASYNC=False)
+class TenantImportTest(TestCase):
+    def setUp(self):
+        local_cache.clear()
+        self.addCleanup(local_cache.clear)
+        self.addCleanup(cache.clear)
+
+    def run_import(self, text):
+        report = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            result = run_import(TenantImport(), StringIO(text), 'csv', report)
+        return result, [json.loads(line) for line in report.getvalue().splitlines()]
+
+    def test_creates_and_updates(self):
+        """Test that tenants are merged on schema_name and new ones provisioned"""
+        existing = TenantFactory(name='Acme', schema_name='acme', domain='acme.example.com')
+        self.assertEqual(resolve_tenant('acme.example.com'), existing)
+        result, report = self.run_import(
+            'name,schema_name,domain,is_active\n'
+            'Acme Corp,acme,acme.example.org,false\n'
+            'Globex,globex,globex.example.com,\n'
+        )
+        self.assertEqual((result.created, result.updated, result.rejected), (1, 1, 0))
+
+        existing.refresh_from_db()
+        self.assertEqual((existing.name, existing.domain, existing.is_active), ('Acme Corp', 'acme.example.org', False))
+        self.assertGreater(existing.updated_at, existing.created_at)
+        # The old domain no longer resolves from the cache
+        self.assertIsNone(resolve_tenant('acme.example.com'))
+
+        globex = Tenant.objects.get(schema_name='globex')
+        self.assertTrue(globex.is_active)
+        self.assertEqual(globex.provisioning_status, Tenant.ProvisioningStatus.READY)
+
+    def test_unique_domains(self):
+        """Test that a domain owned by another tenant is rejected"""
+        TenantFactory(schema_name='acme', domain='acme.example.com')
+        result, report = self.run_import(
+            'name,schema_name,domain\n'
+            'Copy,copy,acme.example.com\n'
+            'Globex,globex,globex.example.com\n'
+            'Globex 2,globex2,globex.example.com\n'
+            f'Long,{"x" * 64},long.example.com\n'
+        )
+        self.assertEqual((result.created, result.rejected), (1, 3))
+        errors = {entry['line']: entry['errors'] for entry in report}
+        self.assertEqual(errors[2], {'domain': [DOMAIN_TAKEN]})
+        self.assertEqual(errors[4], {'domain': [DOMAIN_TAKEN]})
+        self.assertEqual(Tenant.objects.count(), 2)
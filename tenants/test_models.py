@@ -1,3 +1,5 @@
+from unittest import skipUnless
+from django.db import connection
 from django.test import TestCase
 from django.core.exceptions import ValidationError
 from .models import Tenant
@@ -34,4 +36,28 @@ class TenantModelTest(TestCase):
         """Test that schema_name cannot exceed 63 characters"""
         tenant = TenantFactory.build(schema_name='a' * 64)
         with self.assertRaises(ValidationError):
-            tenant.full_clean() 
\ No newline at end of file
+            tenant.full_clean() 
+
+class TenantSearchTest(TestCase):
+    def setUp(self):
+        self.acme = TenantFactory(name='Acme Corporation', schema_name='acme', domain='acme.example.com')
+        self.globex = TenantFactory(name='Globex', schema_name='globex', domain='globex.example.com')
+
+    def test_search_matches_any_field(self):
+        """Test that search matches name, schema_name and domain"""
+        self.assertEqual(list(Tenant.objects.all().search('corpor')), [self.acme])
+        self.assertEqual(list(Tenant.objects.all().search('GLOBEX.example')), [self.globex])
+        self.assertEqual(Tenant.objects.all().search('initech').count(), 0)
+
+    def test_search_annotates_score(self):
+        """Test that every result carries a score between 0 and 1"""
+        for tenant in Tenant.objects.all().search('example'):
+            self.assertTrue(0 <= tenant.score <= 1)
+
+    @skipUnless(connection.vendor == 'postgresql', 'trigram similarity is Postgres only')
+    def test_search_ranks_by_similarity(self):
+        """Test that typos still match and closer names rank first"""
+        TenantFactory(name='Acme', schema_name='acme_2', domain='acme2.example.com')
+        results = list(Tenant.objects.all().search('acmee').order_by('-score', 'id'))
+        self.assertEqual(results[0].name, 'Acme')
+        self.assertIn(self.acme, results)
@@ -0,0 +1,125 @@
+from datetime import timedelta
+from unittest import mock, skipUnless
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+from .models import Tenant
+from .provisioning import clone_template_schema, provision_pending_tenants, provision_tenant, tenant_tables
+from .factories import TenantFactory
+
+
+@override_settings(TENANT_PROVISIONING_ASYNC=False)
+class TenantProvisioningAPITest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_create_returns_pending_status(self):
+        """Test that creating a tenant answers before its schema exists"""
+        data = {'name': 'Acme', 'schema_name': 'acme', 'domain': 'acme.example.com'}
+        with self.captureOnCommitCallbacks():
+            response = self.client.post(reverse('tenants:user-list'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['provisioning_status'], 'pending')
+        self.assertEqual(
+            Tenant.objects.get(schema_name='acme').provisioning_status, 'pending'
+        )
+
+    def test_poll_status(self):
+        """Test that the provisioning status can be polled"""
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('tenants:nisman'), {'username': 'acme'}, format='json'
+            )
+        url = reverse('tenants:tenant-provisioning', args=[response.data['tenant_id']])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['provisioning_status'], 'ready')
+
+
+class TenantTablesTest(TestCase):
+    def test_shared_tables_left_out(self):
+        """Test that tenant schemas get the app tables but not the shared ones"""
+        tables = tenant_tables()
+        self.assertTrue({'auth_user', 'auth_user_groups', 'cdt_preferencias'} <= tables)
+        self.assertFalse(
+            {'tenants_tenant', 'django_session', 'django_content_type', 'auth_permission'} & tables
+        )
+
+    @override_settings(TENANT_PROVISIONING_ASYNC=False)
+    def test_provision_pending_tenants(self):
+        pending = TenantFactory(provisioning_status=Tenant.ProvisioningStatus.PENDING)
+        failed = TenantFactory(provisioning_status=Tenant.ProvisioningStatus.FAILED)
+        self.assertEqual(provision_pending_tenants(), 1)
+        pending.refresh_from_db()
+        failed.refresh_from_db()
+        self.assertEqual(pending.provisioning_status, Tenant.ProvisioningStatus.READY)
+        self.assertEqual(failed.provisioning_status, Tenant.ProvisioningStatus.FAILED)
+
+    @override_settings(TENANT_PROVISIONING_ASYNC=False, TENANT_PROVISIONING_TIMEOUT=60)
+    def test_provision_stuck_and_failed_tenants(self):
+        """Test that tenants whose job died or failed are provisioned again"""
+        Status = Tenant.ProvisioningStatus
+        stuck = TenantFactory(provisioning_status=Status.PROVISIONING)
+        running = TenantFactory(provisioning_status=Status.PROVISIONING)
+        failed = TenantFactory(provisioning_status=Status.FAILED)
+        Tenant.objects.filter(pk=stuck.pk).update(updated_at=timezone.now() - timedelta(seconds=61))
+        self.assertEqual(provision_pending_tenants(), 1)
+        self.assertEqual(provision_pending_tenants(retry_failed=True), 1)
+        statuses = dict(Tenant.objects.values_list('pk', 'provisioning_status'))
+        self.assertEqual(
+            [statuses[tenant.pk] for tenant in (stuck, running, failed)],
+            [Status.READY, Status.PROVISIONING, Status.READY],
+        )
+
+
+@skipUnless(connection.vendor == 'postgresql', 'schema cloning is Postgres only')
+@override_settings(TENANT_TEMPLATE_SCHEMA='test_template')
+class CloneTemplateSchemaTest(TestCase):
+    def setUp(self):
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE SCHEMA test_template')
+            cursor.execute(
+                'CREATE TABLE test_template.parent '
+                '(id bigint GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY, name varchar(10))'
+            )
+            cursor.execute(
+                'CREATE TABLE test_template.child '
+                '(id bigint GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY, '
+                'parent_id bigint REFERENCES test_template.parent (id))'
+            )
+            cursor.execute("INSERT INTO test_template.parent (name) VALUES ('seed')")
+            # Shared: only public's copy is used
+            cursor.execute('CREATE TABLE public.test_shared (id bigint PRIMARY KEY)')
+            cursor.execute('CREATE TABLE test_template.test_shared (id bigint PRIMARY KEY)')
+            cursor.execute(
+                'ALTER TABLE test_template.child ADD COLUMN shared_id bigint '
+                'REFERENCES test_template.test_shared (id)'
+            )
+        patcher = mock.patch('tenants.provisioning.tenant_tables', return_value={'parent', 'child'})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_clone_copies_tables_rows_and_foreign_keys(self):
+        clone_template_schema('acme')
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT name FROM acme.parent')
+            self.assertEqual(cursor.fetchall(), [('seed',)])
+            cursor.execute("INSERT INTO acme.parent (name) VALUES ('new') RETURNING id")
+            self.assertEqual(cursor.fetchone()[0], 2)
+            cursor.execute(
+                "SELECT confrelid::regclass::text FROM pg_constraint "
+                "WHERE conrelid = 'acme.child'::regclass AND contype = 'f' ORDER BY 1"
+            )
+            self.assertEqual([row[0] for row in cursor.fetchall()], ['acme.parent', 'test_shared'])
+            cursor.execute("SELECT to_regclass('acme.test_shared')")
+            self.assertIsNone(cursor.fetchone()[0])
+
+    def test_provision_failure_is_recorded(self):
+        tenant = TenantFactory(schema_name='acme')
+        clone_template_schema('acme')
+        self.assertEqual(provision_tenant(tenant.pk), Tenant.ProvisioningStatus.FAILED)
+        tenant.refresh_from_db()
+        self.assertIn('already exists', tenant.provisioning_error)
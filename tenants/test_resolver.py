@@ -0,0 +1,97 @@
+import json
+from unittest import mock
+
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from config.middlewares import TenantMiddleware
+from .factories import TenantFactory
+from .models import Tenant
+from .resolver import local_cache, resolve_tenant
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+})
+class TenantResolverTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        self.tenant = TenantFactory(domain='acme.example.com')
+
+    def test_warm_lookup_runs_no_queries(self):
+        """Test that a resolved host is served from the local cache"""
+        self.assertEqual(resolve_tenant('acme.example.com:8000'), self.tenant)
+        with self.assertNumQueries(0):
+            self.assertEqual(resolve_tenant('ACME.example.com'), self.tenant)
+
+    def test_shared_cache_lookup_runs_no_queries(self):
+        """Test that a cold local cache falls back to the shared cache"""
+        resolve_tenant('acme.example.com')
+        local_cache.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(resolve_tenant('acme.example.com'), self.tenant)
+
+    def test_unknown_host_is_negatively_cached(self):
+        """Test that unknown hosts are cached as misses"""
+        self.assertIsNone(resolve_tenant('unknown.example.com'))
+        local_cache.clear()
+        with self.assertNumQueries(0):
+            self.assertIsNone(resolve_tenant('unknown.example.com'))
+
+    def test_new_tenant_clears_negative_entry(self):
+        """Test that creating a tenant replaces the cached miss"""
+        self.assertIsNone(resolve_tenant('new.example.com'))
+        with self.captureOnCommitCallbacks(execute=True):
+            tenant = TenantFactory(domain='new.example.com')
+        self.assertEqual(resolve_tenant('new.example.com'), tenant)
+
+    def test_deactivate_invalidates(self):
+        """Test that deactivated tenants stop resolving"""
+        resolve_tenant('acme.example.com')
+        with self.captureOnCommitCallbacks(execute=True):
+            Tenant.objects.filter(pk=self.tenant.pk).deactivate()
+        self.assertIsNone(resolve_tenant('acme.example.com'))
+
+    def test_domain_change_invalidates_old_host(self):
+        """Test that the previous domain stops resolving after a change"""
+        resolve_tenant('acme.example.com')
+        self.tenant.domain = 'acme.example.org'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tenant.save()
+        self.assertIsNone(resolve_tenant('acme.example.com'))
+        self.assertEqual(resolve_tenant('acme.example.org'), self.tenant)
+
+    def test_cache_unavailable(self):
+        """Test that hosts resolve from the database while the shared cache is down"""
+        down = mock.Mock(**{
+            f'{method}.side_effect': ConnectionError for method in ('get', 'set', 'delete_many')
+        })
+        with mock.patch('tenants.resolver.cache', down), self.assertLogs('tenants.resolver', 'WARNING'):
+            self.assertEqual(resolve_tenant('acme.example.com'), self.tenant)
+            self.assertIsNone(resolve_tenant('unknown.example.com'))
+            self.tenant.domain = 'acme.example.org'
+            with self.captureOnCommitCallbacks(execute=True):
+                self.tenant.save()
+            self.assertIsNone(resolve_tenant('acme.example.com'))
+            self.assertEqual(resolve_tenant('acme.example.org'), self.tenant)
+
+    @override_settings(ALLOWED_HOSTS=['.example.com'])
+    def test_middleware_sets_request_tenant(self):
+        """Test that the middleware exposes the tenant on the request"""
+        middleware = TenantMiddleware(lambda request: HttpResponse())
+        request = RequestFactory().get('/', HTTP_HOST='acme.example.com')
+        middleware(request)
+        self.assertEqual(request.tenant, self.tenant)
+
+    @override_settings(ALLOWED_HOSTS=['.example.com'])
+    def test_middleware_rejects_tenants_not_ready(self):
+        """Test that a tenant without its schema gets a 503, not public's tables"""
+        middleware = TenantMiddleware(lambda request: HttpResponse())
+        for provisioning_status in ('pending', 'provisioning', 'failed'):
+            with self.captureOnCommitCallbacks(execute=True):
+                Tenant.objects.filter(pk=self.tenant.pk).update(provisioning_status=provisioning_status)
+            response = middleware(RequestFactory().get('/', HTTP_HOST='acme.example.com'))
+            self.assertEqual(response.status_code, 503, provisioning_status)
+            self.assertEqual(response['Retry-After'], '5')
+            self.assertEqual(json.loads(response.content)['type'], 'TenantNotReadyException')
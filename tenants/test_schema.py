@@ -0,0 +1,88 @@
+from unittest import skipUnless
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from config.middlewares import DEFERRED_TO_THREAD_MIDDLEWARE, ReplicaMiddleware, TenantSchemaMiddleware
+from .factories import TenantFactory
+from .schema import TenantMigrationRouter, activate_schema, current_schema, schema_context, tenant_migrations
+
+
+@skipUnless(connection.vendor == 'postgresql', 'search_path routing is Postgres only')
+class SchemaRoutingTest(TestCase):
+    def tearDown(self):
+        activate_schema('public')
+
+    def _search_path(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SHOW search_path')
+            return cursor.fetchone()[0]
+
+    def test_activate_schema_sets_search_path(self):
+        """Test that the search_path follows the active schema"""
+        self.assertTrue(activate_schema('acme'))
+        self.assertEqual(self._search_path(), 'acme, public')
+        self.assertEqual(current_schema(), 'acme')
+
+    def test_activate_same_schema_skips_set(self):
+        """Test that re-activating the current schema issues no query"""
+        activate_schema('acme')
+        with self.assertNumQueries(0):
+            self.assertFalse(activate_schema('acme'))
+
+    def test_schema_context_restores_previous(self):
+        """Test that schema_context puts the previous schema back"""
+        activate_schema('acme')
+        with schema_context('globex'):
+            self.assertEqual(current_schema(), 'globex')
+        self.assertEqual(current_schema(), 'acme')
+
+    def test_middleware_routes_tenant_requests(self):
+        """Test that the middleware activates the request tenant's schema"""
+        middleware = TenantSchemaMiddleware(lambda request: HttpResponse())
+        request = RequestFactory().get('/')
+        request.tenant = TenantFactory(schema_name='acme')
+        middleware(request)
+        self.assertEqual(current_schema(), 'acme')
+
+        request.tenant = None
+        middleware(request)
+        self.assertEqual(current_schema(), 'public')
+
+    def test_rolled_back_set_is_forgotten(self):
+        """Test that a search_path SET inside a rolled back transaction is set again"""
+        activate_schema('public')
+        with transaction.atomic():
+            sid = transaction.savepoint()
+            activate_schema('acme')
+            transaction.savepoint_rollback(sid)
+            self.assertTrue(activate_schema('acme'))
+            self.assertEqual(self._search_path(), 'acme, public')
+
+
+class DeferredToThreadOrderTest(SimpleTestCase):
+    def test_middleware_requires_deferred_work_runner(self):
+        """Test that middlewares deferring database work refuse to start without the middleware running it"""
+        others = [path for path in settings.MIDDLEWARE if path != DEFERRED_TO_THREAD_MIDDLEWARE]
+        for middleware in (others, [DEFERRED_TO_THREAD_MIDDLEWARE, *others]):
+            with override_settings(MIDDLEWARE=middleware):
+                for middleware_class in (TenantSchemaMiddleware, ReplicaMiddleware):
+                    with self.assertRaises(ImproperlyConfigured):
+                        middleware_class(lambda request: HttpResponse())
+        TenantSchemaMiddleware(lambda request: HttpResponse())
+
+
+@override_settings(TENANT_APPS=['auth', 'cdt'], TENANT_SHARED_MODELS=['auth.Permission'])
+class TenantMigrationRouterTest(SimpleTestCase):
+    def test_tenant_migrations_skip_shared_tables(self):
+        """Test that tenant schemas only get the migrations of their own tables"""
+        router = TenantMigrationRouter()
+        self.assertIsNone(router.allow_migrate('default', 'tenants', 'tenant'))
+        with tenant_migrations():
+            self.assertTrue(router.allow_migrate('default', 'cdt', 'preferencias'))
+            self.assertTrue(router.allow_migrate('default', 'cdt'))
+            self.assertFalse(router.allow_migrate('default', 'auth', 'permission'))
+            self.assertFalse(router.allow_migrate('default', 'tenants', 'tenant'))
+            self.assertFalse(router.allow_migrate('default', 'sessions'))
+        self.assertIsNone(router.allow_migrate('default', 'cdt', 'preferencias'))
@@ -1,9 +1,45 @@
+import json
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient
 from django.contrib.auth.models import User
 from cdt.factories import UserFactory, PreferenciasFactory
+from .factories import TenantFactory
+from .models import Tenant
+
+
+class TenantsAPIViewTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.url = reverse('tenants:user-list')
+
+    def test_list_tenants_paginated(self):
+        """Test that tenants are paginated on (name, id)"""
+        for name in ['Delta', 'Alpha', 'Charlie', 'Bravo', 'Alpha']:
+            TenantFactory(name=name)
+        response = self.client.get(self.url, {'page_size': 3})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [t['name'] for t in response.data], ['Alpha', 'Alpha', 'Bravo']
+        )
+        next_url = response['Link'].split(';')[0].strip('<>')
+        response = self.client.get(next_url)
+        self.assertEqual([t['name'] for t in response.data], ['Charlie', 'Delta'])
+        self.assertNotIn('rel="next"', response['Link'])
+
+    def test_list_tenants_ndjson_stream(self):
+        """Test that tenants can be streamed as NDJSON"""
+        for name in ['Bravo', 'Alpha']:
+            TenantFactory(name=name)
+        response = self.client.get(self.url, HTTP_ACCEPT='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(
+            [json.loads(line)['name'] for line in lines], ['Alpha', 'Bravo']
+        )
 
 
 class UserAPIViewTest(TestCase):
@@ -127,4 +163,69 @@ class PreferenciasDetailAPIViewTest(TestCase):
             response.data['tema_oscuro'], 
             str(True)
         )
-        self.assertEqual(response.data['idioma'], 'en') 
\ No newline at end of file
+        self.assertEqual(response.data['idioma'], 'en') 
+
+class TenantSearchAPIViewTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=UserFactory(is_staff=True))
+        self.url = reverse('tenants:tenant-search')
+        for n in range(5):
+            TenantFactory(name=f'Acme {n}', schema_name=f'acme_{n}', domain=f'acme{n}.example.com')
+        TenantFactory(name='Globex', schema_name='globex', domain='globex.example.com')
+
+    def test_search_paginated(self):
+        """Test that results come with a score and a cursor to the next page"""
+        response = self.client.get(self.url, {'q': 'acme', 'limit': 3})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 3)
+        self.assertIn('score', response.data[0])
+
+        next_url = response['Link'].split(';')[0].strip('<>')
+        response = self.client.get(next_url)
+        self.assertEqual(len(response.data), 2)
+        self.assertNotIn('rel="next"', response.get('Link', ''))
+
+    def test_search_requires_term(self):
+        """Test that an empty search term is rejected"""
+        response = self.client.get(self.url, {'q': ' '})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_search_requires_staff(self):
+        """Test that only staff can search tenants"""
+        self.client.force_authenticate(user=UserFactory())
+        response = self.client.get(self.url, {'q': 'acme'})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class TenantDetailAPIViewTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=UserFactory(is_staff=True))
+        self.tenant = TenantFactory()
+        self.url = reverse('tenants:tenant-detail', args=[self.tenant.id])
+
+    def test_not_modified(self):
+        """Test that unchanged tenants get a 304 from an updated_at-only query"""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['name'], self.tenant.name)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        query, = [query['sql'] for query in queries.captured_queries]
+        self.assertIn('SELECT "tenants_tenant"."updated_at" FROM', query)
+
+    def test_modified_by_queryset_update(self):
+        """Test that bulk updates move updated_at and so the validators"""
+        etag = self.client.get(self.url)['ETag']
+        Tenant.objects.filter(pk=self.tenant.pk).deactivate()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.data['is_active'])
+
+    def test_missing_tenant(self):
+        """Test that an unknown tenant is a 404"""
+        response = self.client.get(reverse('tenants:tenant-detail', args=[0]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
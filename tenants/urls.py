@@ -1,15 +1,33 @@
 from django.urls import path
 from .views import (
     TenantsAPIView,
+    TenantSearchAPIView,
+    TenantDetailAPIView,
+    TenantProvisioningAPIView,
     NismanAPIView
 )
+from .imports import TenantImport
+from config.imports import ImportAPIView
+from config.query_budget import query_budget
+from config.replicas import replica_reads
 
 app_name = 'tenants'
 
 urlpatterns = [
     # Tenants endpoint
-    path('tenants/', TenantsAPIView.as_view(), name='user-list'),
+    path('tenants/', query_budget(1, post=3)(replica_reads(TenantsAPIView.as_view())), name='user-list'),
+    path('tenants/search/', query_budget(3)(TenantSearchAPIView.as_view()), name='tenant-search'),
+    # File imports: the budget covers the session and user lookups and handing
+    # a large file to the background job; files imported inline run queries
+    # growing with them and are exempt (see config.imports)
+    path('tenants/import/', query_budget(post=2)(ImportAPIView.as_view(spec_class=TenantImport)), name='tenant-import'),
+    path('tenants/<int:tenant_id>/', query_budget(4, put=6)(TenantDetailAPIView.as_view()), name='tenant-detail'),
+    path(
+        'tenants/<int:tenant_id>/provisioning/',
+        query_budget(1)(TenantProvisioningAPIView.as_view()),
+        name='tenant-provisioning'
+    ),
     
     # Nisman endpoint
-    path('tenants/nisman/', NismanAPIView.as_view(), name='nisman'),
+    path('tenants/nisman/', query_budget(post=4)(NismanAPIView.as_view()), name='nisman'),
 ] 
\ No newline at end of file
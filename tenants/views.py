@@ -1,10 +1,17 @@
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 from rest_framework.views import APIView
 from rest_framework import permissions, status
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.response import Response
 from .models import Tenant
-from .serializers import TenantSerializer
-from .exceptions import InvalidUsernameException, UserAlreadyExistsException
+from .serializers import TenantSerializer, TenantProvisioningSerializer, TenantSearchSerializer
+from .provisioning import schedule_provisioning
+from .pagination import TenantPagination, TenantSearchPagination
+from config.conditional import not_modified, set_validators, timestamp_validators
+from config.renderers import FastJSONRenderer, NDJSONRenderer, ndjson_response
+from config.serialization import ValuesSerializer
+from .exceptions import InvalidSearchException, InvalidUsernameException, UserAlreadyExistsException
 
 
 class TenantsAPIView(APIView):
@@ -12,30 +19,61 @@ class TenantsAPIView(APIView):
     API endpoint for tenants operations
     """
     permission_classes = [permissions.AllowAny]
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer, NDJSONRenderer]
 
     def get(self, request):
         """
         GET /api/tenants/
-        List all tenants
+        List tenants, one page at a time (?cursor=&page_size=)
+        With Accept: application/x-ndjson, stream every tenant instead
         """
-        tenants = Tenant.objects.all()
-        serializer = TenantSerializer(tenants, many=True)
-        return Response(serializer.data)
+        if isinstance(request.accepted_renderer, NDJSONRenderer):
+            return ndjson_response(Tenant.objects.order_by('name', 'id'), TenantSerializer)
+
+        paginator = TenantPagination()
+        fast = ValuesSerializer(TenantSerializer())
+        queryset = fast.values(Tenant.objects.all(), *paginator.ordering)
+        tenants = paginator.paginate_queryset(queryset, request, view=self)
+        return paginator.get_paginated_response(fast.to_representation(tenants))
 
     def post(self, request):
         """
         POST /api/tenants/
-        Create a new tenant
+        Create a new tenant; its schema is provisioned in the background,
+        poll GET /api/tenants/{tenant_id}/provisioning/ for the outcome
         """
         serializer = TenantSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         tenant = serializer.save()
+        schedule_provisioning(tenant)
         return Response(
-            TenantSerializer(tenant).data,
+            {**TenantSerializer(tenant).data, 'provisioning_status': tenant.provisioning_status},
             status=status.HTTP_201_CREATED
         )
 
 
+class TenantSearchAPIView(APIView):
+    """
+    API endpoint for support staff to find tenants
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        """
+        GET /api/tenants/search/?q=
+        Tenants whose name, schema or domain resemble q, best match first,
+        one page at a time (?limit=&cursor=)
+        """
+        term = request.query_params.get('q', '').strip()
+        if not term:
+            raise InvalidSearchException()
+
+        paginator = TenantSearchPagination()
+        tenants = paginator.paginate_queryset(Tenant.objects.all().search(term), request, view=self)
+        serializer = TenantSearchSerializer(tenants, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+
 class TenantDetailAPIView(APIView):
     """
     API endpoint for specific tenant operations
@@ -46,10 +84,17 @@ class TenantDetailAPIView(APIView):
         """
         GET /api/tenants/{tenant_id}/
         Get specific tenant details
+        Conditional on If-None-Match / If-Modified-Since against updated_at
         """
-        tenant = get_object_or_404(Tenant, id=tenant_id)
-        serializer = TenantSerializer(tenant)
-        return Response(serializer.data)
+        updated_at = Tenant.objects.filter(id=tenant_id).values_list('updated_at', flat=True).first()
+        if updated_at is None:
+            raise Http404('No Tenant matches the given query.')
+        validators = timestamp_validators(updated_at)
+        response = not_modified(request, *validators)
+        if response is None:
+            tenant = get_object_or_404(Tenant, id=tenant_id)
+            response = Response(TenantSerializer(tenant).data)
+        return set_validators(response, *validators)
 
     def put(self, request, tenant_id):
         """
@@ -69,6 +114,21 @@ class TenantDetailAPIView(APIView):
         return Response(TenantSerializer(tenant).data)
 
 
+class TenantProvisioningAPIView(APIView):
+    """
+    API endpoint for a tenant's provisioning status
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, tenant_id):
+        """
+        GET /api/tenants/{tenant_id}/provisioning/
+        Poll the schema provisioning status of a tenant
+        """
+        tenant = get_object_or_404(Tenant, id=tenant_id)
+        return Response(TenantProvisioningSerializer(tenant).data)
+
+
 class NismanAPIView(APIView):
     """
     API endpoint for /tenants/nisman POST
@@ -96,9 +156,14 @@ class NismanAPIView(APIView):
         }
         serializer = TenantSerializer(data=data)
         serializer.is_valid(raise_exception=True)
-        serializer.save()
-        
+        tenant = serializer.save()
+        schedule_provisioning(tenant)
+
         return Response(
-            {'message': f'Tenant "{username}" created successfully'}, 
+            {
+                'message': f'Tenant "{username}" created successfully',
+                'tenant_id': tenant.id,
+                'provisioning_status': tenant.provisioning_status,
+            },
             status=status.HTTP_201_CREATED
         )